@@ -0,0 +1,91 @@
+import sys
+import time
+from pathlib import Path
+
+from lxml import html as lxml_html
+
+project_root = Path(__file__).resolve().parents[1]
+
+
+# Times the one-pass page parser against the previous lxml scrapers, which
+# parsed each page twice and located each table with its own lookup. Runs
+# over n synthetic impact pages from synthetic.py (1000 by default), or over
+# a directory of saved pages such as data/ics_pages. run_benchmarks.py
+# imports the two-pass scrapers as its reference for page parsing.
+#
+#   python benchmarks/bench_page_parsing.py [n | page_dir] [repeats]
+
+
+def element_text(element):
+    # Selenium's .text, which the old scrapers returned: whitespace collapsed
+    # within each line, blank lines dropped
+    lines = (" ".join(line.split()) for line in element.text_content().splitlines())
+    return "\n".join(line for line in lines if line)
+
+
+def two_pass_secondary(page_html):
+    try:
+        tree = lxml_html.fromstring(page_html)
+        element = tree.find_class("impact-metadata")[1]
+        dt_texts = [element_text(dt) for dt in element.iter("dt")]
+        dd_texts = [element_text(dd) for dd in element.iter("dd")]
+        return dict(zip(dt_texts, dd_texts))
+    except Exception:
+        return "None"
+
+
+def two_pass_grant(page_html):
+    try:
+        tree = lxml_html.fromstring(page_html)
+        table = tree.xpath("//h4[text()='Grant funding']/following-sibling::table")[0]
+        return "\n".join(
+            " ".join(element_text(cell) for cell in row.xpath("./th|./td"))
+            for row in table.iter("tr")
+        )
+    except Exception:
+        return "None"
+
+
+def time_parser(parse, pages, repeats):
+    best = float('inf')
+    for _ in range(repeats):
+        start = time.perf_counter()
+        for page_html in pages:
+            parse(page_html)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+if __name__ == "__main__":
+    sys.path.insert(0, str(project_root / 'src' / 'data_collection'))
+    sys.path.insert(0, str(Path(__file__).resolve().parent))
+    from page_parsing import parse_impact_page
+
+    source = sys.argv[1] if len(sys.argv) > 1 else '1000'
+    repeats = int(sys.argv[2]) if len(sys.argv) > 2 else 3
+    if source.isdigit():
+        from synthetic import page_dir
+
+        pages_path = page_dir(project_root / 'data' / 'benchmarks' / 'fixtures', int(source))
+    else:
+        pages_path = Path(source)
+
+    pages = [p.read_text(encoding='utf-8') for p in sorted(pages_path.glob('*.html'))]
+    if not pages:
+        sys.exit(f"No saved pages in {pages_path}")
+
+    # The one-pass parser must agree with the old scrapers on every page
+    mismatches = 0
+    for page_html in pages:
+        parsed = parse_impact_page(page_html)
+        if (parsed['aux'] != two_pass_secondary(page_html)
+                or parsed['grant'] != two_pass_grant(page_html)):
+            mismatches += 1
+
+    two_pass = time_parser(lambda h: (two_pass_secondary(h), two_pass_grant(h)), pages, repeats)
+    one_pass = time_parser(parse_impact_page, pages, repeats)
+    print(f"{len(pages)} pages, best of {repeats}")
+    print(f"two-pass: {two_pass:.3f}s ({len(pages) / two_pass:.0f} pages/s)")
+    print(f"one-pass: {one_pass:.3f}s ({len(pages) / one_pass:.0f} pages/s), "
+          f"{two_pass / one_pass:.2f}x")
+    print(f"pages with different output: {mismatches}")
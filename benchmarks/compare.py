@@ -0,0 +1,53 @@
+import json
+import sys
+
+
+# Compares two result files of run_benchmarks.py: throughput of every stage,
+# peak memory, and whether the outputs' fingerprints still match. A stage
+# the earlier run does not have, such as one added after the baseline, is
+# compared with the stage of that run which does the same work, if any.
+#
+#   python benchmarks/compare.py benchmarks/results/<before>.json benchmarks/results/<after>.json
+
+
+def load(path):
+    with open(path, 'r') as f:
+        run = json.load(f)
+    return run, {(r['benchmark'], r['size']): r for r in run['results']}
+
+
+def mib(value):
+    # Memory is None where RSS could not be read
+    return "n/a" if value is None else f"{value:.0f} MiB"
+
+
+if __name__ == "__main__":
+    before_run, before = load(sys.argv[1])
+    after_run, after = load(sys.argv[2])
+    print(f"{before_run['environment']['commit']} -> {after_run['environment']['commit']}")
+    changed_outputs = []
+    for case in sorted(before.keys() & after.keys()):
+        b, a = before[case], after[case]
+        if 'error' in b or 'error' in a:
+            print(f"{case[0]} {case[1]}: error {b.get('error') or a.get('error')}")
+            continue
+        for stage in sorted(a['stages']):
+            b_stage = stage if stage in b['stages'] else a.get('counterparts', {}).get(stage)
+            if b_stage not in b['stages']:
+                continue
+            b_rate = b['stages'][b_stage]['items_per_second']
+            a_rate = a['stages'][stage]['items_per_second']
+            speedup = f"{a_rate / b_rate:.2f}x" if a_rate and b_rate else "n/a"
+            label = stage if b_stage == stage else f"{b_stage} -> {stage}"
+            print(f"{case[0]} {case[1]} {label}: {b_rate or 0:.1f} -> {a_rate or 0:.1f} "
+                  f"items/s ({speedup}), peak RSS "
+                  f"{mib(b['stages'][b_stage].get('peak_rss_mb'))} -> "
+                  f"{mib(a['stages'][stage].get('peak_rss_mb'))}")
+        print(f"{case[0]} {case[1]} peak RSS: {mib(b['peak_rss_mb'])} -> "
+              f"{mib(a['peak_rss_mb'])}")
+        if b['fingerprint'] != a['fingerprint']:
+            changed_outputs.append(case)
+    if changed_outputs:
+        print(f"Outputs changed for: {', '.join(f'{b} {n}' for b, n in changed_outputs)}")
+        sys.exit(1)
+    print("All outputs unchanged")
@@ -0,0 +1,21 @@
+from bertopic.backend import BaseEmbedder
+from sklearn.feature_extraction.text import HashingVectorizer
+
+
+class HashingEmbedder(BaseEmbedder):
+    """Deterministic offline stand-in for the sentence transformer, so that
+    embedding, model fitting and outlier reduction can be benchmarked
+    without a model download. Defined in its own module so saved models can unpickle it."""
+
+    def __init__(self, n_features=384):
+        super().__init__()
+        self.vectorizer = HashingVectorizer(n_features=n_features, alternate_sign=False,
+                                            norm='l2')
+
+    def embed(self, documents, verbose=False):
+        return self.vectorizer.transform(documents).toarray().astype('float32')
+
+    def encode(self, documents, **kwargs):
+        # As SentenceTransformer.encode, for the pipeline's own embedding
+        # code; batch size and progress bar options have no effect
+        return self.embed(documents)
@@ -0,0 +1,64 @@
+import importlib
+import inspect
+import sys
+from contextlib import contextmanager
+
+import pandas
+
+
+# The benchmarks call the pipeline through entry points the baseline tree
+# already had, so the same benchmark runs on the baseline and on any later
+# tree and their output fingerprints can be compared. Where a signature has
+# changed since, the call is adapted to whichever version is on sys.path.
+# Entry points added since are looked up with optional().
+
+
+def optional(module, name):
+    # module.name, or None on trees that do not have it yet
+    try:
+        return getattr(importlib.import_module(module), name)
+    except ModuleNotFoundError as e:
+        if e.name != module:
+            raise
+        return None
+    except AttributeError:
+        return None
+
+
+@contextmanager
+def _argv(*args):
+    saved = sys.argv
+    sys.argv = [saved[0], *args]
+    try:
+        yield
+    finally:
+        sys.argv = saved
+
+
+def prepare_full_texts(excel_path, col_index):
+    from topic_modelling import prepare_full_texts
+
+    if 'calculate_frequencies' in inspect.signature(prepare_full_texts).parameters:
+        return prepare_full_texts(excel_path, col_index)
+    # The baseline reads whether to count n-grams from the command line
+    with _argv('', '', '', 'Skip_Frequencies'):
+        return prepare_full_texts(excel_path, col_index)
+
+
+def make_freqs(texts, orders):
+    from topic_modelling import make_freqs
+
+    if 'df_to_clean' in inspect.signature(make_freqs).parameters:
+        # The baseline counts one order per call, from a DataFrame
+        for n in orders:
+            make_freqs(pandas.DataFrame({'cleaned_full_text': texts}), n)
+    else:
+        make_freqs(texts, orders)
+
+
+def pdf_parser():
+    # read_pdf_and_perform_regex, which the baseline kept in the scraper
+    parse = optional('pdf_parsing', 'read_pdf_and_perform_regex')
+    if parse is None:
+        from scrape_ics import read_pdf_and_perform_regex as parse
+    return parse
@@ -0,0 +1,356 @@
+import argparse
+import hashlib
+import json
+import multiprocessing
+import os
+import platform
+import subprocess
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+project_root = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(project_root / 'src'))
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+import entry_points
+
+
+# Offline benchmarks of the pipeline's hot paths on synthetic fixtures.
+# Every (benchmark, size) runs in a fresh process from its own working
+# directory, so no cache left by an earlier case is hit. Each benchmark
+# times a reference stage that only uses entry points the baseline tree
+# already had (see entry_points.py), and the result carries a fingerprint of
+# that stage's output. Running the same benchmarks with --src on a baseline
+# checkout then shows both the speed-up and whether outputs changed. Stages
+# for entry points added since are timed where the tree has them, and their
+# outputs must equal the reference stage's.
+#
+#   python benchmarks/run_benchmarks.py --sizes 1000 10000 --benchmarks clean freqs
+
+benchmarks = ('clean', 'freqs', 'embed', 'run_bert', 'reduce', 'pdf_parse', 'html_parse')
+default_sizes = (1000, 10000, 50000)
+# The fixtures each benchmark reads, made by synthetic.py
+fixture_names = {
+    'clean': ('workbook',),
+    'freqs': ('cleaned',),
+    'embed': ('workbook',),
+    'run_bert': ('cleaned',),
+    'reduce': ('cleaned', 'model'),
+    'pdf_parse': ('pdfs',),
+    'html_parse': ('pages',),
+}
+# The stage of each benchmark whose output is fingerprinted
+reference_stages = {
+    'clean': 'prepare_full_texts',
+    'freqs': 'make_freqs',
+    'embed': 'encode',
+    'run_bert': 'run_bert',
+    'reduce': 'reduce_outliers',
+    'pdf_parse': 'read_pdf_and_perform_regex',
+    'html_parse': 'two_pass_scrapers',
+}
+# Stages added since the baseline, and the stage doing the same work in a
+# run on the baseline, which compare.py sets them against
+counterparts = {
+    'clean_texts': 'clean_free_text',
+    'threshold_sweep': 'reduce_outliers',
+    'parse_pdfs': 'read_pdf_and_perform_regex',
+    'parse_impact_page': 'two_pass_scrapers',
+}
+
+
+def use_src(src_root):
+    # Puts a checkout's pipeline modules first on sys.path
+    for src_dir in ('modelling', 'data_collection'):
+        sys.path.insert(0, str(Path(src_root) / src_dir))
+
+
+def read_fixture(path):
+    # Arrow fixtures are read directly, not through the tree under test
+    import pyarrow
+
+    with pyarrow.memory_map(str(path), 'r') as f:
+        return pyarrow.ipc.open_file(f).read_all().to_pandas()
+
+
+def fingerprint(obj) -> str:
+    return hashlib.sha256(json.dumps(obj, sort_keys=True, default=str).encode()).hexdigest()
+
+
+def bench_clean(paths, profiler):
+    import pandas
+
+    from topic_modelling import clean_free_text, cols
+
+    raw = pandas.read_excel(paths['workbook'])
+    raw = raw[raw['REF impact case study identifier'].notnull()]
+    # Read, join and clean the workbook as the pipeline does
+    with profiler.stage('prepare_full_texts', items=len(raw)):
+        df = entry_points.prepare_full_texts(paths['workbook'], list(range(len(cols))))
+    reference = df['cleaned_full_text'].tolist()
+
+    # The same texts built from read_excel, as the baseline did, so missing
+    # sections must come through the pipeline's reader as "nan" too
+    texts = ["\n".join(str(row[col]) for col in cols) for _, row in raw.iterrows()]
+    with profiler.stage('clean_free_text', items=len(texts)):
+        serial = [clean_free_text(s) for s in texts]
+    assert serial == reference
+
+    clean_texts = entry_points.optional('text_cleaning', 'clean_texts')
+    if clean_texts is not None:
+        with profiler.stage('clean_texts', items=len(texts)):
+            pooled = clean_texts(texts)
+        assert pooled == reference
+    return len(df), fingerprint([df['REF impact case study identifier'].astype(str).tolist(),
+                                 reference])
+
+
+def bench_freqs(paths, profiler):
+    texts = read_fixture(paths['cleaned'])['cleaned_full_text'].tolist()
+    os.makedirs(os.path.join('data', 'text_processed'), exist_ok=True)
+    with profiler.stage('make_freqs', items=len(texts)):
+        entry_points.make_freqs(texts, range(1, 6))
+    outputs = sorted(Path('data', 'text_processed').glob('*-gram_frequencies.csv'))
+    return len(texts), fingerprint([p.read_text() for p in outputs])
+
+
+def bench_embed(paths, profiler):
+    import numpy
+
+    from embedders import HashingEmbedder
+    from topic_modelling import cols
+
+    embedding_model = HashingEmbedder()
+    col_index = list(range(len(cols)))
+    docs = entry_points.prepare_full_texts(paths['workbook'], col_index)[
+        'cleaned_full_text'].tolist()
+    with profiler.stage('encode', items=len(docs)):
+        reference = numpy.asarray(embedding_model.encode(docs))
+
+    embed_sections = entry_points.optional('topic_modelling', 'embed_sections')
+    if embed_sections is not None:
+        from embedding_cache import EmbeddingCache
+        from topic_modelling import prepare_section_texts
+
+        sections = prepare_section_texts(paths['workbook'])
+        items = len(sections) * len(cols)
+        with profiler.stage('embed_sections', items=items):
+            section_embeddings, _ = embed_sections(
+                sections, embedding_model, EmbeddingCache('hashing', 'embedding_cache'))
+        # A second run, as the next column set of a sweep, reads every
+        # section from the cache
+        with profiler.stage('embed_sections_cached', items=items):
+            cached, _ = embed_sections(
+                sections, embedding_model, EmbeddingCache('hashing', 'embedding_cache'))
+        assert numpy.array_equal(cached, section_embeddings)
+        for i, col in enumerate(cols):
+            assert numpy.array_equal(section_embeddings[:, i],
+                                     embedding_model.encode(sections[col].tolist()))
+
+    embed_corpora = entry_points.optional('streaming', 'embed_corpora')
+    if embed_corpora is not None:
+        with profiler.stage('embed_corpora', items=len(docs)):
+            store = embed_corpora([('bench', paths['workbook'])], embedding_model,
+                                  Path('embeddings') / 'bench.f32', col_index)
+        assert numpy.array_equal(numpy.asarray(store.load()), reference)
+    # Rounded, since float results differ slightly between BLAS builds
+    return len(docs), fingerprint(reference.round(4).tolist())
+
+
+def bench_run_bert(paths, profiler):
+    import numpy
+
+    from embedders import HashingEmbedder
+    from topic_modelling import run_bert
+
+    df = read_fixture(paths['cleaned'])
+    docs = df['cleaned_full_text'].tolist()
+    embedding_model = HashingEmbedder()
+    embeddings = numpy.asarray(embedding_model.embed(docs))
+    # Only arguments the baseline's run_bert takes, so each tree runs with
+    # its own defaults
+    with profiler.stage('run_bert', items=len(docs)):
+        run_bert(df, docs, embedding_model, embeddings, Path('topic_modelled'), 'columns_bench',
+                 n_neighbors=15, nr_topics=None)
+    return len(docs), fingerprint([int(topic) for topic in df['BERT_topic']])
+
+
+def bench_reduce(paths, profiler):
+    from bertopic import BERTopic
+    from bertopic.representation import KeyBERTInspired
+    from embedders import HashingEmbedder
+
+    docs = read_fixture(paths['cleaned'])['cleaned_full_text'].tolist()
+    thresholds = [0.001 * i for i in range(0, 51)]
+
+    def load():
+        return BERTopic.load(paths['model'], embedding_model=HashingEmbedder())
+
+    def terms(topic_model, topic):
+        return ",".join(term[0] for term in topic_model.get_topic(topic))
+
+    # The baseline's topic_reduce loop, less its saving of every model: a
+    # fresh load, outlier reduction and representation update per threshold
+    reference = []
+    with profiler.stage('reduce_outliers', items=len(docs) * len(thresholds)):
+        for threshold in thresholds:
+            topic_model = load()
+            new_topics = topic_model.reduce_outliers(
+                docs, topic_model.topics_, probabilities=topic_model.probabilities_,
+                threshold=threshold, strategy="probabilities")
+            topic_model.update_topics(docs, topics=new_topics,
+                                      representation_model=KeyBERTInspired())
+            topics = [int(topic) for topic in topic_model.topics_]
+            reference.append([topics, {topic: terms(topic_model, topic)
+                                       for topic in sorted(set(topics))}])
+
+    threshold_sweep = entry_points.optional('topic_reduce', 'threshold_sweep')
+    if threshold_sweep is not None:
+        topic_model = load()
+        with profiler.stage('threshold_sweep', items=len(docs) * len(thresholds)):
+            assignments, terms_rows = threshold_sweep(topic_model, docs, thresholds,
+                                                      KeyBERTInspired())
+        swept = [[assignment.tolist(), {topic: topic_terms for t, topic, topic_terms
+                                        in terms_rows if t == threshold}]
+                 for threshold, assignment in zip(thresholds, assignments)]
+        assert swept == reference
+    return len(docs), fingerprint(reference)
+
+
+def bench_pdf_parse(paths, profiler):
+    read_pdf_and_perform_regex = entry_points.pdf_parser()
+    pdf_paths = sorted(Path(paths['pdfs']).glob('*.pdf'))
+    with profiler.stage('read_pdf_and_perform_regex', items=len(pdf_paths)):
+        serial = {p.name: read_pdf_and_perform_regex(p) for p in pdf_paths}
+
+    parse_pdfs = entry_points.optional('pdf_parsing', 'parse_pdfs')
+    if parse_pdfs is not None:
+        with profiler.stage('parse_pdfs', items=len(pdf_paths)):
+            pooled = {p.name: result for p, result, error in parse_pdfs(pdf_paths)}
+        assert pooled == serial
+    return len(pdf_paths), fingerprint(serial)
+
+
+def bench_html_parse(paths, profiler):
+    from bench_page_parsing import two_pass_grant, two_pass_secondary
+
+    pages = {p.name: p.read_text(encoding='utf-8')
+             for p in sorted(Path(paths['pages']).glob('*.html'))}
+    # The baseline scraped pages with Selenium; the two-pass lxml scrapers
+    # return what it did, without a browser
+    with profiler.stage('two_pass_scrapers', items=len(pages)):
+        reference = {name: {'aux': two_pass_secondary(page), 'grant': two_pass_grant(page)}
+                     for name, page in pages.items()}
+
+    parse_impact_page = entry_points.optional('page_parsing', 'parse_impact_page')
+    if parse_impact_page is not None:
+        with profiler.stage('parse_impact_page', items=len(pages)):
+            parsed = {name: parse_impact_page(page) for name, page in pages.items()}
+        assert {name: {'aux': p['aux'], 'grant': p['grant']}
+                for name, p in parsed.items()} == reference
+    return len(pages), fingerprint(reference)
+
+
+def prepare_fixture(benchmark, n, fixtures):
+    # Generated in a process of its own by this checkout, whichever tree is
+    # benchmarked, so neither the time nor the memory it takes counts and
+    # every tree reads the same files
+    use_src(project_root / 'src')
+    import synthetic
+
+    makers = {'workbook': synthetic.workbook_path, 'cleaned': synthetic.cleaned_corpus,
+              'model': synthetic.model_path, 'pdfs': synthetic.pdf_dir,
+              'pages': synthetic.page_dir}
+    return {name: str(makers[name](fixtures, n)) for name in fixture_names[benchmark]}
+
+
+def run_case(benchmark, n, paths, case_dir, src_root):
+    # Runs in a fresh process, from case_dir, so caches start empty
+    case_dir.mkdir(parents=True, exist_ok=True)
+    os.chdir(case_dir)
+    use_src(src_root)
+    from common.profiling import Profiler, peak_rss_mb
+
+    profiler = Profiler(f'{benchmark}_{n}')
+    start = time.perf_counter()
+    try:
+        items, output_fingerprint = globals()[f'bench_{benchmark}'](paths, profiler)
+    except Exception as e:
+        return {'benchmark': benchmark, 'size': n, 'error': repr(e)}
+    return {
+        'benchmark': benchmark,
+        'size': n,
+        'items': items,
+        # Includes imports and reading the fixtures, unlike the stages
+        'seconds': time.perf_counter() - start,
+        'reference': reference_stages[benchmark],
+        'counterparts': {stage: counterpart for stage, counterpart in counterparts.items()
+                         if stage in profiler.totals},
+        'stages': {name: {**total, 'items_per_second': total['items'] / total['seconds']
+                          if total['items'] and total['seconds'] else None}
+                   for name, total in profiler.totals.items()},
+        # The largest of any stage, so imports and fixture reading are left out
+        'peak_rss_mb': profiler.peak('peak_rss_mb'),
+        'rss_increase_mb': profiler.peak('rss_increase_mb'),
+        'process_peak_rss_mb': peak_rss_mb(),
+        'peak_children_rss_mb': peak_rss_mb(children=True),
+        'fingerprint': output_fingerprint,
+    }
+
+
+def environment(src_root):
+    # The commit of the tree under test
+    try:
+        commit = subprocess.run(['git', 'rev-parse', 'HEAD'], cwd=src_root,
+                                capture_output=True, text=True).stdout.strip()
+    except OSError:
+        commit = None
+    return {'commit': commit, 'python': sys.version, 'platform': platform.platform(),
+            'cpu_count': os.cpu_count()}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Offline pipeline benchmarks.")
+    parser.add_argument('--sizes', type=int, nargs='+', default=list(default_sizes))
+    parser.add_argument('--benchmarks', nargs='+', choices=benchmarks, default=list(benchmarks))
+    parser.add_argument('--workdir', default=str(project_root / 'data' / 'benchmarks'),
+                        help="fixtures and per-case working directories")
+    parser.add_argument('--output', help="results JSON "
+                                         "(default benchmarks/results/<time>.json)")
+    parser.add_argument('--src', default=str(project_root / 'src'),
+                        help="src directory of the tree to benchmark, e.g. of a baseline "
+                             "worktree (default this checkout's)")
+    args = parser.parse_args(argv)
+
+    workdir = Path(args.workdir).resolve()
+    src_root = Path(args.src).resolve()
+    fixtures = workdir / 'fixtures'
+    fixtures.mkdir(parents=True, exist_ok=True)
+    run_id = time.strftime('%Y%m%d-%H%M%S')
+    results = []
+    context = multiprocessing.get_context('spawn')
+    for n in args.sizes:
+        for benchmark in args.benchmarks:
+            print(f"{benchmark} at {n}", flush=True)
+            with ProcessPoolExecutor(max_workers=1, mp_context=context) as executor:
+                paths = executor.submit(prepare_fixture, benchmark, n, fixtures).result()
+            with ProcessPoolExecutor(max_workers=1, mp_context=context) as executor:
+                result = executor.submit(run_case, benchmark, n, paths,
+                                         workdir / 'runs' / run_id / f'{benchmark}_{n}',
+                                         src_root).result()
+            print(json.dumps({k: v for k, v in result.items() if k != 'stages'}), flush=True)
+            results.append(result)
+
+    output = Path(args.output) if args.output else (
+        Path(__file__).resolve().parent / 'results' / f'{run_id}.json')
+    output.parent.mkdir(parents=True, exist_ok=True)
+    with open(output, 'w') as f:
+        json.dump({'run_id': run_id, 'src': str(src_root), 'environment': environment(src_root),
+                   'results': results}, f,
+                  indent=2)
+    print(f"Results written to {output}")
+
+
+if __name__ == "__main__":
+    main()
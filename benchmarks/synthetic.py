@@ -0,0 +1,227 @@
+import sys
+from pathlib import Path
+
+import numpy
+import pandas
+
+project_root = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(project_root / 'src' / 'modelling'))
+from columnar_cache import read_columns, write_columns
+from text_cleaning import clean_texts, cols
+
+
+# Deterministic REF-like fixtures: case study workbooks, impact pages and
+# case study PDFs. The same (size, seed) always gives the same files, so
+# results of different runs are comparable and fingerprints must match.
+
+id_column = 'REF impact case study identifier'
+
+# Roughly the indicative maximum word counts of the five sections
+section_words = [100, 500, 250, 750, 300]
+
+section_headers = [
+    "Summary of the impact (indicative maximum 100 words)",
+    "Underpinning research (indicative maximum 500 words)",
+    "References to the research (indicative maximum of six references)",
+    "Details of the impact (indicative maximum 750 words)",
+    "Sources to corroborate the impact (indicative maximum of 10 references)",
+]
+
+units = ["Clinical Medicine", "Physics", "Law", "History", "Computer Science",
+         "Economics and Econometrics", "Education", "Philosophy"]
+roles = ["Professor", "Senior Lecturer", "Lecturer", "Reader", "Research Fellow"]
+funders = ["AHRC", "EPSRC", "ESRC", "MRC", "Wellcome Trust", "Leverhulme Trust"]
+
+
+def make_vocabulary(size=20000, seed=0):
+    rng = numpy.random.default_rng(seed)
+    syllables = numpy.array(["ka", "lo", "mi", "ne", "ri", "sa", "tu", "ve", "po", "an",
+                             "der", "ing", "tion", "al", "ic", "or", "um", "es"])
+    lengths = rng.integers(2, 5, size=size)
+    words = {"".join(rng.choice(syllables, size=n)) for n in lengths}
+    return numpy.array(sorted(words))
+
+
+def make_text(rng, vocab, probabilities, n_words):
+    words = vocab[rng.choice(len(vocab), size=n_words, p=probabilities)]
+    # Markdown, URLs and line breaks as in the REF submissions
+    lines = [" ".join(words[i:i + 25]) for i in range(0, n_words, 25)]
+    if lines and rng.random() < 0.5:
+        lines[0] = f"**{lines[0]}**"
+    if rng.random() < 0.3:
+        lines.append(f"See https://example.org/{'/'.join(words[:2])}")
+    return "\n".join(f"- {line}" if rng.random() < 0.2 else line for line in lines)
+
+
+def make_corpus(n, seed=0):
+    rng = numpy.random.default_rng(seed)
+    vocab = make_vocabulary(seed=seed)
+    ranks = numpy.arange(1, len(vocab) + 1)
+    probabilities = (1 / ranks) / (1 / ranks).sum()
+    rows = []
+    for i in range(n):
+        row = {
+            id_column: f"{rng.integers(10000, 99999)}-{i}",
+            'Institution name': f"University {rng.integers(1, 150)}",
+            'Unit of assessment name': units[rng.integers(len(units))],
+        }
+        for col, header, words in zip(cols, section_headers, section_words):
+            # A few sections are missing, as in the real data
+            if rng.random() < 0.02:
+                row[col] = None
+                continue
+            n_words = int(words * rng.uniform(0.5, 1.0))
+            row[col] = header + "\n" + make_text(rng, vocab, probabilities, n_words)
+        rows.append(row)
+    return pandas.DataFrame(rows)
+
+
+def corpus_path(fixture_dir, n, seed=0):
+    # The corpus as Arrow, which is quick to write, for the fixtures that
+    # are derived from it
+    path = Path(fixture_dir) / f"corpus_{n}_{seed}.arrow"
+    if not path.exists():
+        write_columns(make_corpus(n, seed), path)
+    return path
+
+
+def workbook_path(fixture_dir, n, seed=0):
+    # The corpus as the pipeline gets it, an xlsx workbook with empty cells
+    # for the missing sections. Slow to write at 50k rows, so it is made
+    # once and kept
+    path = Path(fixture_dir) / f"corpus_{n}_{seed}.xlsx"
+    if not path.exists():
+        tmp_path = path.with_name(f"{path.stem}.tmp.xlsx")
+        read_columns(corpus_path(fixture_dir, n, seed)).to_excel(tmp_path, index=False)
+        tmp_path.replace(path)
+    return path
+
+
+def cleaned_corpus(fixture_dir, n, seed=0):
+    path = Path(fixture_dir) / f"corpus_{n}_{seed}_cleaned.arrow"
+    if not path.exists():
+        df = read_columns(corpus_path(fixture_dir, n, seed))
+        sections = [clean_texts(df[col].astype(str).tolist()) for col in cols]
+        write_columns(pandas.DataFrame({
+            id_column: df[id_column],
+            'cleaned_full_text': [" ".join(filter(None, parts)) for parts in zip(*sections)],
+        }), path)
+    return path
+
+
+def model_path(fixture_dir, n, seed=0):
+    # A topic model of the cleaned corpus, fitted on the CPU backend with the
+    # hashing embedder, for benchmarks of what happens after the fit
+    from embedders import HashingEmbedder
+    from topic_modelling import run_bert
+
+    target_dir = Path(fixture_dir) / f"model_{n}_{seed}"
+    name_path = target_dir / "model_name"
+    if not name_path.exists():
+        df = read_columns(cleaned_corpus(fixture_dir, n, seed))
+        docs = df['cleaned_full_text'].tolist()
+        embedding_model = HashingEmbedder()
+        metadata = run_bert(df, docs, embedding_model, embedding_model.embed(docs), target_dir,
+                            'columns_bench', n_neighbors=15, nr_topics=None,
+                            record_metadata=False, backend='cpu', figures=False)
+        name_path.write_text(metadata['model_name'])
+    return target_dir / "models" / name_path.read_text()
+
+
+def make_people(rng):
+    n = int(rng.integers(1, 6))
+    names = [f"{chr(65 + rng.integers(26))}. Author{rng.integers(1000)}" for _ in range(n)]
+    people_roles = [roles[rng.integers(len(roles))] for _ in range(n)]
+    periods = [f"{rng.integers(1990, 2015)} - present" for _ in range(n)]
+    return names, people_roles, periods
+
+
+def make_page(key, rng):
+    names, _, _ = make_people(rng)
+    grants = "".join(
+        f"<tr><td>{funders[rng.integers(len(funders))]}</td>"
+        f"<td>{chr(65 + rng.integers(26))}{chr(65 + rng.integers(26))}/"
+        f"{rng.integers(100000, 999999)}/1</td>"
+        f"<td>£{rng.integers(10000, 2000000):,}</td></tr>"
+        for _ in range(int(rng.integers(0, 4)))
+    )
+    return f"""<!DOCTYPE html>
+<html><head><title>Impact case study {key}</title></head>
+<body>
+<dl class="impact-metadata"><dt>Submitting institution</dt><dd>University {rng.integers(1, 150)}</dd></dl>
+<div class="content">
+<dl class="impact-metadata">
+<dt>Unit of assessment</dt><dd>{units[rng.integers(len(units))]}</dd>
+<dt>Summary impact type</dt><dd>Societal</dd>
+<dt>Is this case study continued from a case study submitted in 2014?</dt><dd>No</dd>
+<dt>Researchers</dt><dd>{'<br>'.join(names)}</dd>
+</dl>
+<h4>Grant funding</h4>
+<table><tr><th>Funder</th><th>Grant number</th><th>Value of grant</th></tr>{grants}</table>
+<a href="/impact/{key}/pdf">Download case study PDF</a>
+</div>
+</body></html>
+"""
+
+
+def page_dir(fixture_dir, n, seed=0):
+    directory = Path(fixture_dir) / f"pages_{n}_{seed}"
+    if not (directory / ".complete").exists():
+        directory.mkdir(parents=True, exist_ok=True)
+        rng = numpy.random.default_rng(seed)
+        for i in range(n):
+            key = f"{rng.integers(10000, 99999)}-{i}"
+            (directory / f"{key}.html").write_text(make_page(key, rng), encoding="utf-8")
+        (directory / ".complete").touch()
+    return directory
+
+
+def make_pdf(path, rng):
+    import fitz
+
+    names, people_roles, periods = make_people(rng)
+    lines = [
+        "Impact case study (REF3)",
+        f"Institution: University {rng.integers(1, 150)}",
+        f"Unit of Assessment: {units[rng.integers(len(units))]}",
+        "Title of case study: Synthetic case study",
+        f"Period when the underpinning research was undertaken: {rng.integers(2000, 2010)} - 2020",
+        "Details of staff conducting the underpinning research from the submitting unit:",
+        "Name(s):",
+        *names,
+        "Role(s) (e.g. job title):",
+        *people_roles,
+        "Period(s) employed by",
+        "submitting HEI:",
+        *periods,
+        "Period when the claimed impact occurred: 2014 - 2020",
+        "Is this case study continued from a case study submitted in 2014? N",
+        "1. Summary of the impact (indicative maximum 100 words)",
+        "Synthetic summary text.",
+    ]
+    doc = fitz.open()
+    page = doc.new_page()
+    page.insert_text((72, 72), "\n".join(lines), fontsize=9)
+    doc.save(str(path))
+    doc.close()
+
+
+def pdf_dir(fixture_dir, n, seed=0):
+    directory = Path(fixture_dir) / f"pdfs_{n}_{seed}"
+    if not (directory / ".complete").exists():
+        directory.mkdir(parents=True, exist_ok=True)
+        rng = numpy.random.default_rng(seed)
+        for i in range(n):
+            make_pdf(directory / f"{rng.integers(10000, 99999)}-{i}.pdf", rng)
+        (directory / ".complete").touch()
+    return directory
+
+
+if __name__ == "__main__":
+    # python benchmarks/synthetic.py <out.xlsx|out.arrow> <n> [seed]
+    out = Path(sys.argv[1])
+    df = make_corpus(int(sys.argv[2]), int(sys.argv[3]) if len(sys.argv) > 3 else 0)
+    if out.suffix == '.xlsx':
+        df.to_excel(out, index=False)
+    else:
+        write_columns(df, out)
@@ -0,0 +1,211 @@
+import functools
+import json
+import os
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Dict, List, Optional, Union
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+
+def peak_rss_mb(children: bool = False) -> Optional[float]:
+    # High-water mark of this process's resident memory, in MiB. With
+    # children, that of the largest finished child process (e.g. pool workers)
+    if resource is not None:
+        who = resource.RUSAGE_CHILDREN if children else resource.RUSAGE_SELF
+        peak = resource.getrusage(who).ru_maxrss
+        # Reported in bytes on macOS and in KiB elsewhere
+        return peak / 2 ** 20 if sys.platform == "darwin" else peak / 2 ** 10
+    try:
+        import psutil
+    except ImportError:
+        return None
+    if children:
+        return None
+    info = psutil.Process().memory_info()
+    return getattr(info, "peak_wset", info.rss) / 2 ** 20
+
+
+def current_rss_mb() -> Optional[float]:
+    # Resident memory of this process right now, in MiB
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 2 ** 20
+    except (OSError, ValueError, AttributeError):
+        pass
+    try:
+        import psutil
+    except ImportError:
+        return None
+    return psutil.Process().memory_info().rss / 2 ** 20
+
+
+class RssSampler:
+    # Samples this process's RSS on a background thread while any stage is
+    # open, keeping the highest value seen during each one
+    def __init__(self, interval: float = 0.02):
+        self.interval = interval
+        self.lock = threading.Lock()
+        self.open: List[Dict] = []
+        self.stopped = threading.Event()
+        self.thread = None
+
+    def _sample(self):
+        rss = current_rss_mb()
+        if rss is None:
+            return
+        with self.lock:
+            for watch in self.open:
+                watch["peak"] = max(watch["peak"], rss)
+
+    def _run(self, stopped):
+        while not stopped.wait(self.interval):
+            self._sample()
+
+    def start(self) -> Dict:
+        rss = current_rss_mb()
+        watch = {"start": rss, "peak": rss}
+        if rss is None:
+            return watch
+        with self.lock:
+            self.open.append(watch)
+            if self.thread is None:
+                self.stopped = threading.Event()
+                self.thread = threading.Thread(target=self._run, args=(self.stopped,),
+                                               daemon=True)
+                self.thread.start()
+        return watch
+
+    def stop(self, watch: Dict) -> Dict:
+        # The stage's own peak RSS and how far it rose above the RSS the
+        # stage started at, both in MiB
+        if watch["start"] is None:
+            return {"peak_rss_mb": None, "rss_increase_mb": None}
+        self._sample()
+        with self.lock:
+            self.open.remove(watch)
+            if not self.open:
+                self.stopped.set()
+                self.thread = None
+        return {"peak_rss_mb": round(watch["peak"], 1),
+                "rss_increase_mb": round(watch["peak"] - watch["start"], 1)}
+
+
+class Profiler:
+    """Wall-clock timings and memory of named pipeline stages.
+
+    Stages are timed with the stage() context manager, the timed() decorator,
+    or by wrapping a method of an object, such as a fitted model, with
+    wrap(). Wrapped methods are put back by restore(). Stages may nest, so a
+    stage's time includes any stage it calls. Every call is kept as an event
+    for the JSON trace, and calls of the same stage are summed for
+    summary().
+
+    Memory is sampled every sample_interval seconds while a stage runs, so
+    each call records the peak RSS reached during that call and its rise
+    over the RSS the call started at, not the process's lifetime peak.
+    """
+
+    def __init__(self, name: str = "", sample_interval: float = 0.02):
+        self.name = name
+        self.started = time.time()
+        self.events: List[Dict] = []
+        self.totals: Dict[str, Dict] = {}
+        self._patched = []
+        self._sampler = RssSampler(sample_interval)
+
+    @contextmanager
+    def stage(self, name: str, items: Optional[int] = None):
+        watch = self._sampler.start()
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            seconds = time.perf_counter() - start
+            memory = self._sampler.stop(watch)
+            self.events.append({"stage": name, "start": start, "seconds": seconds,
+                                "items": items, "rss_start_mb": watch["start"], **memory})
+            total = self.totals.setdefault(name, {"seconds": 0.0, "calls": 0, "items": 0,
+                                                  "peak_rss_mb": None,
+                                                  "rss_increase_mb": None})
+            total["seconds"] += seconds
+            total["calls"] += 1
+            total["items"] += items or 0
+            # The largest over all calls of the stage
+            for key, value in memory.items():
+                if value is not None:
+                    total[key] = max(value, total[key] or value)
+
+    def peak(self, key: str = "peak_rss_mb") -> Optional[float]:
+        # Largest value of key over every stage profiled, or None if no
+        # stage could be measured
+        values = [total[key] for total in self.totals.values() if total[key] is not None]
+        return max(values, default=None)
+
+    def timed(self, name: str):
+        def decorator(func):
+            @functools.wraps(func)
+            def wrapper(*args, **kwargs):
+                with self.stage(name):
+                    return func(*args, **kwargs)
+            return wrapper
+        return decorator
+
+    def wrap(self, obj, method: str, name: str):
+        # Shadows the method on this instance only; attributes missing from
+        # obj (e.g. in another library version) are skipped
+        if obj is None or not hasattr(obj, method):
+            return
+        self._patched.append((obj, method, method in vars(obj)))
+        setattr(obj, method, self.timed(name)(getattr(obj, method)))
+
+    def restore(self):
+        # Patched instances may be pickled (e.g. BERTopic.save), so the
+        # wrappers must be removed first
+        for obj, method, had_own in reversed(self._patched):
+            original = getattr(obj, method).__wrapped__
+            if had_own:
+                setattr(obj, method, original)
+            else:
+                delattr(obj, method)
+        self._patched = []
+
+    def summary(self) -> Dict[str, float]:
+        # Flat columns for a metadata row, e.g. umap_seconds and
+        # umap_peak_rss_mb, plus the largest peak and rise of any stage
+        row = {}
+        for name, total in self.totals.items():
+            row[f"{name}_seconds"] = round(total["seconds"], 3)
+            row[f"{name}_peak_rss_mb"] = total["peak_rss_mb"]
+        row["peak_rss_mb"] = self.peak("peak_rss_mb")
+        row["rss_increase_mb"] = self.peak("rss_increase_mb")
+        return row
+
+    def write_trace(self, path: Union[str, Path], **metadata):
+        path = Path(path)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        origin = min((event["start"] for event in self.events), default=0.0)
+        trace = {
+            "name": self.name,
+            "started": self.started,
+            "pid": os.getpid(),
+            **metadata,
+            "peak_rss_mb": self.peak("peak_rss_mb"),
+            "rss_increase_mb": self.peak("rss_increase_mb"),
+            # High-water marks over the whole process and its finished
+            # children, which may predate this profiler
+            "process_peak_rss_mb": peak_rss_mb(),
+            "process_peak_children_rss_mb": peak_rss_mb(children=True),
+            "stages": self.totals,
+            "events": [{**event, "start": round(event["start"] - origin, 6)}
+                       for event in sorted(self.events, key=lambda e: e["start"])],
+        }
+        with open(path, "w") as f:
+            json.dump(trace, f, indent=2, default=str)
+        return path
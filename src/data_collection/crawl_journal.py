@@ -0,0 +1,147 @@
+import hashlib
+import json
+import sqlite3
+import time
+from pathlib import Path
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+
+stages = ('page', 'pdf', 'parse')
+
+
+def file_sha256(path, block_size=1 << 20):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(block_size), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+class CrawlJournal:
+    """Durable per-key crawl state in SQLite.
+
+    Every stage of a key (page fetched and metadata scraped, PDF downloaded,
+    PDF parsed) is committed as soon as it finishes, so a restarted crawl only
+    redoes keys whose stage never completed or failed.
+    """
+
+    def __init__(self, path):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        # fetch_case_studies journals from its on_done worker thread, one call
+        # at a time, while the crawl waits for it
+        self.conn = sqlite3.connect(str(self.path), check_same_thread=False)
+        self.conn.execute('PRAGMA journal_mode=WAL')
+        self.conn.execute('PRAGMA synchronous=FULL')
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS crawl (
+                key TEXT PRIMARY KEY,
+                page_status TEXT,
+                page_path TEXT,
+                aux TEXT,
+                grant_info TEXT,
+                grant_rows TEXT,
+                pdf_status TEXT,
+                pdf_path TEXT,
+                pdf_sha256 TEXT,
+                parse_status TEXT,
+                parsed TEXT,
+                parser_version TEXT,
+                page_error TEXT,
+                pdf_error TEXT,
+                parse_error TEXT,
+                updated_at REAL
+            )""")
+        # Journals created before these columns were recorded. Their single
+        # error column is left in place but no longer written.
+        columns = {row[1] for row in self.conn.execute('PRAGMA table_info(crawl)')}
+        for column in ('grant_rows', 'parser_version', 'page_error', 'pdf_error', 'parse_error'):
+            if column not in columns:
+                self.conn.execute(f'ALTER TABLE crawl ADD COLUMN {column} TEXT')
+        self.conn.commit()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        self.conn.close()
+
+    def _update(self, key: str, **values):
+        values['updated_at'] = time.time()
+        columns = ', '.join(values)
+        updates = ', '.join(f'{col} = excluded.{col}' for col in values)
+        self.conn.execute(
+            f'INSERT INTO crawl (key, {columns}) VALUES (?, {", ".join("?" * len(values))}) '
+            f'ON CONFLICT(key) DO UPDATE SET {updates}',
+            [key, *values.values()])
+        self.conn.commit()
+
+    def record_page(self, key: str, aux, grant, page_path: Optional[Path] = None,
+                    grant_rows: Optional[List[Dict]] = None):
+        self._update(key, page_status='done', aux=json.dumps(aux),
+                     grant_info=json.dumps(grant), grant_rows=json.dumps(grant_rows),
+                     page_path=str(page_path) if page_path else None, page_error=None)
+
+    def record_pdf(self, key: str, pdf_path: Path):
+        sha256 = file_sha256(pdf_path)
+        values = dict(pdf_status='done', pdf_path=str(pdf_path), pdf_sha256=sha256,
+                      pdf_error=None)
+        # A PDF with new content has to be parsed again
+        previous = self.conn.execute(
+            'SELECT pdf_sha256 FROM crawl WHERE key = ?', (key,)).fetchone()
+        if previous is not None and previous[0] != sha256:
+            values['parse_status'] = None
+        self._update(key, **values)
+
+    def record_parsed(self, key: str, result: Dict, parser_version: Optional[str] = None):
+        self._update(key, parse_status='done', parsed=json.dumps(result),
+                     parser_version=parser_version, parse_error=None)
+
+    def _check_stage(self, stage: str):
+        if stage not in stages:
+            raise ValueError(f"Unknown stage '{stage}', expected one of {stages}")
+
+    def record_failure(self, key: str, stage: str, error):
+        # Each stage keeps its own error, so a later stage succeeding does not
+        # clear the reason an earlier one failed
+        self._check_stage(stage)
+        self._update(key, **{f'{stage}_status': 'failed', f'{stage}_error': repr(error)})
+
+    def pending(self, keys: Iterable[str], stage: str,
+                parser_version: Optional[str] = None) -> List[str]:
+        # With parser_version, parses by any other version count as pending
+        self._check_stage(stage)
+        query, params = f'SELECT key FROM crawl WHERE {stage}_status = ?', ['done']
+        if parser_version is not None:
+            query, params = query + ' AND parser_version = ?', params + [parser_version]
+        done = {row[0] for row in self.conn.execute(query, params)}
+        return [key for key in keys if key not in done]
+
+    def iter_column(self, name: str, stage: str) -> Iterator[Tuple[str, object]]:
+        # Decoded (key, value) pairs of one column for every key whose stage
+        # completed, read from the cursor one row at a time
+        self._check_stage(stage)
+        rows = self.conn.execute(
+            f'SELECT key, {name} FROM crawl WHERE {stage}_status = ? ORDER BY rowid', ('done',))
+        for key, value in rows:
+            yield key, self._decode(name, value)
+
+    def column(self, name: str, stage: str) -> Dict:
+        return dict(self.iter_column(name, stage))
+
+    def get(self, key: str, name: str, stage: str):
+        # Decoded value for one key, or None if its stage has not completed
+        self._check_stage(stage)
+        row = self.conn.execute(
+            f'SELECT {name} FROM crawl WHERE key = ? AND {stage}_status = ?',
+            (key, 'done')).fetchone()
+        return None if row is None else self._decode(name, row[0])
+
+    @staticmethod
+    def _decode(name, value):
+        if value is None or name not in ('aux', 'grant_info', 'grant_rows', 'parsed'):
+            return value
+        return json.loads(value)
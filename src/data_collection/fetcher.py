@@ -0,0 +1,188 @@
+import asyncio
+import os
+import random
+import time
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Callable, Dict, Iterable, Optional, Union
+from urllib.parse import urljoin, urlsplit
+
+import httpx
+from lxml import html as lxml_html
+
+
+retry_statuses = {429, 500, 502, 503, 504}
+
+
+class PdfFetchError(Exception):
+    """The impact page was fetched and saved, but its PDF could not be."""
+
+    def __init__(self, key: str, page: Path, cause: Exception):
+        super().__init__(f"PDF of {key} failed: {cause!r}")
+        self.key = key
+        self.page = page
+        self.cause = cause
+
+
+class HostRateLimiter:
+    # Spaces out request starts per host by at least 1 / rate seconds
+    def __init__(self, rate: float):
+        self.interval = 1.0 / rate if rate > 0 else 0.0
+        self.next_slot = defaultdict(float)
+        self.locks = defaultdict(asyncio.Lock)
+
+    async def wait(self, url: str):
+        if not self.interval:
+            return
+        host = urlsplit(url).netloc
+        async with self.locks[host]:
+            now = time.monotonic()
+            delay = self.next_slot[host] - now
+            self.next_slot[host] = max(now, self.next_slot[host]) + self.interval
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+
+class AsyncFetcher:
+    """Pooled HTTP client with a concurrency limit, per-host rate limiting and
+    retries with exponential backoff on transport errors and 429/5xx."""
+
+    def __init__(
+        self,
+        concurrency: int = 8,
+        rate_per_host: float = 4.0,
+        retries: int = 4,
+        backoff: float = 1.0,
+        timeout: float = 30.0,
+        headers: Optional[Dict[str, str]] = None,
+    ):
+        self.semaphore = asyncio.Semaphore(concurrency)
+        self.rate_limiter = HostRateLimiter(rate_per_host)
+        self.retries = retries
+        self.backoff = backoff
+        self.client = httpx.AsyncClient(
+            limits=httpx.Limits(max_connections=concurrency,
+                                max_keepalive_connections=concurrency),
+            timeout=timeout,
+            follow_redirects=True,
+            headers=headers,
+        )
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        await self.client.aclose()
+
+    async def get(self, url: str) -> httpx.Response:
+        for attempt in range(self.retries + 1):
+            await self.rate_limiter.wait(url)
+            try:
+                async with self.semaphore:
+                    response = await self.client.get(url)
+                if response.status_code not in retry_statuses:
+                    response.raise_for_status()
+                    return response
+                error = httpx.HTTPStatusError(
+                    f"{response.status_code} for {url}",
+                    request=response.request, response=response)
+            except httpx.TransportError as e:
+                error = e
+            if attempt == self.retries:
+                raise error
+            # Honour Retry-After when the server sends one, else back off
+            # exponentially with jitter
+            retry_after = getattr(getattr(error, "response", None), "headers", {}).get("Retry-After")
+            delay = (float(retry_after) if retry_after and retry_after.isdigit()
+                     else self.backoff * 2 ** attempt * (1 + random.random()))
+            await asyncio.sleep(delay)
+
+
+def extract_pdf_link(page_html: str, base_url: str) -> Optional[str]:
+    tree = lxml_html.fromstring(page_html)
+    for a in tree.iter("a"):
+        if "Download case study PDF" in a.text_content() and a.get("href"):
+            return urljoin(base_url, a.get("href"))
+    return None
+
+
+async def fetch_case_study(
+    fetcher: AsyncFetcher, key: str, head: str, page_dir: Path, pdf_dir: Path,
+    pdf: bool = True,
+) -> Dict:
+    url = head + key
+    response = await fetcher.get(url)
+    page_html = response.text
+    page_path = page_dir / f"{key}.html"
+    # File writes go to a thread, so they do not stall the other downloads
+    await asyncio.to_thread(page_path.write_text, page_html, encoding="utf-8")
+    if not pdf:
+        return {"key": key, "page": page_path, "pdf": None}
+    try:
+        pdf_url = extract_pdf_link(page_html, url)
+        if pdf_url is None:
+            raise ValueError(f"No PDF link on {url}")
+        pdf_response = await fetcher.get(pdf_url)
+        # Named after the key, so concurrent downloads map to keys directly
+        pdf_path = pdf_dir / f"{key}.pdf"
+        tmp_path = pdf_dir / f"{key}.pdf.part"
+        await asyncio.to_thread(tmp_path.write_bytes, pdf_response.content)
+        os.replace(tmp_path, pdf_path)
+    except Exception as e:
+        # The page itself is saved, so only the PDF stage has failed
+        raise PdfFetchError(key, page_path, e) from e
+    return {"key": key, "page": page_path, "pdf": pdf_path}
+
+
+async def fetch_case_studies(
+    keys: Iterable[str],
+    head: str,
+    page_dir: Path,
+    pdf_dir: Path,
+    on_done: Optional[Callable[[str, Union[Dict, Exception]], None]] = None,
+    pdf_keys: Optional[Iterable[str]] = None,
+    **fetcher_kwargs,
+):
+    """Fetch the impact page and PDF of every key concurrently.
+
+    Returns (results, failed): results maps key to the saved page and PDF
+    paths, failed maps key to the exception, for the Selenium fallback. A
+    PdfFetchError means the page was saved and only the PDF failed.
+    on_done is called with each key's result or exception as soon as it
+    finishes, e.g. to journal progress. It runs on one worker thread, off
+    the event loop, so its calls never overlap and blocking work such as
+    parsing or a database commit does not hold up the downloads. A key
+    whose on_done raises is moved to failed with that exception. If
+    pdf_keys is given, only those keys have their PDF downloaded and the
+    rest cost one page request each.
+    """
+    page_dir.mkdir(parents=True, exist_ok=True)
+    pdf_dir.mkdir(parents=True, exist_ok=True)
+    pdf_keys = None if pdf_keys is None else set(pdf_keys)
+    results, failed = {}, {}
+    loop = asyncio.get_running_loop()
+    with ThreadPoolExecutor(max_workers=1) as on_done_thread:
+        async with AsyncFetcher(**fetcher_kwargs) as fetcher:
+            async def run(key):
+                try:
+                    results[key] = await fetch_case_study(
+                        fetcher, key, head, page_dir, pdf_dir,
+                        pdf=pdf_keys is None or key in pdf_keys)
+                    print(key)
+                except Exception as e:
+                    failed[key] = e
+                    print(f"{key} failed: {e!r}")
+                if on_done is None:
+                    return
+                try:
+                    await loop.run_in_executor(
+                        on_done_thread, on_done, key, results.get(key, failed.get(key)))
+                except Exception as e:
+                    # A key whose result could not be handled counts as
+                    # failed, rather than stopping the downloads in flight
+                    results.pop(key, None)
+                    failed[key] = e
+                    print(f"{key} on_done failed: {e!r}")
+            await asyncio.gather(*(run(key) for key in keys))
+    return results, failed
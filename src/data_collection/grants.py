@@ -0,0 +1,51 @@
+from pathlib import Path
+from typing import Dict, List, Optional, Union
+
+import pandas as pd
+import pyarrow as pa
+
+
+# Columnar grant table: one row per grant, joined to the REF data on Key
+grant_columns = ['Key', 'funder', 'grant_number', 'amount', 'currency']
+grant_types = {'amount': pa.float64()}
+
+
+def grant_records(key: str, grant_rows: Optional[List[Dict]]) -> List[List]:
+    # Typed rows from parse_impact_page as table rows for one case study
+    return [[key, *(row.get(col) for col in grant_columns[1:])] for row in grant_rows or []]
+
+
+def read_grant_table(path: Union[str, Path]) -> pd.DataFrame:
+    return pd.read_parquet(path)
+
+
+def join_ref_data(grants: pd.DataFrame, ref_data: pd.DataFrame, columns: List[str]) -> pd.DataFrame:
+    meta = ref_data[['REF impact case study identifier', *columns]].rename(
+        columns={'REF impact case study identifier': 'Key'})
+    return grants.merge(meta.drop_duplicates('Key'), on='Key', how='left')
+
+
+def funding_by(
+    grants: pd.DataFrame,
+    ref_data: pd.DataFrame,
+    by: Union[str, List[str]] = 'Unit of assessment name',
+    currency: Optional[str] = 'GBP',
+) -> pd.DataFrame:
+    """Total, count and median of grant amounts grouped by REF data columns,
+    e.g. 'Unit of assessment name' or 'Institution name'.
+
+    Grants with no stated currency are counted as the requested currency,
+    since the REF tables mostly give bare amounts. Pass currency=None to sum
+    across currencies.
+    """
+    by = [by] if isinstance(by, str) else list(by)
+    grants = join_ref_data(grants.dropna(subset=['amount']), ref_data, by)
+    if currency is not None:
+        grants = grants[grants['currency'].isna() | (grants['currency'] == currency)]
+    return (grants.groupby(by)
+            .agg(total_amount=('amount', 'sum'),
+                 median_amount=('amount', 'median'),
+                 grants=('amount', 'size'),
+                 case_studies=('Key', 'nunique'))
+            .sort_values('total_amount', ascending=False)
+            .reset_index())
@@ -0,0 +1,157 @@
+import re
+
+from lxml import html as lxml_html
+
+
+# Parsers for saved impact pages. The flat values match what the Selenium
+# scrapers used to return, so existing aux and grant outputs are unchanged
+
+def _text(element):
+    # Selenium's .text collapses whitespace within each line
+    lines = (" ".join(line.split()) for line in element.text_content().splitlines())
+    return "\n".join(line for line in lines if line)
+
+
+def _grant_table(heading):
+    # The table following a "Grant funding" heading, if any
+    for sibling in heading.itersiblings():
+        if sibling.tag == "table":
+            return sibling
+    return None
+
+
+def grant_table_rows(table):
+    """Rows of a grant funding table as dicts keyed by its header cells.
+
+    Tables without a header row are keyed by column position instead.
+    """
+    rows = list(table.iter("tr"))
+    cells = [[_text(cell) for cell in row.xpath("./th|./td")] for row in rows]
+    if rows and rows[0].find("th") is not None:
+        header, body = cells[0], cells[1:]
+    else:
+        header, body = [str(i) for i in range(max(map(len, cells), default=0))], cells
+    return [dict(zip(header, row)) for row in body if any(row)]
+
+
+currency_symbols = {"£": "GBP", "€": "EUR", "$": "USD"}
+# ISO 4217 codes of currencies grants are plausibly given in. Only these,
+# written next to the number, count as a currency, so that funder acronyms
+# in the same cell (NIH, MRC, ...) do not
+currency_codes = {
+    "GBP", "EUR", "USD", "CHF", "JPY", "CAD", "AUD", "NZD", "SEK", "NOK", "DKK",
+    "ISK", "PLN", "CZK", "HUF", "CNY", "HKD", "SGD", "INR", "KRW", "ZAR", "BRL",
+    "MXN", "ILS", "AED", "SAR", "QAR", "TRY", "RUB", "NGN", "KES", "GHS", "EGP",
+}
+amount_re = re.compile(r"(\d[\d,]*(?:\.\d+)?)\s*(k|m|bn|million|billion)?\b", re.IGNORECASE)
+code_before_re = re.compile(r"\b([A-Z]{3})\s*$")
+code_after_re = re.compile(r"^\s*([A-Z]{3})\b")
+multipliers = {"k": 1e3, "m": 1e6, "million": 1e6, "bn": 1e9, "billion": 1e9}
+
+# Header keywords for the typed grant fields, checked in this order
+grant_fields = (
+    ("grant_number", ("number", "reference")),
+    ("amount", ("value", "amount", "gbp", "£")),
+    ("funder", ("funder", "funding body", "sponsor", "name")),
+)
+# Column order of the REF grant funding table, for tables without headers
+grant_positions = ("funder", "grant_number", "amount")
+
+
+def parse_amount(text):
+    """(amount, currency) from text such as "£1,250,000" or "GBP 1.2m".
+
+    Returns (None, None) when no number is found.
+    """
+    if text is None:
+        return None, None
+    if isinstance(text, (int, float)):
+        return float(text), None
+    match = amount_re.search(text)
+    if match is None:
+        return None, None
+    amount = float(match.group(1).replace(",", ""))
+    if match.group(2):
+        amount *= multipliers[match.group(2).lower()]
+    currency = next((code for symbol, code in currency_symbols.items() if symbol in text), None)
+    if currency is None:
+        for code in (code_before_re.search(text[:match.start()]),
+                     code_after_re.search(text[match.end():])):
+            if code and code.group(1) in currency_codes:
+                currency = code.group(1)
+                break
+    return amount, currency
+
+
+def typed_grant_rows(rows):
+    """Map header-keyed grant table rows to funder, grant_number, amount
+    (float) and currency, matching columns on their header text.
+
+    Rows whose headers match none of the fields, such as the positional
+    keys of a table without a header row, are read in the REF table's
+    column order instead.
+    """
+    typed = []
+    for row in rows:
+        fields = {}
+        for header, value in row.items():
+            name = header.lower()
+            for field, keywords in grant_fields:
+                if field not in fields and any(k in name for k in keywords):
+                    fields[field] = value
+                    break
+        if not fields:
+            fields = dict(zip(grant_positions, row.values()))
+        amount, currency = parse_amount(fields.get("amount"))
+        typed.append({
+            "funder": fields.get("funder") or None,
+            "grant_number": fields.get("grant_number") or None,
+            "amount": amount,
+            "currency": currency,
+        })
+    return typed
+
+
+def parse_impact_page(page_html: str):
+    """Extract the impact metadata and grant funding table in one pass.
+
+    The page is parsed once and walked once. Returns a dict with "aux" (the
+    second impact-metadata definition list as {dt: dd}), "grant" (the grant
+    table as text) and "grant_rows" (the grant table as typed rows, see
+    typed_grant_rows).
+    Missing parts are "None", as the Selenium scrapers returned, and [] for
+    grant_rows.
+    """
+    parsed = {"aux": "None", "grant": "None", "grant_rows": []}
+    try:
+        tree = lxml_html.fromstring(page_html)
+    except Exception:
+        return parsed
+    metadata, grant_table = [], None
+    for element in tree.iter():
+        if not isinstance(element.tag, str):
+            continue
+        if "impact-metadata" in element.get("class", "").split():
+            metadata.append(element)
+        elif (grant_table is None and element.tag == "h4"
+              and element.text == "Grant funding"):
+            grant_table = _grant_table(element)
+    if len(metadata) > 1:
+        dt_texts = [_text(dt) for dt in metadata[1].iter("dt")]
+        dd_texts = [_text(dd) for dd in metadata[1].iter("dd")]
+        parsed["aux"] = dict(zip(dt_texts, dd_texts))
+    if grant_table is not None:
+        parsed["grant"] = "\n".join(
+            " ".join(_text(cell) for cell in row.xpath("./th|./td"))
+            for row in grant_table.iter("tr")
+        )
+        parsed["grant_rows"] = typed_grant_rows(grant_table_rows(grant_table))
+    return parsed
+
+
+def scrape_secondary_info_from_html(page_html: str):
+    return parse_impact_page(page_html)["aux"]
+
+
+def scrape_grant_info_from_html(page_html: str):
+    return parse_impact_page(page_html)["grant"]
@@ -0,0 +1,194 @@
+import itertools
+import json
+import os
+import re
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from pathlib import Path
+from typing import Iterable, Iterator, Optional, Tuple
+
+import fitz
+
+from crawl_journal import file_sha256
+
+
+# Bump whenever a change to the cleaning or extraction below changes what
+# read_pdf_and_perform_regex returns, so cached parses are invalidated
+parser_version = '2'
+
+
+# Patterns compiled once; line classification applies them in the same order
+# as the original sequence of re.sub passes
+digit_b_re = re.compile(r'\d{1}B')
+start_re = re.compile(r'^Period.*undertaken')
+end_re = re.compile(r'^Period when the claimed.*')
+backslash_s_re = re.compile(r'\\s+')
+summary_re = re.compile(r'1. Summary')
+anomaly_re = re.compile(r' HEI:|Period when|Details of|^Name(s)|^Roles(s)')
+
+
+def extract_based_on_indices(text, indices_1, indices_2):
+        indices = dict(zip(indices_1, indices_2))
+
+        result = [text[(key+1):value] for key, value in indices.items()]
+        result = list(itertools.chain.from_iterable(result))
+        result = [n.strip() for n in result if n != '']
+        return result
+
+
+def clean_line(line):
+    line = digit_b_re.sub('', line)
+    if line.startswith('Name'):
+        line = 'Name:'
+    elif line.startswith('Role'):
+        line = 'Role:'
+    elif line.startswith('Period'):
+        if start_re.match(line):
+            line = start_re.sub('Start:', line, count=1)
+        elif end_re.match(line):
+            line = 'End:'
+        else:
+            line = 'Period:'
+    return backslash_s_re.sub('', line)
+
+
+def read_pdf_and_perform_regex(pdf_path):
+    # Open the PDF file
+    doc = fitz.open(pdf_path)
+
+    # Get first page
+    rel_text = doc[0].get_text().split('\n')
+
+    # Clean and classify lines in a single pass
+    rel_text = [r.strip() for r in rel_text]
+    clean_text = []
+    name_indices, role_indices, period_indices, end_indices, summary_indices = [], [], [], [], []
+    for line in rel_text:
+        line = clean_line(line)
+        if line == '' or line == 'submitting HEI:':
+            continue
+        i = len(clean_text)
+        clean_text.append(line)
+        if line.startswith('Name:'):
+            name_indices.append(i)
+        elif line.startswith('Role:'):
+            role_indices.append(i)
+        elif line.startswith('Period:'):
+            period_indices.append(i)
+        elif line.startswith('End:'):
+            end_indices.append(i)
+        if summary_re.match(line):
+            summary_indices.append(i)
+    if end_indices == []:
+        end_indices = summary_indices
+
+    if name_indices and role_indices:
+        names = extract_based_on_indices(clean_text, name_indices, role_indices)
+    else:
+        print("No names")
+        print(pdf_path)
+        names = None
+
+    if role_indices and period_indices:
+        roles = extract_based_on_indices(clean_text, role_indices, period_indices)
+    else:
+        print("No roles")
+        print(pdf_path)
+        roles = None
+
+    if period_indices and end_indices:
+        periods = extract_based_on_indices(clean_text, period_indices, end_indices)
+        periods = [p for p in periods if p != 'by' and p != 'employed']
+    else:
+        print("No periods")
+        print(pdf_path)
+        periods = None
+
+    # In some cases there are weird anomalies. Then just extract everything between "Names" and the next section
+    if names == []:
+        names = rel_text[name_indices[0]:end_indices[0]]
+        names = [n for n in names if n != '' and not anomaly_re.match(n)]
+
+    # Close document
+    doc.close()
+
+    return {'names': names,
+            'roles': roles,
+            'periods': periods,
+            'raw': clean_text[:end_indices[0]]}
+
+
+class ParseCache:
+    """Parse results on disk, keyed by PDF content hash and parser version."""
+
+    def __init__(self, cache_dir):
+        self.cache_dir = Path(cache_dir)
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+
+    def _path(self, sha256):
+        return self.cache_dir / f'{sha256}-v{parser_version}.json'
+
+    def get(self, sha256):
+        path = self._path(sha256)
+        if not path.exists():
+            return None
+        with open(path, 'r') as f:
+            return json.load(f)
+
+    def put(self, sha256, result):
+        path = self._path(sha256)
+        tmp_path = path.with_name(path.name + '.tmp')
+        with open(tmp_path, 'w') as f:
+            json.dump(result, f)
+        os.replace(tmp_path, path)
+
+
+def _parse_chunk(paths):
+    # Exceptions are returned as text so one bad PDF does not fail its chunk
+    results = []
+    for path in paths:
+        try:
+            results.append((path, read_pdf_and_perform_regex(path), None))
+        except Exception as e:
+            results.append((path, None, repr(e)))
+    return results
+
+
+def parse_pdfs(
+    pdf_paths: Iterable,
+    max_workers: Optional[int] = None,
+    chunksize: int = 32,
+    cache: Optional[ParseCache] = None,
+) -> Iterator[Tuple[object, Optional[dict], Optional[str]]]:
+    """Parse PDFs in a process pool, yielding (path, result, error) as each
+    chunk finishes so callers can write results out while parsing continues.
+    With a cache, PDFs parsed before by the same parser version are yielded
+    straight from it and only the rest are parsed."""
+    pdf_paths = list(pdf_paths)
+    hashes = {}
+    if cache is not None:
+        misses = []
+        for path in pdf_paths:
+            hashes[path] = file_sha256(path)
+            result = cache.get(hashes[path])
+            if result is None:
+                misses.append(path)
+            else:
+                yield path, result, None
+        pdf_paths = misses
+    max_workers = max_workers or os.cpu_count() or 1
+    chunks = [pdf_paths[i:i + chunksize] for i in range(0, len(pdf_paths), chunksize)]
+    if max_workers == 1 or len(chunks) <= 1:
+        parsed = (result for chunk in chunks for result in _parse_chunk(chunk))
+        executor = None
+    else:
+        executor = ProcessPoolExecutor(max_workers=max_workers)
+        futures = [executor.submit(_parse_chunk, chunk) for chunk in chunks]
+        parsed = (result for future in as_completed(futures) for result in future.result())
+    try:
+        for path, result, error in parsed:
+            if cache is not None and error is None:
+                cache.put(hashes[path], result)
+            yield path, result, error
+    finally:
+        if executor is not None:
+            executor.shutdown()
@@ -1,270 +1,267 @@
-import itertools
+import argparse
+import asyncio
 import re
 import os
-import numpy as np
 import pandas as pd
-import fitz
-from selenium import webdriver
-from selenium.webdriver.chrome.service import Service
-from webdriver_manager.chrome import ChromeDriverManager
-from selenium.webdriver.chrome.options import Options
-from selenium.webdriver.common.by import By
 from pathlib import Path
 import json
+import sys
 import time
 
+# Makes src importable, for the code the pipeline's stages share in src/common
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
 
-def extract_based_on_indices(text, indices_1, indices_2):
-        indices = dict(zip(indices_1, indices_2))
-
-        result = [text[(key+1):value] for key, value in indices.items()]
-        result = list(itertools.chain.from_iterable(result))
-        result = [n.strip() for n in result if n != '']
-        return result
-
-
-def read_pdf_and_perform_regex(pdf_path):
-    # Open the PDF file
-    doc = fitz.open(pdf_path)
-    
-    # Get first page
-    rel_text = doc[0].get_text().split('\n')
-    
-    # Clean lines
-    rel_text = [r.strip() for r in rel_text]
-    clean_text = [re.sub(r'\d{1}B', '', r) for r in rel_text]
-    clean_text = [re.sub(r'^Name.*', 'Name:', string) for string in clean_text]
-    clean_text = [re.sub(r'^Role.*', 'Role:', string) for string in clean_text]
-    clean_text = [re.sub(r'^Period.*undertaken', 'Start:', string) for string in clean_text]
-    clean_text = [re.sub(r'^Period when the claimed.*', 'End:', string) for string in clean_text]
-    clean_text = [re.sub(r'^Period.*', 'Period:', string) for string in clean_text]
-    clean_text = [re.sub(r'\\s+', '', string) for string in clean_text]
-    clean_text = [string for string in clean_text if string != '']
-    clean_text = [string for string in clean_text if string != 'submitting HEI:']
-    
-    # Find all occurrences of "Name:" and "Role:" and end index
-    name_indices = [i for i, string in enumerate(clean_text) if re.match(r'^Name:', string)]
-    role_indices = [i for i, string in enumerate(clean_text) if re.match(r'^Role:', string)]
-    period_indices = [i for i, string in enumerate(clean_text) if re.match(r'^Period:', string)]
-    end_indices = [i for i, string in enumerate(clean_text) if re.match(r'^End:', string)]
-    if end_indices == []:
-        end_indices = [i for i, string in enumerate(clean_text) if re.match(r'1. Summary', string)]
-    
-    if name_indices and role_indices:
-        names = extract_based_on_indices(clean_text, name_indices, role_indices)
-    else:
-        print("No names")
-        print(p)
-        names = None
-    
-    if role_indices and period_indices:
-        roles = extract_based_on_indices(clean_text, role_indices, period_indices)
-    else:
-        print("No roles")
-        print(p)
-        roles = None
-    
-    if period_indices and end_indices:
-        periods = extract_based_on_indices(clean_text, period_indices, end_indices)
-        periods = [p for p in periods if p != 'by' and p != 'employed']
-    else:
-        print("No periods")
-        print(p)
-        periods = None
-    
-    # In some cases there are weird anomalies. Then just extract everything between "Names" and the next section
-    if names == []:
-        names = rel_text[name_indices[0]:end_indices[0]]
-        names = [n for n in names if n != '' and not re.match(r' HEI:|Period when|Details of|^Name(s)|^Roles(s)', n)]
-    
-    # Close document
-    doc.close()
-    
-    return {'names': names,
-            'roles': roles,
-            'periods': periods,
-            'raw': clean_text[:end_indices[0]]}
+from common.profiling import Profiler
+from crawl_journal import CrawlJournal
+from fetcher import PdfFetchError, fetch_case_studies
+from grants import grant_columns, grant_records, grant_types
+from page_parsing import parse_impact_page
+from pdf_parsing import ParseCache, parse_pdfs, parser_version
+from sinks import KeyedJsonlSink, TableSink, author_columns, author_rows
+
+
+# Stages selectable from the command line: "metadata" scrapes the impact
+# pages only, "pdfs" downloads and parses the case study PDFs
+crawl_stages = ('metadata', 'pdfs', 'all')
+
+# urls
+head = 'https://results2021.ref.ac.uk/impact/'
 
 
 def download_pdf_from_url(driver):
+    from selenium.webdriver.common.by import By
     potential_elements = driver.find_elements(By.TAG_NAME, 'a')
     pattern = re.compile(r"Download case study PDF")
     button = [p for p in potential_elements if pattern.search(p.text)][0]
     button.click()
 
 
-def scrape_secondary_info_from_url(driver):
-    try:
-        secondary_table = driver.find_elements(By.CLASS_NAME, "impact-metadata")
-        element = secondary_table[1]
-        
-        # Find all <dt> elements within the <dl> element
-        dt_elements = element.find_elements(By.TAG_NAME, 'dt')
-
-        # Initialize a list to hold the text of each <dt> element
-        dt_texts = [dt.text for dt in dt_elements]
-        
-        # Find all <dd> elements within the <dl> element
-        dd_elements = element.find_elements(By.TAG_NAME, 'dd')
-
-        # Initialize a list to hold the text of each <dd> element
-        dd_texts = [dd.text for dd in dd_elements]
-        
-        return dict(zip(dt_texts, dd_texts))
-    except:
-        return "None"
-
-
-def scrape_grant_info_from_url(driver):
-    try:
-        grant_funding_table = driver.find_element(
-            By.XPATH, "//h4[text()='Grant funding']/following-sibling::table")
-        return grant_funding_table.text
-    except:
-        return "None"
+def wait_for_download(directory, before, timeout=120):
+    # The browser picks its own file name, so the new download is whichever
+    # PDF appeared since the click, once Chrome has finished writing it
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        current = set(os.listdir(directory))
+        new_pdfs = [f for f in current - before if f.endswith('.pdf')]
+        if new_pdfs and not any(f.endswith('.crdownload') for f in current):
+            return Path(directory) / new_pdfs[0]
+        time.sleep(0.2)
+    raise TimeoutError(f"No PDF downloaded to {directory} within {timeout}s")
 
 
 def make_or_load_cw(path, keys):
+    # PDFs are saved as <key>.pdf, so the mapping is a lookup per key. A
+    # cw file from older crawls, which matched files to keys by mtime, is
+    # still honoured for keys that have no <key>.pdf; every key maps from
+    # one file only, so it is parsed once.
     file_path = path / 'cw_pdf_key.jsonl'
+    cw = {}
     if os.path.exists(file_path):
-        # Reading JSON Lines file
         with open(file_path, 'r') as f:
             cw = json.load(f)
-        
-    else:
-        pdf_files = [pdf for pdf in os.listdir(path) if '.pdf' in pdf]
-        pdf_files_by_cd = sorted(pdf_files, key=lambda x: os.path.getmtime(os.path.join(output_path, x)))
-
-        cw = dict(zip(pdf_files_by_cd, keys))
-        
-        with open(file_path, 'w') as f:
-            json.dump(cw, f)
-    
+    named = {key for key in keys if (path / f'{key}.pdf').exists()}
+    cw = {pdf: key for pdf, key in cw.items() if key not in named}
+    cw.update({f'{key}.pdf': key for key in named})
+    with open(file_path, 'w') as f:
+        json.dump(cw, f)
     return cw
 
 
-if __name__ == "__main__":
-
-    # Paths
+def project_data_path():
     current_file = Path(__file__).resolve()
     project_root = current_file.parent
     while not (project_root / '.git').exists():
         project_root = project_root.parent
+    return project_root / 'data'
 
-    data_path = project_root / 'data'
-    output_path = data_path /  'ics_pdfs'
+
+def start_driver(download_dir):
+    # Selenium is imported here so metadata-only crawls never need a browser
+    from selenium import webdriver
+    from selenium.webdriver.chrome.service import Service
+    from selenium.webdriver.chrome.options import Options
+    from webdriver_manager.chrome import ChromeDriverManager
 
     # Set up Chrome options
     chrome_options = Options()
-    prefs = {"download.default_directory" : str(output_path)}
+    prefs = {"download.default_directory" : str(download_dir)}
     chrome_options.add_experimental_option("prefs", prefs)
 
     # Initialize WebDriver
     service = Service(ChromeDriverManager().install())
-    driver = webdriver.Chrome(service=service, options=chrome_options)
+    return webdriver.Chrome(service=service, options=chrome_options)
+
+
+def fetch_stage(journal, keys, page_path, output_path, stage='all', profiler=None):
+    """Fetch impact pages, and PDFs unless stage is "metadata", over HTTP.
+
+    Every key costs one page request, plus one PDF request for keys whose
+    PDF is still pending. Keys whose PDF could not be fetched over HTTP
+    fall back to Selenium; metadata-only crawls never start a browser.
+    """
+    def journal_fetch(key, fetch):
+        # Failures are recorded against the stage that failed, so a resumed
+        # crawl retries only that stage
+        if isinstance(fetch, Exception) and not isinstance(fetch, PdfFetchError):
+            journal.record_failure(key, 'page', fetch)
+            return
+        page_file = fetch.page if isinstance(fetch, PdfFetchError) else fetch['page']
+        page = parse_impact_page(page_file.read_text(encoding='utf-8'))
+        journal.record_page(key, page['aux'], page['grant'], page_file,
+                            grant_rows=page['grant_rows'])
+        if isinstance(fetch, PdfFetchError):
+            journal.record_failure(key, 'pdf', fetch.cause)
+        elif fetch['pdf'] is not None:
+            journal.record_pdf(key, fetch['pdf'])
+
+    pdf_keys = set(journal.pending(keys, 'pdf')) if stage != 'metadata' else set()
+    page_keys = set(journal.pending(keys, 'page')) if stage != 'pdfs' else set()
+    profiler = profiler or Profiler('crawl')
+    to_fetch = [key for key in keys if key in pdf_keys | page_keys]
+    with profiler.stage('page_fetch', items=len(to_fetch)):
+        fetched, failed = asyncio.run(
+            fetch_case_studies(to_fetch, head, page_path, output_path,
+                               on_done=journal_fetch, pdf_keys=pdf_keys))
+
+    # Selenium is only used for the PDFs the HTTP fetcher could not get
+    failed = [key for key in keys if key in failed and key in pdf_keys]
+    if not failed:
+        return
+    with profiler.stage('selenium_fetch', items=len(failed)):
+        driver = start_driver(output_path)
+        try:
+            for key in failed:
+                print(key)
+                url = head + key
+                driver.get(url)
+                time.sleep(1)
+
+                ## download pdf, renamed after its key once it has arrived
+                before = set(os.listdir(output_path))
+                try:
+                    download_pdf_from_url(driver)
+                    pdf_path = output_path / f'{key}.pdf'
+                    os.replace(wait_for_download(output_path, before), pdf_path)
+                    journal.record_pdf(key, pdf_path)
+                except (IndexError, TimeoutError) as e:
+                    # No download button, or no file arrived
+                    journal.record_failure(key, 'pdf', e)
+
+                ## collect info from the rendered page in one parse, rather than
+                ## one WebDriver round-trip per element
+                page = parse_impact_page(driver.page_source)
+                journal.record_page(key, page['aux'], page['grant'],
+                                    grant_rows=page['grant_rows'])
+        finally:
+            # Chrome is closed whatever stops the fallback
+            driver.quit()
+
+
+def parse_stage(journal, keys, cw, output_path, profiler=None):
+    ## Read pdfs in parallel, journalling each result as it arrives
+    # Unchanged PDFs already parsed by this parser version come from the cache
+    to_parse = set(journal.pending(keys, 'parse', parser_version=parser_version))
+    key_by_path = {output_path / p: cw_key for p, cw_key in cw.items() if cw_key in to_parse}
+    parse_cache = ParseCache(output_path / 'parse_cache')
+    profiler = profiler or Profiler('crawl')
+    with profiler.stage('pdf_parse', items=len(key_by_path)):
+        for pdf_path, result, error in parse_pdfs(key_by_path, cache=parse_cache):
+            if error is None:
+                journal.record_parsed(key_by_path[pdf_path], result, parser_version)
+            else:
+                print(f"Failed to parse {pdf_path}: {error}")
+                journal.record_failure(key_by_path[pdf_path], 'parse', error)
+
+
+def write_metadata(journal, output_path):
+    ## Write aux and grants
+    with KeyedJsonlSink({None: output_path / 'aux_data.jsonl'}) as sink:
+        for key, value in journal.iter_column('aux', 'page'):
+            sink.write(key, value)
+    with KeyedJsonlSink({None: output_path / 'grant_data.jsonl'}) as sink:
+        for key, value in journal.iter_column('grant_info', 'page'):
+            sink.write(key, value)
+
+    ## Typed grant rows as a columnar table, for group-bys with grants.py
+    with TableSink(grant_columns, parquet_path=output_path / 'grant_data.parquet',
+                   types=grant_types) as sink:
+        for key, grant_rows in journal.iter_column('grant_rows', 'page'):
+            sink.write_rows(grant_records(key, grant_rows))
+
+
+def write_authors(journal, data, cw, output_path):
+    ## Write names, roles, periods and raw text in one pass over the results
+    with KeyedJsonlSink({'names': output_path / 'author_data.jsonl',
+                         'roles': output_path / 'role_data.jsonl',
+                         'periods': output_path / 'period_data.jsonl',
+                         'raw': output_path / 'raw_data.jsonl'}) as sink:
+        for key, value in journal.iter_column('parsed', 'parse'):
+            sink.write(key, value)
+
+    ## Author table, one row per author of every downloaded PDF, streamed
+    ## in PDF order rather than built from one DataFrame per key
+    meta = data.set_index('REF impact case study identifier')[
+        ['Institution name', 'Unit of assessment name']]
+    meta = meta[~meta.index.duplicated()].to_dict('index')
+    written_keys = []
+    with TableSink(author_columns,
+                   parquet_path=output_path / 'author_data_full.parquet',
+                   xlsx_path=output_path / 'author_data_full.xlsx') as sink:
+        for pdf_title, key in cw.items():
+            if key not in meta:
+                continue
+            value = journal.get(key, 'parsed', 'parse')
+            rows = author_rows(key, value) if value is not None else [[key, None, None, None]]
+            if value is not None:
+                written_keys.append(key)
+            sink.write_rows([pdf_title, *row, meta[key]['Institution name'],
+                             meta[key]['Unit of assessment name'], head + key]
+                            for row in rows)
+
+    ## Check merge went as expected: every parsed key exactly once
+    assert sorted(written_keys) == sorted(journal.column('key', 'parse'))
+
+
+def crawl(stage='all', data_path=None):
+    """Run the selected crawl stages for every key in enhanced_ref_data.csv.
+
+    Progress is journalled per key, so stages completed by earlier runs are
+    skipped and only missing or failed keys are retried.
+    """
+    if stage not in crawl_stages:
+        raise ValueError(f"Unknown stage '{stage}', expected one of {crawl_stages}")
+    data_path = Path(data_path) if data_path is not None else project_data_path()
+    output_path = data_path /  'ics_pdfs'
+    page_path = data_path / 'ics_pages'
 
     # Read data
     data = pd.read_csv(data_path / 'final' / 'enhanced_ref_data.csv')
     keys = data['REF impact case study identifier']
-    
-    # urls
-    head = 'https://results2021.ref.ac.uk/impact/'
-
-    # setup emtpy dicts for the results
-    grant_dict = dict()
-    aux_dict = dict()
-    result_dict = dict()
-    
-    for key in keys:
-        print(key)
-        url = head + key
-        driver.get(url)
-        time.sleep(1)
-        
-        ## download pdf
-        download_pdf_from_url(driver)
-        
-        ## collect info
-        aux_dict[key] = scrape_secondary_info_from_url(driver)
-        grant_dict[key] = scrape_grant_info_from_url(driver)
-
-    cw = make_or_load_cw(output_path, keys)
-    
-    ## Read pdfs
-    for p in cw.keys():
-        cw_key = cw[p]
-        result_dict[cw_key]= read_pdf_and_perform_regex(output_path / p)
-
-    ## Write names
-    with open(output_path / 'author_data.jsonl', 'w') as file:
-        for key, value in result_dict.items():
-            json_line = json.dumps({key: value['names']})
-            file.write(json_line + '\n')
-
-    ## Write roles
-    with open(output_path / 'role_data.jsonl', 'w') as file:
-        for key, value in result_dict.items():
-            json_line = json.dumps({key: value['roles']})
-            file.write(json_line + '\n')
-    
-    ## Write periods
-    with open(output_path / 'period_data.jsonl', 'w') as file:
-        for key, value in result_dict.items():
-            json_line = json.dumps({key: value['periods']})
-            file.write(json_line + '\n')
-    
-    ## Write raw
-    with open(output_path / 'raw_data.jsonl', 'w') as file:
-        for key, value in result_dict.items():
-            json_line = json.dumps({key: value['raw']})
-            file.write(json_line + '\n')
-    
-    ## Write aux
-    with open(output_path / 'aux_data.jsonl', 'w') as file:
-        for key, value in aux_dict.items():
-            json_line = json.dumps({key: value})
-            file.write(json_line + '\n')
-
-    ## Write grants
-    with open(output_path / 'grant_data.jsonl', 'w') as file:
-        for key, value in grant_dict.items():
-            json_str = json.dumps({key: value})
-            file.write(json_str + '\n')
-    
-    ## Make excel version
-    df_list = []
-
-    for key, value in result_dict.items():
-        try:
-            names = result_dict[key].get('names', [None])
-            periods = result_dict[key].get('periods', [None] * len(names))  # Prepare periods, defaulting to None
-            roles = result_dict[key].get('roles', [None] * len(names))  # Prepare roles, defaulting to None
-            
-            # Adjust periods and roles lists based on matching lengths with names
-            if len(periods) != len(names):  # If periods length doesn't match names, replace with None
-                periods = [None] * len(names)
-            if len(roles) != len(names):  # If roles length doesn't match names, replace with None
-                roles = [None] * len(names)
-
-            formatted = [[key, names[i], roles[i], periods[i]] for i in range(len(names))]
-        except TypeError:
-            formatted = [[key, None, None, None]]
-        if not formatted:
-            formatted = [[key, None, None, None]]
-        df_list.append(pd.DataFrame(formatted, columns=['Key', 'Name', 'Role', 'Period']))
-    
-    result_df = pd.concat(df_list)
-    cw_df = pd.DataFrame([[key, value] for key, value in cw.items()]).\
-        rename(columns = {0: 'Pdf_title', 1: 'Key'})
-    merge_df = data[['Institution name', 'Unit of assessment name',
-                     'REF impact case study identifier']].rename(
-                         columns = {'REF impact case study identifier': 'Key'})
-    
-    final_df = pd.merge(cw_df, result_df, how = 'left', on = 'Key').\
-        merge(merge_df, on = 'Key')
-    final_df['URL'] = head + final_df['Key']
-    
-    ## Check merge went as expected
-    assert final_df.shape[0] == result_df.shape[0]
-    
-    final_df.to_excel(output_path / 'author_data_full.xlsx')
\ No newline at end of file
+
+    profiler = Profiler('crawl')
+    with CrawlJournal(output_path / 'crawl_journal.sqlite') as journal:
+        fetch_stage(journal, keys, page_path, output_path, stage, profiler)
+        if stage != 'pdfs':
+            with profiler.stage('write_metadata'):
+                write_metadata(journal, output_path)
+        if stage != 'metadata':
+            cw = make_or_load_cw(output_path, keys)
+            parse_stage(journal, keys, cw, output_path, profiler)
+            with profiler.stage('write_authors'):
+                write_authors(journal, data, cw, output_path)
+    profiler.write_trace(output_path / f'crawl_profile_{stage}.json', stage=stage)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Crawl REF 2021 impact case studies.")
+    parser.add_argument('--stage', choices=crawl_stages, default='all',
+                        help="metadata: impact page tables only; pdfs: download and "
+                             "parse case study PDFs; all: both (default)")
+    parser.add_argument('--data-path', default=None,
+                        help="data directory, defaults to <project root>/data")
+    args = parser.parse_args(argv)
+    crawl(args.stage, args.data_path)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,129 @@
+import json
+import os
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+
+# Columns of author_data_full, in the order the merged spreadsheet had them
+author_columns = ['Pdf_title', 'Key', 'Name', 'Role', 'Period',
+                  'Institution name', 'Unit of assessment name', 'URL']
+
+
+def author_rows(key: str, value: Dict) -> List[List]:
+    # One [key, name, role, period] row per author, with roles and periods
+    # blanked when their count does not line up with the names
+    try:
+        names = value.get('names', [None])
+        periods = value.get('periods', [None] * len(names))
+        roles = value.get('roles', [None] * len(names))
+        if len(periods) != len(names):
+            periods = [None] * len(names)
+        if len(roles) != len(names):
+            roles = [None] * len(names)
+        formatted = [[key, names[i], roles[i], periods[i]] for i in range(len(names))]
+    except TypeError:
+        formatted = [[key, None, None, None]]
+    if not formatted:
+        formatted = [[key, None, None, None]]
+    return formatted
+
+
+class KeyedJsonlSink:
+    """Writes {key: record[field]} lines for several fields at once, one file
+    per field, so every output is produced in a single pass over the records."""
+
+    def __init__(self, paths: Dict[str, Path]):
+        self.files = {field: open(path, 'w') for field, path in paths.items()}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def write(self, key: str, record):
+        for field, f in self.files.items():
+            value = record if field is None else record[field]
+            f.write(json.dumps({key: value}) + '\n')
+
+    def close(self):
+        for f in self.files.values():
+            f.close()
+
+
+class TableSink:
+    """Streams rows to JSONL and Parquet as they are written.
+
+    Rows are buffered only up to one Parquet row group. The xlsx copy, if
+    requested, is made from the finished Parquet file on close, since
+    openpyxl cannot append to a workbook incrementally.
+    """
+
+    def __init__(
+        self,
+        columns: List[str],
+        jsonl_path: Optional[Path] = None,
+        parquet_path: Optional[Path] = None,
+        xlsx_path: Optional[Path] = None,
+        row_group_size: int = 10000,
+        types: Optional[Dict[str, pa.DataType]] = None,
+    ):
+        if xlsx_path is not None and parquet_path is None:
+            raise ValueError("xlsx output is made from the Parquet output, pass parquet_path too")
+        self.columns = columns
+        self.parquet_path = parquet_path
+        self.xlsx_path = xlsx_path
+        self.row_group_size = row_group_size
+        self.jsonl_file = open(jsonl_path, 'w') if jsonl_path is not None else None
+        # Columns are strings unless given another Arrow type
+        types = types or {}
+        self.schema = pa.schema([(col, types.get(col, pa.string())) for col in columns])
+        self.parquet_writer = None
+        if parquet_path is not None:
+            self.parquet_tmp = Path(str(parquet_path) + '.tmp')
+            self.parquet_writer = pq.ParquetWriter(str(self.parquet_tmp), self.schema)
+        self.buffer = []
+        self.rows_written = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def write_rows(self, rows: Iterable[List]):
+        for row in rows:
+            if self.jsonl_file is not None:
+                self.jsonl_file.write(json.dumps(dict(zip(self.columns, row))) + '\n')
+            if self.parquet_writer is not None:
+                self.buffer.append(row)
+            self.rows_written += 1
+        if len(self.buffer) >= self.row_group_size:
+            self._flush()
+
+    def _flush(self):
+        if not self.buffer:
+            return
+        arrays = []
+        for field, column in zip(self.schema, zip(*self.buffer)):
+            if pa.types.is_string(field.type):
+                column = [None if value is None else str(value) for value in column]
+            arrays.append(pa.array(column, type=field.type))
+        self.parquet_writer.write_table(pa.Table.from_arrays(arrays, schema=self.schema))
+        self.buffer = []
+
+    def close(self):
+        if self.jsonl_file is not None:
+            self.jsonl_file.close()
+            self.jsonl_file = None
+        if self.parquet_writer is not None:
+            self._flush()
+            self.parquet_writer.close()
+            self.parquet_writer = None
+            os.replace(self.parquet_tmp, self.parquet_path)
+            if self.xlsx_path is not None:
+                pd.read_parquet(self.parquet_path).to_excel(self.xlsx_path)
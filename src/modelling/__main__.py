@@ -0,0 +1,5 @@
+# python src/modelling <clean|embed|sweep|reduce|plot> ...
+from cli import main
+
+
+main()
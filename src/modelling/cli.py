@@ -0,0 +1,141 @@
+import argparse
+import sys
+from typing import List, Optional
+
+
+# Subcommands import their modules (and through them numpy, pyarrow, torch or
+# BERTopic) only when they run, so --help and argument errors are immediate
+
+def clean(args):
+    from columnar_cache import write_columns
+    from topic_modelling import column_sets, prepare_full_texts
+
+    df = prepare_full_texts(args.excel_path, column_sets[args.columns], args.frequencies)
+    write_columns(df, args.output or f"data/text_processed/{args.columns}.arrow")
+
+
+def embed(args):
+    from embedding_cache import EmbeddingCache
+    from sentence_transformers import SentenceTransformer
+    from streaming import embed_corpora
+    from topic_modelling import column_sets
+
+    if len(args.corpora) % 2:
+        sys.exit("embed: corpora must be given as <name> <workbook> pairs")
+    embed_corpora(
+        list(zip(args.corpora[::2], args.corpora[1::2])),
+        SentenceTransformer(args.model),
+        args.output,
+        col_index=column_sets[args.columns],
+        batch_size=args.batch_size,
+        embedding_cache=EmbeddingCache(args.model),
+    )
+
+
+def sweep(args):
+    from topic_modelling import sweep_workbook
+
+    sweep_workbook(
+        args.excel_path,
+        args.target_dir,
+        clean_run=args.clean_run,
+        calculate_frequencies=args.frequencies,
+        embedding_mode=args.embedding_mode,
+        max_workers=args.workers,
+        backend=args.backend,
+        embedding_model_name=args.model,
+        random_states=args.random_state,
+        evaluation=args.evaluation,
+        dbcv=args.dbcv,
+    )
+
+
+def reduce(args):
+    from topic_reduce import reduce_topics
+
+    reduce_topics(args.target_dir, args.model_name, args.docs_path,
+                  save=args.save, export_excel=args.export_excel)
+
+
+def plot(args):
+    from figures import render_saved_models
+
+    render_saved_models(args.target_dir, model_names=args.models, metric=args.metric)
+
+
+def random_state(value: str) -> Optional[int]:
+    return None if value.lower() == "none" else int(value)
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(
+        prog="modelling", description="Topic modelling of REF impact case studies.")
+    commands = parser.add_subparsers(dest="command", required=True)
+    # Keys of topic_modelling.column_sets, repeated so --help imports nothing
+    column_choices = ['column12345', 'columns1', 'columns2', 'columns3', 'columns4',
+                      'columns5', 'columns23', 'columns45', 'columns124']
+
+    p = commands.add_parser("clean", help="clean and join the sections of a workbook")
+    p.add_argument("excel_path")
+    p.add_argument("--columns", choices=column_choices, default="column12345")
+    p.add_argument("--frequencies", action="store_true",
+                   help="also write n-gram frequencies and text_processed.xlsx")
+    p.add_argument("--output", help="Arrow file for the cleaned texts "
+                                    "(default data/text_processed/<columns>.arrow)")
+    p.set_defaults(func=clean)
+
+    p = commands.add_parser("embed", help="stream corpora into a memory-mapped embedding file")
+    p.add_argument("output", help="raw float32 file, with .json and .arrow sidecars")
+    p.add_argument("corpora", nargs="+", metavar="NAME WORKBOOK",
+                   help="one or more corpus name and workbook pairs")
+    p.add_argument("--columns", choices=column_choices, default="column12345")
+    p.add_argument("--batch-size", type=int, default=512)
+    p.add_argument("--model", default="all-MiniLM-L6-v2")
+    p.set_defaults(func=embed)
+
+    p = commands.add_parser("sweep", help="fit BERTopic over every column set and n_neighbors")
+    p.add_argument("excel_path")
+    p.add_argument("target_dir")
+    p.add_argument("--clean-run", action="store_true",
+                   help="delete target_dir first instead of resuming")
+    p.add_argument("--frequencies", action="store_true")
+    p.add_argument("--embedding-mode", choices=["Full_Text", "Section_Pooled"],
+                   default="Full_Text")
+    p.add_argument("--workers", type=int, default=1)
+    p.add_argument("--backend", choices=["auto", "cuml", "cpu"], default="auto")
+    p.add_argument("--model", default="all-MiniLM-L6-v2")
+    p.add_argument("--random-state", type=random_state, nargs="+", default=[77],
+                   help="UMAP random states to sweep; 'none' lets umap-learn use every "
+                        "thread, at the cost of reproducible reductions")
+    # evaluation.evaluation_modes, repeated so --help imports nothing
+    p.add_argument("--evaluation", choices=["exact", "chunked", "sampled"], default="chunked",
+                   help="how the silhouette score is computed")
+    p.add_argument("--dbcv", action="store_true",
+                   help="also compute DBCV, which is quadratic in cluster size")
+    p.set_defaults(func=sweep)
+
+    p = commands.add_parser("reduce", help="reduce outliers of a fitted model over thresholds")
+    p.add_argument("target_dir")
+    p.add_argument("model_name")
+    p.add_argument("docs_path", help=".xlsx or .arrow output of the sweep for this model")
+    p.add_argument("--save", default="All",
+                   help="thresholds whose models to save: All, None or a comma-separated list")
+    p.add_argument("--export-excel", action="store_true")
+    p.set_defaults(func=reduce)
+
+    p = commands.add_parser("plot", help="render figures for saved models")
+    p.add_argument("target_dir")
+    p.add_argument("models", nargs="*",
+                   help="model names (default: the best model per column set)")
+    p.add_argument("--metric", default="silhouette_score")
+    p.set_defaults(func=plot)
+    return parser
+
+
+def main(argv: Optional[List[str]] = None):
+    args = build_parser().parse_args(argv)
+    args.func(args)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,271 @@
+import hashlib
+import json
+import os
+import shutil
+from pathlib import Path
+from typing import Iterator, List, Optional, Union
+
+import numpy
+import pandas
+import pyarrow
+import pyarrow.ipc
+from loguru import logger
+
+
+default_cache_dir = os.path.join(os.getcwd(), 'data', 'columnar_cache')
+excel_suffixes = ('.xlsx', '.xlsm', '.xls')
+
+
+def file_sha256(path: Union[str, Path], block_size: int = 1 << 20) -> str:
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(block_size), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def _arrow_safe(df: pandas.DataFrame) -> pandas.DataFrame:
+    # Excel columns often mix numbers and strings, which Arrow cannot hold in
+    # one column, so every non-null value of an object column becomes a string
+    df = df.copy()
+    for col in df.columns[df.dtypes == object]:
+        df[col] = df[col].where(df[col].isna(), df[col].astype(str))
+    df.columns = [str(col) for col in df.columns]
+    return df
+
+
+def _to_pandas(table: pyarrow.Table) -> pandas.DataFrame:
+    # Nulls in string columns come back from Arrow as None, where read_excel
+    # gave NaN. Callers stringify sections with astype(str), so they must stay
+    # NaN (-> "nan", as before the cache) rather than become "None".
+    df = table.to_pandas()
+    for col in df.columns[df.dtypes == object]:
+        df[col] = df[col].where(df[col].notna(), numpy.nan)
+    return df
+
+
+def write_columns(df: pandas.DataFrame, arrow_path: Union[str, Path]) -> Path:
+    arrow_path = Path(arrow_path)
+    arrow_path.parent.mkdir(parents=True, exist_ok=True)
+    table = pyarrow.Table.from_pandas(_arrow_safe(df), preserve_index=False)
+    tmp_path = arrow_path.with_name(arrow_path.name + '.tmp')
+    # Uncompressed Arrow IPC, so readers can memory-map the column buffers
+    with pyarrow.OSFile(str(tmp_path), 'wb') as sink:
+        with pyarrow.ipc.new_file(sink, table.schema) as writer:
+            writer.write_table(table)
+    os.replace(tmp_path, arrow_path)
+    return arrow_path
+
+
+def _convert_cell(cell):
+    # As pandas' openpyxl reader: empty cells are "", errors NaN and integral
+    # numbers int, so that TextParser infers the same types as read_excel
+    from openpyxl.cell.cell import TYPE_ERROR, TYPE_NUMERIC
+
+    if cell.value is None:
+        return ""
+    if cell.data_type == TYPE_ERROR:
+        return numpy.nan
+    if cell.data_type == TYPE_NUMERIC:
+        value = int(cell.value)
+        return value if value == cell.value else float(cell.value)
+    return cell.value
+
+
+def _sheet_rows(excel_path: Path) -> Iterator[list]:
+    # Rows of the first sheet, streamed by openpyxl's read-only mode. Blank
+    # rows are held back until a later row has data, so trailing ones are
+    # dropped as read_excel drops them.
+    from openpyxl import load_workbook
+
+    workbook = load_workbook(excel_path, read_only=True, data_only=True, keep_links=False)
+    try:
+        sheet = workbook.worksheets[0]
+        sheet.reset_dimensions()
+        blank = []
+        for row in sheet.rows:
+            values = [_convert_cell(cell) for cell in row]
+            while values and values[-1] == "":
+                values.pop()
+            if not values:
+                blank.append(values)
+                continue
+            yield from blank
+            blank = []
+            yield values
+    finally:
+        workbook.close()
+
+
+def _excel_chunks(excel_path: Path, chunk_rows: int) -> Iterator[pandas.DataFrame]:
+    # Each chunk goes through the parser read_excel itself uses, so values
+    # and types match read_excel's within a chunk
+    from pandas.io.parsers import TextParser
+
+    rows = _sheet_rows(excel_path)
+    header = next(rows, None)
+    if header is None:
+        return
+    names = None
+
+    def parse(chunk):
+        # Cells beyond the header row's width are dropped
+        chunk = [row[:len(header)] + [""] * (len(header) - len(row)) for row in chunk]
+        if names is None:
+            return TextParser([header] + chunk, header=0, skip_blank_lines=False).read()
+        return TextParser(chunk, header=None, names=names, skip_blank_lines=False).read()
+
+    chunk = []
+    for row in rows:
+        chunk.append(row)
+        if len(chunk) == chunk_rows:
+            df = parse(chunk)
+            names = list(df.columns)
+            yield df
+            chunk = []
+    if chunk or names is None:
+        yield parse(chunk)
+
+
+def _widen(types) -> pyarrow.DataType:
+    # The type a column needs to hold the values of every chunk: integer and
+    # float chunks widen to float, as integers with blanks do in read_excel,
+    # and any other mixture to strings
+    types = set(types)
+    if not types:
+        return pyarrow.null()
+    if len(types) == 1:
+        return types.pop()
+    if all(pyarrow.types.is_integer(t) or pyarrow.types.is_floating(t) for t in types):
+        return pyarrow.float64()
+    return pyarrow.string()
+
+
+def _conform(table: pyarrow.Table, schema: pyarrow.Schema) -> pyarrow.Table:
+    # Blank columns are typed float by the parser, so they become nulls of
+    # the widened type rather than being cast
+    return pyarrow.Table.from_arrays([
+        pyarrow.nulls(len(column), field.type) if column.null_count == len(column)
+        else column.cast(field.type)
+        for column, field in zip(table.columns, schema)
+    ], schema=schema)
+
+
+def write_excel_columns(
+    excel_path: Union[str, Path], arrow_path: Union[str, Path], chunk_rows: int = 10000
+) -> Path:
+    """Convert the first sheet of a workbook to Arrow without loading it whole.
+
+    Rows are read chunk_rows at a time and each chunk is written to a
+    temporary Arrow file. If the chunks' column types differ they are widened
+    to one schema as the chunks are combined, so peak memory is one chunk
+    however large the workbook. A workbook of at most chunk_rows rows gives
+    the same file as converting read_excel's result.
+    """
+    excel_path, arrow_path = Path(excel_path), Path(arrow_path)
+    if excel_path.suffix.lower() == '.xls':
+        # openpyxl cannot read the old binary format
+        return write_columns(pandas.read_excel(excel_path), arrow_path)
+    chunk_dir = arrow_path.with_name(arrow_path.name + '.chunks')
+    chunk_dir.mkdir(parents=True, exist_ok=True)
+    try:
+        chunk_paths = [write_columns(df, chunk_dir / f'{i:05d}.arrow')
+                       for i, df in enumerate(_excel_chunks(excel_path, chunk_rows))]
+        if not chunk_paths:
+            # An empty sheet, which read_excel reads as an empty DataFrame
+            return write_columns(pandas.DataFrame(), arrow_path)
+        if len(chunk_paths) == 1:
+            os.replace(chunk_paths[0], arrow_path)
+            return arrow_path
+        # Types of each column in the chunks where it has any value
+        column_types = None
+        for path in chunk_paths:
+            with pyarrow.memory_map(str(path), 'r') as f:
+                table = pyarrow.ipc.open_file(f).read_all()
+                if column_types is None:
+                    column_types = [set() for _ in table.schema]
+                for types, column in zip(column_types, table.columns):
+                    if column.null_count < len(column):
+                        types.add(column.type)
+        # Without the pandas metadata, which describes the first chunk's dtypes
+        schema = pyarrow.schema([pyarrow.field(name, _widen(types))
+                                 for name, types in zip(table.schema.names, column_types)])
+        tmp_path = arrow_path.with_name(arrow_path.name + '.tmp')
+        with pyarrow.OSFile(str(tmp_path), 'wb') as sink:
+            with pyarrow.ipc.new_file(sink, schema) as writer:
+                for path in chunk_paths:
+                    with pyarrow.memory_map(str(path), 'r') as f:
+                        writer.write_table(_conform(pyarrow.ipc.open_file(f).read_all(), schema))
+        os.replace(tmp_path, arrow_path)
+        return arrow_path
+    finally:
+        shutil.rmtree(chunk_dir, ignore_errors=True)
+
+
+def ingest_workbook(
+    excel_path: Union[str, Path], cache_dir: Union[str, Path, None] = None
+) -> Path:
+    excel_path = Path(excel_path)
+    cache_dir = Path(cache_dir or default_cache_dir)
+    cache_dir.mkdir(parents=True, exist_ok=True)
+    stat = excel_path.stat()
+    manifest_path = cache_dir / f'{excel_path.stem}.ingest.json'
+    manifest = {}
+    if manifest_path.exists():
+        with open(manifest_path, 'r') as f:
+            manifest = json.load(f)
+    # The content hash is only recomputed when mtime or size changed
+    if (manifest.get('source') == str(excel_path.absolute())
+            and manifest.get('mtime_ns') == stat.st_mtime_ns
+            and manifest.get('size') == stat.st_size):
+        sha256 = manifest['sha256']
+    else:
+        sha256 = file_sha256(excel_path)
+    arrow_path = cache_dir / f'{excel_path.stem}-{sha256[:16]}.arrow'
+    if not arrow_path.exists():
+        logger.info(f'Converting {excel_path} to columnar cache at {arrow_path}')
+        write_excel_columns(excel_path, arrow_path)
+    with open(manifest_path, 'w') as f:
+        json.dump({'source': str(excel_path.absolute()),
+                   'mtime_ns': stat.st_mtime_ns,
+                   'size': stat.st_size,
+                   'sha256': sha256,
+                   'arrow': arrow_path.name}, f)
+    return arrow_path
+
+
+def _arrow_path(source: Union[str, Path]) -> Path:
+    source = Path(source)
+    if source.suffix.lower() in excel_suffixes:
+        return ingest_workbook(source)
+    return source
+
+
+def available_columns(source: Union[str, Path]) -> List[str]:
+    with pyarrow.memory_map(str(_arrow_path(source)), 'r') as f:
+        return pyarrow.ipc.open_file(f).schema.names
+
+
+def read_columns(
+    source: Union[str, Path], columns: Optional[List[str]] = None
+) -> pandas.DataFrame:
+    # Excel sources are ingested (once) first. Only the selected columns are
+    # paged in from the memory-mapped file.
+    with pyarrow.memory_map(str(_arrow_path(source)), 'r') as f:
+        table = pyarrow.ipc.open_file(f).read_all()
+        if columns is not None:
+            table = table.select(columns)
+        return _to_pandas(table)
+
+
+def iter_batches(
+    source: Union[str, Path], columns: List[str], batch_size: int = 512
+) -> Iterator[pandas.DataFrame]:
+    # Record batches are sliced from the memory-mapped file, so only one
+    # batch of rows is ever converted to pandas at a time
+    with pyarrow.memory_map(str(_arrow_path(source)), 'r') as f:
+        reader = pyarrow.ipc.open_file(f)
+        for i in range(reader.num_record_batches):
+            batch = reader.get_batch(i).select(columns)
+            for offset in range(0, batch.num_rows, batch_size):
+                yield _to_pandas(pyarrow.Table.from_batches([batch.slice(offset, batch_size)]))
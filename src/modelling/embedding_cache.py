@@ -0,0 +1,119 @@
+import hashlib
+import json
+import os
+import re
+import uuid
+from pathlib import Path
+from typing import Dict, List, Tuple, Union
+
+import numpy
+from loguru import logger
+
+
+default_cache_dir = os.path.join(os.getcwd(), 'data', 'embedding_cache')
+
+
+def hash_document(doc: str) -> str:
+    return hashlib.sha1(doc.encode("utf-8")).hexdigest()
+
+
+class EmbeddingCache:
+    """Content-addressed store of sentence embeddings.
+
+    Embeddings live in append-only ``.npy`` shards under one directory per
+    embedding model, and ``index.jsonl`` records which document hashes each
+    shard holds. Shards are opened memory-mapped, so only the rows a caller
+    asks for are read from disk.
+    """
+
+    def __init__(self, model_name: str, cache_dir: Union[str, Path, None] = None):
+        self.model_name = model_name
+        self.cache_dir = Path(cache_dir or default_cache_dir) / re.sub(r"[^A-Za-z0-9_.-]+", "_", model_name)
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        self.index_path = self.cache_dir / "index.jsonl"
+        self._index: Dict[str, Tuple[str, int]] = {}
+        self._shards: Dict[str, numpy.ndarray] = {}
+        self._torn_tail = False
+        self._load_index()
+
+    def _load_index(self):
+        if not self.index_path.exists():
+            return
+        with open(self.index_path, "r") as f:
+            for line in f:
+                # Set by a last line without its newline, so that the next
+                # entry is not appended onto it
+                self._torn_tail = not line.endswith("\n")
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    entry = json.loads(line)
+                except json.JSONDecodeError:
+                    # A line cut short by a crash mid-append; its shard's
+                    # documents are re-encoded like those of a missing shard
+                    continue
+                # A shard listed in the index but missing on disk was never
+                # completely written, so its documents are simply re-encoded
+                if not (self.cache_dir / entry["shard"]).exists():
+                    continue
+                for row, doc_hash in enumerate(entry["keys"]):
+                    self._index[doc_hash] = (entry["shard"], row)
+
+    def _shard(self, name: str) -> numpy.ndarray:
+        if name not in self._shards:
+            self._shards[name] = numpy.load(self.cache_dir / name, mmap_mode="r")
+        return self._shards[name]
+
+    def __len__(self):
+        return len(self._index)
+
+    def __contains__(self, doc: str):
+        return hash_document(doc) in self._index
+
+    def _write_shard(self, keys: List[str], embeddings: numpy.ndarray):
+        # Unique rather than numbered names: a count of existing shards would
+        # reuse a deleted shard's name, or the name another process is writing
+        name = f"shard_{uuid.uuid4().hex}.npy"
+        tmp_path = self.cache_dir / f"{name}.tmp"
+        with open(tmp_path, "wb") as f:
+            numpy.save(f, embeddings)
+        os.replace(tmp_path, self.cache_dir / name)
+        with open(self.index_path, "a") as f:
+            if self._torn_tail:
+                f.write("\n")
+                self._torn_tail = False
+            f.write(json.dumps({"shard": name, "keys": keys}) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+        for row, doc_hash in enumerate(keys):
+            self._index[doc_hash] = (name, row)
+
+    def encode(self, embedding_model, docs: List[str], **encode_kwargs) -> numpy.ndarray:
+        hashes = [hash_document(doc) for doc in docs]
+        missing = {}
+        for doc_hash, doc in zip(hashes, docs):
+            if doc_hash not in self._index and doc_hash not in missing:
+                missing[doc_hash] = doc
+        logger.info(
+            f"Embedding cache ({self.model_name}): {len(docs) - len(missing)} "
+            f"of {len(docs)} documents cached, encoding {len(missing)}"
+        )
+        if missing:
+            new_embeddings = embedding_model.encode(list(missing.values()), **encode_kwargs)
+            self._write_shard(list(missing.keys()), numpy.asarray(new_embeddings))
+        return self.lookup(hashes)
+
+    def lookup(self, hashes: List[str]) -> numpy.ndarray:
+        locations = [self._index[doc_hash] for doc_hash in hashes]
+        dim = self._shard(locations[0][0]).shape[1] if locations else 0
+        out = numpy.empty((len(hashes), dim), dtype=numpy.float32)
+        # Gather shard by shard so each memory-mapped file is read with a
+        # single fancy-indexing call
+        by_shard: Dict[str, List[Tuple[int, int]]] = {}
+        for position, (shard, row) in enumerate(locations):
+            by_shard.setdefault(shard, []).append((position, row))
+        for shard, pairs in by_shard.items():
+            positions, rows = map(numpy.array, zip(*pairs))
+            out[positions] = self._shard(shard)[rows]
+        return out
@@ -0,0 +1,107 @@
+import os
+from typing import Optional
+
+from loguru import logger
+
+
+backends = ("cuml", "cpu")
+
+
+def select_backend(backend: str = "auto") -> str:
+    # "auto" prefers cuML when RAPIDS is importable, so GPU nodes behave as
+    # before and CPU-only nodes fall back to umap-learn and hdbscan
+    if backend == "auto":
+        try:
+            import cuml  # noqa: F401
+            return "cuml"
+        except ImportError:
+            return "cpu"
+    if backend not in backends:
+        raise ValueError(f"Unknown backend '{backend}', expected one of {backends}")
+    return backend
+
+
+def set_cpu_threads(n_threads: Optional[int] = None) -> int:
+    n_threads = n_threads or os.cpu_count() or 1
+    # BLAS and OpenMP only read these when they are loaded, which in this
+    # process has already happened; they apply to processes started later
+    for var in ("OMP_NUM_THREADS", "OPENBLAS_NUM_THREADS", "MKL_NUM_THREADS"):
+        os.environ[var] = str(n_threads)
+    # The pools already loaded here are resized at runtime instead
+    try:
+        from threadpoolctl import threadpool_limits
+        threadpool_limits(limits=n_threads)
+    except ImportError:
+        logger.warning("threadpoolctl is not installed, BLAS thread counts are left as they are")
+    try:
+        import numba
+        numba.set_num_threads(min(n_threads, numba.config.NUMBA_NUM_THREADS))
+    except ImportError:
+        pass
+    return n_threads
+
+
+def make_umap(
+    backend: str,
+    n_neighbors: int,
+    n_components: int = 5,
+    min_dist: float = 0.0,
+    metric: str = "cosine",
+    random_state: Optional[int] = None,
+    n_threads: Optional[int] = None,
+):
+    if backend == "cuml":
+        from cuml.manifold import UMAP
+
+        return UMAP(
+            n_neighbors=n_neighbors,
+            n_components=n_components,
+            init="random",
+            min_dist=min_dist,
+            metric=metric,
+            random_state=random_state,
+        )
+    from umap import UMAP
+
+    # Reproducibility costs parallelism here: a fixed random_state makes
+    # umap-learn run single-threaded, random_state=None uses n_threads but
+    # gives slightly different reductions from run to run
+    if random_state is not None:
+        logger.info(f"umap-learn runs single-threaded with random_state={random_state}; "
+                    f"pass random_state=None to use all threads")
+    return UMAP(
+        n_neighbors=n_neighbors,
+        n_components=n_components,
+        init="random",
+        min_dist=min_dist,
+        metric=metric,
+        random_state=random_state,
+        n_jobs=n_threads or -1,
+    )
+
+
+def make_hdbscan(
+    backend: str,
+    min_cluster_size: int = 10,
+    metric: str = "euclidean",
+    prediction_data: bool = True,
+    n_threads: Optional[int] = None,
+):
+    if backend == "cuml":
+        from cuml.cluster import HDBSCAN
+
+        return HDBSCAN(
+            min_cluster_size=min_cluster_size,
+            metric=metric,
+            prediction_data=prediction_data,
+        )
+    # The hdbscan package rather than sklearn's HDBSCAN, since BERTopic only
+    # computes topic probabilities with its soft clustering
+    from hdbscan import HDBSCAN
+
+    return HDBSCAN(
+        min_cluster_size=min_cluster_size,
+        metric=metric,
+        prediction_data=prediction_data,
+        core_dist_n_jobs=n_threads or -1,
+    )
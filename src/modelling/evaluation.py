@@ -0,0 +1,126 @@
+from typing import Dict, Optional
+
+import numpy
+from loguru import logger
+from sklearn import config_context
+from sklearn.metrics import (calinski_harabasz_score, davies_bouldin_score,
+                             silhouette_samples, silhouette_score)
+
+
+evaluation_modes = ("exact", "chunked", "sampled")
+
+
+def stratified_sample(
+    labels: numpy.ndarray, sample_size: int, rng: numpy.random.Generator
+) -> numpy.ndarray:
+    # Proportional draw per cluster, keeping at least two points of every
+    # cluster so that each one still has an intra-cluster distance
+    unique, inverse, counts = numpy.unique(labels, return_inverse=True, return_counts=True)
+    quotas = numpy.minimum(
+        counts, numpy.maximum(2, numpy.round(sample_size * counts / len(labels)))
+    ).astype(int)
+    order = numpy.argsort(inverse, kind="stable")
+    starts = numpy.concatenate([[0], numpy.cumsum(counts)[:-1]])
+    return numpy.concatenate([
+        rng.choice(order[start:start + count], size=quota, replace=False)
+        for start, count, quota in zip(starts, counts, quotas)
+    ])
+
+
+def sampled_silhouette(
+    X: numpy.ndarray,
+    labels: numpy.ndarray,
+    sample_size: int = 1000,
+    n_bootstrap: int = 1000,
+    confidence: float = 0.95,
+    random_state: Optional[int] = None,
+):
+    """Silhouette of one stratified sample, with a bootstrap interval.
+
+    The per-point silhouettes of sample_size points are computed once, at a
+    cost of sample_size² distances rather than len(X)², and resampled with
+    replacement for a percentile interval of their mean. The interval covers
+    which points were drawn, not how each point's neighbours would change
+    had others been drawn. With no more than sample_size points the exact
+    score is returned, without an interval.
+    """
+    if len(labels) <= sample_size:
+        return float(silhouette_score(X, labels)), numpy.nan, numpy.nan
+    rng = numpy.random.default_rng(random_state)
+    idx = stratified_sample(labels, sample_size, rng)
+    values = silhouette_samples(X[idx], labels[idx])
+    resamples = rng.integers(0, len(values), size=(n_bootstrap, len(values)))
+    means = values[resamples].mean(axis=1)
+    alpha = (1 - confidence) / 2
+    low, high = numpy.quantile(means, [alpha, 1 - alpha])
+    return float(values.mean()), float(low), float(high)
+
+
+def chunked_silhouette(
+    X: numpy.ndarray, labels: numpy.ndarray, working_memory: int = 256
+) -> float:
+    # silhouette_samples reduces the pairwise distances chunk by chunk, so
+    # working_memory (in MiB) bounds the size of each distance block
+    with config_context(working_memory=working_memory):
+        return float(numpy.mean(silhouette_samples(X, labels)))
+
+
+def dbcv_score(X: numpy.ndarray, labels: numpy.ndarray) -> float:
+    try:
+        from hdbscan.validity import validity_index
+    except ImportError:
+        logger.warning("hdbscan is not installed, skipping DBCV")
+        return numpy.nan
+    return float(validity_index(X.astype(numpy.float64), labels))
+
+
+def evaluate_clustering(
+    umap_embeddings: numpy.ndarray,
+    topics,
+    mode: str = "chunked",
+    sample_size: int = 1000,
+    n_bootstrap: int = 1000,
+    working_memory: int = 256,
+    dbcv: bool = False,
+    random_state: Optional[int] = None,
+) -> Dict[str, float]:
+    """Cluster-quality metrics on the non-outlier documents.
+
+    ``exact`` is the plain sklearn silhouette, ``chunked`` gives the same
+    value with bounded memory, and ``sampled`` scores one stratified sample
+    of 1000 documents with a bootstrap confidence interval. Davies-Bouldin
+    and Calinski-Harabasz are always computed since they are linear in the
+    number of documents; DBCV is opt-in as it is quadratic per cluster.
+    """
+    if mode not in evaluation_modes:
+        raise ValueError(f"Unknown evaluation mode '{mode}', expected one of {evaluation_modes}")
+    topics = numpy.asarray(topics)
+    mask = topics != -1
+    X, labels = numpy.asarray(umap_embeddings)[mask], topics[mask]
+    metrics = {
+        "evaluation": mode,
+        "silhouette_score": numpy.nan,
+        "silhouette_ci_low": numpy.nan,
+        "silhouette_ci_high": numpy.nan,
+        "davies_bouldin": numpy.nan,
+        "calinski_harabasz": numpy.nan,
+        "dbcv": numpy.nan,
+    }
+    if len(numpy.unique(labels)) < 2:
+        logger.warning("Fewer than two topics, cluster-quality metrics are undefined")
+        return metrics
+    if mode == "exact":
+        metrics["silhouette_score"] = float(silhouette_score(X, labels))
+    elif mode == "chunked":
+        metrics["silhouette_score"] = chunked_silhouette(X, labels, working_memory)
+    else:
+        (metrics["silhouette_score"],
+         metrics["silhouette_ci_low"],
+         metrics["silhouette_ci_high"]) = sampled_silhouette(
+            X, labels, sample_size, n_bootstrap, random_state=random_state
+        )
+    metrics["davies_bouldin"] = float(davies_bouldin_score(X, labels))
+    metrics["calinski_harabasz"] = float(calinski_harabasz_score(X, labels))
+    if dbcv:
+        metrics["dbcv"] = dbcv_score(X, labels)
+    return metrics
@@ -0,0 +1,87 @@
+import sys
+from pathlib import Path
+from typing import List, Optional, Union
+
+import numpy
+import pandas
+from loguru import logger
+
+from columnar_cache import read_columns
+from engines import select_backend
+from reduction_cache import CachedUMAP
+
+
+# Metrics where a lower value means better separated topics
+lower_is_better = {'davies_bouldin'}
+
+
+def render_figures(
+    topic_model,
+    docs: List[str],
+    embeddings: numpy.ndarray,
+    fig_dir: Union[str, Path],
+    model_name: str,
+    backend: str = "auto",
+):
+    fig_dir = Path(fig_dir)
+    fig_dir.mkdir(parents=True, exist_ok=True)
+    # Same 2-D reduction visualize_documents would run itself, but through the
+    # reduction cache and from stored embeddings rather than re-encoding docs
+    reduced_embeddings = CachedUMAP(
+        select_backend(backend),
+        n_neighbors=10,
+        n_components=2,
+        min_dist=0.0,
+        metric="cosine",
+    ).fit_transform(embeddings)
+    fig_topic = topic_model.visualize_documents(
+        docs,
+        reduced_embeddings=reduced_embeddings,
+        hide_document_hover=True,
+        hide_annotations=True,
+    )
+    fig_topic.write_html(fig_dir.joinpath(f"{model_name}.html"))
+    fig_topic_hierarchy = topic_model.visualize_hierarchy()
+    fig_topic_hierarchy.write_html(fig_dir.joinpath(f"{model_name}_hierarchy.html"))
+
+
+def best_models(meta: pandas.DataFrame, metric: str = 'silhouette_score') -> List[str]:
+    meta = meta.dropna(subset=[metric])
+    if metric in lower_is_better:
+        best = meta.groupby('columns')[metric].idxmin()
+    else:
+        best = meta.groupby('columns')[metric].idxmax()
+    return meta.loc[best, 'model_name'].tolist()
+
+
+def render_saved_models(
+    target_dir: Union[str, Path],
+    model_names: Optional[List[str]] = None,
+    metric: str = 'silhouette_score',
+):
+    from bertopic import BERTopic
+
+    target_dir = Path(target_dir)
+    meta = pandas.read_csv(target_dir / 'metadata.csv')
+    if not model_names:
+        model_names = best_models(meta, metric)
+    for model_name in model_names:
+        row = meta[meta['model_name'] == model_name].iloc[-1]
+        col_str = row['columns']
+        logger.info(f'Rendering figures for {model_name}')
+        docs = read_columns(target_dir / 'inputs' / f'{col_str}.arrow',
+                            ['cleaned_full_text'])['cleaned_full_text'].tolist()
+        embeddings = numpy.load(target_dir / 'inputs' / f'{col_str}.npy', mmap_mode='r')
+        topic_model = BERTopic.load(target_dir / 'models' / model_name)
+        render_figures(topic_model, docs, numpy.asarray(embeddings),
+                       target_dir / 'figures', model_name,
+                       backend=row['backend'] if isinstance(row.get('backend'), str) else 'auto')
+
+
+if __name__ == "__main__":
+    # python figures.py <target_dir> [metric] [model_name ...]
+    render_saved_models(
+        sys.argv[1],
+        model_names=sys.argv[3:],
+        metric=sys.argv[2] if len(sys.argv) > 2 else 'silhouette_score',
+    )
@@ -0,0 +1,124 @@
+import hashlib
+import os
+import re
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, Iterable, List, Optional, Sequence
+
+import numpy
+import pandas
+from loguru import logger
+
+
+# Same tokens CountVectorizer's default analyzer produces
+TOKEN_RE = re.compile(r"(?u)\b\w\w+\b")
+
+# Odd 64-bit multiplier for combining token hashes into n-gram keys
+HASH_PRIME = numpy.uint64(0x100000001B3)
+
+
+def token_hashes(vocab: Sequence[str]) -> numpy.ndarray:
+    # Stable across processes and runs, unlike hash(), so chunk counts merge
+    return numpy.array(
+        [int.from_bytes(hashlib.blake2b(t.encode("utf-8"), digest_size=8).digest(), "little")
+         for t in vocab],
+        dtype=numpy.uint64,
+    )
+
+
+def tokenize(texts: Iterable[str]):
+    """Tokenise texts once into (ids, doc_ids, vocab).
+
+    ids indexes into vocab for every token of the concatenated corpus and
+    doc_ids gives the document each token belongs to.
+    """
+    tokens, doc_ids = [], []
+    for doc_id, text in enumerate(texts):
+        doc_tokens = TOKEN_RE.findall(text.lower())
+        tokens.extend(doc_tokens)
+        doc_ids.append(numpy.full(len(doc_tokens), doc_id, dtype=numpy.int64))
+    if not tokens:
+        return (numpy.empty(0, dtype=numpy.int64), numpy.empty(0, dtype=numpy.int64),
+                numpy.empty(0, dtype=object))
+    vocab, ids = numpy.unique(numpy.array(tokens, dtype=object), return_inverse=True)
+    return ids.astype(numpy.int64), numpy.concatenate(doc_ids), vocab
+
+
+def ngram_keys(ids: numpy.ndarray, doc_ids: numpy.ndarray, hashes: numpy.ndarray, n: int):
+    """64-bit keys of every n-gram that does not cross a document boundary,
+    with the start position of each in the token stream."""
+    starts = numpy.arange(max(len(ids) - n + 1, 0))
+    starts = starts[doc_ids[starts] == doc_ids[starts + n - 1]]
+    keys = hashes[ids[starts]]
+    for offset in range(1, n):
+        keys = keys * HASH_PRIME ^ hashes[ids[starts + offset]]
+    return keys, starts
+
+
+def count_chunk(texts: List[str], orders: Sequence[int]) -> Dict[int, tuple]:
+    """Counts of every n-gram order in one chunk of texts.
+
+    Returns {n: (keys, counts, grams)} with keys sorted, counts aligned and
+    grams an (m, n) array of vocabulary strings for decoding each key.
+    """
+    ids, doc_ids, vocab = tokenize(texts)
+    hashes = token_hashes(vocab)
+    counted = {}
+    for n in orders:
+        keys, starts = ngram_keys(ids, doc_ids, hashes, n)
+        # First occurrence of each key is kept to decode it back to words
+        keys, first, counts = numpy.unique(keys, return_index=True, return_counts=True)
+        positions = starts[first][:, None] + numpy.arange(n)
+        counted[n] = (keys, counts, vocab[ids[positions]] if len(keys) else
+                      numpy.empty((0, n), dtype=object))
+    return counted
+
+
+def merge_counts(chunks: List[tuple]):
+    # Sum counts of equal keys across chunks, keeping one decoding per key
+    keys = numpy.concatenate([c[0] for c in chunks])
+    counts = numpy.concatenate([c[1] for c in chunks])
+    grams = numpy.concatenate([c[2] for c in chunks])
+    keys, first, inverse = numpy.unique(keys, return_index=True, return_inverse=True)
+    return keys, numpy.bincount(inverse, weights=counts).astype(numpy.int64), grams[first]
+
+
+def ngram_frequencies(
+    texts: Iterable[str],
+    orders: Sequence[int] = (1, 2, 3, 4, 5),
+    min_count: int = 1,
+    top_k: Optional[int] = None,
+    n_jobs: Optional[int] = None,
+    chunksize: int = 2000,
+) -> Dict[int, pandas.DataFrame]:
+    """Frequencies of every n-gram order from a single tokenisation per chunk.
+
+    N-grams are counted under 64-bit hashed keys, so chunks counted in
+    parallel merge without a shared vocabulary. N-grams seen fewer than
+    min_count times are dropped and only the top_k most frequent are kept.
+    Returns {n: DataFrame} indexed by n-gram with a 'frequency' column,
+    most frequent first.
+    """
+    texts = list(texts)
+    orders = list(orders)
+    n_jobs = n_jobs or os.cpu_count() or 1
+    chunks = [texts[i:i + chunksize] for i in range(0, len(texts), chunksize)] or [[]]
+    if n_jobs == 1 or len(chunks) == 1:
+        counted = [count_chunk(chunk, orders) for chunk in chunks]
+    else:
+        with ProcessPoolExecutor(max_workers=n_jobs) as executor:
+            counted = list(executor.map(count_chunk, chunks, [orders] * len(chunks)))
+    frequencies = {}
+    for n in orders:
+        keys, counts, grams = merge_counts([c[n] for c in counted])
+        keep = counts >= min_count
+        counts, grams = counts[keep], grams[keep]
+        if top_k is not None and len(counts) > top_k:
+            top = numpy.argpartition(-counts, top_k - 1)[:top_k]
+            counts, grams = counts[top], grams[top]
+        index = [" ".join(gram) for gram in grams]
+        frequencies[n] = (pandas.DataFrame({'frequency': counts}, index=index)
+                          .rename_axis(None)
+                          .sort_index()
+                          .sort_values(by='frequency', ascending=False, kind='stable'))
+        logger.info(f'{len(frequencies[n])} {n}-grams counted')
+    return frequencies
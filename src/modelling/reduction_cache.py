@@ -0,0 +1,123 @@
+import hashlib
+import os
+import pickle
+from pathlib import Path
+from typing import Optional, Union
+
+import numpy
+from loguru import logger
+
+from engines import make_umap
+
+
+default_cache_dir = os.path.join(os.getcwd(), 'data', 'reduction_cache')
+
+
+def array_hash(arr: numpy.ndarray) -> str:
+    arr = numpy.ascontiguousarray(arr)
+    digest = hashlib.sha1(f"{arr.dtype.str}{arr.shape}".encode())
+    digest.update(memoryview(arr).cast("B"))
+    return digest.hexdigest()
+
+
+class CachedUMAP:
+    """UMAP stand-in for BERTopic that reuses reductions across runs.
+
+    The reduced embeddings and the fitted reducer are stored per
+    (backend, n_neighbors, n_components, random_state, embedding hash). Fitting
+    on embeddings that were reduced before loads them from disk, and
+    transforming the embeddings the model was fitted on returns the stored
+    reduction instead of running UMAP again. Processes fitting the same key
+    at the same time would each compute it, so run_sweep gives every
+    reduction to a single worker.
+    """
+
+    def __init__(
+        self,
+        backend: str,
+        n_neighbors: int,
+        n_components: int = 5,
+        min_dist: float = 0.0,
+        metric: str = "cosine",
+        random_state: Optional[int] = None,
+        n_threads: Optional[int] = None,
+        cache_dir: Union[str, Path, None] = None,
+    ):
+        self.backend = backend
+        self.n_neighbors = n_neighbors
+        self.n_components = n_components
+        self.min_dist = min_dist
+        self.metric = metric
+        self.random_state = random_state
+        self.n_threads = n_threads
+        self.cache_dir = Path(cache_dir or default_cache_dir)
+        self.model_ = None
+        self.embedding_ = None
+        self.fitted_hash_ = None
+
+    def _key(self, embeddings_hash: str) -> str:
+        return (f"{self.backend}_nn{self.n_neighbors}_nc{self.n_components}"
+                f"_md{self.min_dist}_{self.metric}_rs{self.random_state}_{embeddings_hash}")
+
+    def _paths(self):
+        key = self._key(self.fitted_hash_)
+        return self.cache_dir / f"{key}.npy", self.cache_dir / f"{key}.pkl"
+
+    def fit(self, X, y=None):
+        self.fitted_hash_ = array_hash(X)
+        embedding_path, model_path = self._paths()
+        if embedding_path.exists() and model_path.exists():
+            logger.info(f"Loading cached reduction {embedding_path.name}")
+            self.embedding_ = numpy.load(embedding_path)
+            self.model_ = None
+            return self
+        self.model_ = make_umap(
+            self.backend,
+            n_neighbors=self.n_neighbors,
+            n_components=self.n_components,
+            min_dist=self.min_dist,
+            metric=self.metric,
+            random_state=self.random_state,
+            n_threads=self.n_threads,
+        )
+        self.model_.fit(X)
+        self.embedding_ = numpy.asarray(self.model_.transform(X))
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        # Written via temporary files so concurrent sweep workers never see a
+        # partial entry
+        for path, write in ((model_path, lambda f: pickle.dump(self.model_, f)),
+                            (embedding_path, lambda f: numpy.save(f, self.embedding_))):
+            tmp_path = path.with_name(f"{path.name}.{os.getpid()}.tmp")
+            with open(tmp_path, "wb") as f:
+                write(f)
+            os.replace(tmp_path, path)
+        return self
+
+    def _model(self):
+        if self.model_ is None:
+            with open(self._paths()[1], "rb") as f:
+                self.model_ = pickle.load(f)
+        return self.model_
+
+    def transform(self, X):
+        if self.fitted_hash_ is not None and array_hash(X) == self.fitted_hash_:
+            return self.embedding_.copy()
+        return self._model().transform(X)
+
+    def fit_transform(self, X, y=None):
+        return self.fit(X, y).transform(X)
+
+    def __reduce_ex__(self, protocol):
+        # Pickled, e.g. by BERTopic.save, as the reducer it stands in for, so
+        # saved topic models load without this module or the cache directory
+        if self.fitted_hash_ is not None:
+            return self._model().__reduce_ex__(protocol)
+        return make_umap(
+            self.backend,
+            n_neighbors=self.n_neighbors,
+            n_components=self.n_components,
+            min_dist=self.min_dist,
+            metric=self.metric,
+            random_state=self.random_state,
+            n_threads=self.n_threads,
+        ).__reduce_ex__(protocol)
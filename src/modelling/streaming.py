@@ -0,0 +1,168 @@
+import json
+import os
+import sys
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import Iterator, List, Optional, Sequence, Tuple, Union
+
+import numpy
+import pandas
+import pyarrow
+import pyarrow.ipc
+from loguru import logger
+
+from columnar_cache import available_columns, iter_batches
+from text_cleaning import clean_texts, cols
+
+
+id_column = 'REF impact case study identifier'
+
+
+def iter_cleaned_texts(
+    corpora: Sequence[Tuple[str, Union[str, Path]]],
+    col_index: List[int],
+    batch_size: int = 512,
+    n_jobs: Optional[int] = None,
+) -> Iterator[pandas.DataFrame]:
+    """Read, join and clean each corpus in bounded batches.
+
+    corpora is a list of (name, workbook or Arrow file) pairs, e.g. REF 2014
+    and REF 2021, read one after the other. Yields DataFrames with corpus,
+    identifier and cleaned_full_text columns, one batch at a time.
+    """
+    columns_to_use = [cols[i] for i in col_index]
+    with ProcessPoolExecutor(max_workers=n_jobs or os.cpu_count() or 1) as executor:
+        for corpus, source in corpora:
+            available = available_columns(source)
+            missing = [c for c in [id_column] + columns_to_use if c not in available]
+            if missing:
+                raise ValueError(f"Corpus '{corpus}' ({source}) has no columns {missing}")
+            for df in iter_batches(source, [id_column] + columns_to_use, batch_size):
+                df = df[df[id_column].notnull()]
+                if df.empty:
+                    continue
+                # Sections are cleaned separately and joined, as in
+                # prepare_full_texts, so both give the same text
+                raw = [df[col].astype(str).tolist() for col in columns_to_use]
+                cleaned = clean_texts([s for texts in raw for s in texts], executor=executor)
+                sections = [cleaned[i * len(df):(i + 1) * len(df)]
+                            for i in range(len(columns_to_use))]
+                yield pandas.DataFrame({
+                    'corpus': corpus,
+                    id_column: df[id_column].astype(str).to_numpy(),
+                    'cleaned_full_text': [" ".join(filter(None, parts))
+                                          for parts in zip(*sections)],
+                })
+
+
+class EmbeddingMemmap:
+    """Float32 embeddings appended batch by batch to a raw file on disk.
+
+    A sidecar ``.json`` holds the dtype and shape and is only rewritten after
+    each batch is flushed, so it always describes complete rows. The rows'
+    corpus, identifier and cleaned text go to an ``.arrow`` file alongside.
+    """
+
+    def __init__(self, path: Union[str, Path]):
+        self.path = Path(path)
+        self.sidecar_path = self.path.with_suffix('.json')
+        self.docs_path = self.path.with_suffix('.arrow')
+
+    def read_meta(self):
+        if not self.sidecar_path.exists():
+            return None
+        with open(self.sidecar_path, 'r') as f:
+            return json.load(f)
+
+    def _write_meta(self, meta):
+        tmp_path = self.sidecar_path.with_name(self.sidecar_path.name + '.tmp')
+        with open(tmp_path, 'w') as f:
+            json.dump(meta, f)
+        os.replace(tmp_path, self.sidecar_path)
+
+    def load(self) -> numpy.memmap:
+        meta = self.read_meta()
+        if meta is None:
+            raise FileNotFoundError(f"No embeddings written to {self.path}")
+        if meta['shape'][0] == 0:
+            # numpy cannot map an empty file
+            return numpy.empty(tuple(meta['shape']), dtype=meta['dtype'])
+        return numpy.memmap(self.path, dtype=meta['dtype'], mode='r',
+                            shape=tuple(meta['shape']))
+
+    def write(self, batches: Iterator[Tuple[pandas.DataFrame, numpy.ndarray]], **meta):
+        rows, dim = 0, None
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        doc_writer = None
+        try:
+            with open(self.path, 'wb') as f:
+                for docs, embeddings in batches:
+                    embeddings = numpy.ascontiguousarray(embeddings, dtype=numpy.float32)
+                    dim = embeddings.shape[1]
+                    f.write(embeddings.tobytes())
+                    f.flush()
+                    os.fsync(f.fileno())
+                    table = pyarrow.Table.from_pandas(docs, preserve_index=False)
+                    if doc_writer is None:
+                        doc_writer = pyarrow.ipc.new_file(str(self.docs_path), table.schema)
+                    doc_writer.write_table(table)
+                    rows += len(embeddings)
+                    self._write_meta({'dtype': 'float32', 'shape': [rows, dim], **meta})
+            if rows == 0:
+                # No documents at all, which load() reads as an empty array
+                self._write_meta({'dtype': 'float32', 'shape': [0, 0], **meta})
+        finally:
+            if doc_writer is not None:
+                doc_writer.close()
+        return rows
+
+
+def embed_corpora(
+    corpora: Sequence[Tuple[str, Union[str, Path]]],
+    embedding_model,
+    out_path: Union[str, Path],
+    col_index: List[int] = (0, 1, 2, 3, 4),
+    batch_size: int = 512,
+    embedding_cache=None,
+    n_jobs: Optional[int] = None,
+) -> EmbeddingMemmap:
+    """Stream corpora through read, join, clean and embed into a memmap.
+
+    Peak memory is one batch of documents and embeddings however many
+    corpora are combined. With an EmbeddingCache, documents embedded before
+    are read from it instead of being encoded again.
+    """
+    store = EmbeddingMemmap(out_path)
+
+    def embedded():
+        for i, docs in enumerate(iter_cleaned_texts(corpora, list(col_index), batch_size, n_jobs)):
+            texts = docs['cleaned_full_text'].tolist()
+            if embedding_cache is not None:
+                embeddings = embedding_cache.encode(embedding_model, texts)
+            else:
+                embeddings = embedding_model.encode(texts)
+            logger.info(f'Embedded batch {i} ({len(docs)} documents)')
+            yield docs, embeddings
+
+    rows = store.write(embedded(),
+                       corpora=[[name, str(source)] for name, source in corpora],
+                       columns=[cols[i] for i in col_index])
+    if rows == 0:
+        logger.warning(f'No documents to embed in {[name for name, _ in corpora]}')
+    logger.info(f'Wrote {rows} embeddings to {store.path}')
+    return store
+
+
+if __name__ == "__main__":
+    # python streaming.py <out.f32> <corpus name> <workbook> [<corpus name> <workbook> ...]
+    from sentence_transformers import SentenceTransformer
+    from embedding_cache import EmbeddingCache
+
+    embedding_model_name = "all-MiniLM-L6-v2"
+    corpora = list(zip(sys.argv[2::2], sys.argv[3::2]))
+    embed_corpora(
+        corpora,
+        SentenceTransformer(embedding_model_name),
+        sys.argv[1],
+        embedding_cache=EmbeddingCache(embedding_model_name),
+    )
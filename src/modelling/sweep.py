@@ -0,0 +1,354 @@
+import multiprocessing
+import os
+import sys
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from multiprocessing import shared_memory
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Tuple, Union
+
+import numpy
+import pandas
+from loguru import logger
+
+from columnar_cache import read_columns, write_columns
+from engines import select_backend
+
+
+# Per-process state of sweep workers: the embedding model is loaded once by
+# the pool initializer, inputs are attached lazily and reused across configs
+_worker_state: Dict[str, object] = {}
+
+
+def make_model_name(
+    n_neighbors: int,
+    nr_topics: Union[None, str, int],
+    col_str: str,
+    random_state: Optional[int] = 77,
+    min_cluster_size: int = 10,
+) -> str:
+    # Default random state and cluster size keep the historical model names
+    return (
+        f'nn{n_neighbors}{f"_nr{nr_topics}" if nr_topics is not None else ""}_{col_str}'
+        f'{f"_rs{random_state}" if random_state != 77 else ""}'
+        f'{f"_mcs{min_cluster_size}" if min_cluster_size != 10 else ""}'
+    )
+
+
+def append_metadata(path_metadata_csv: Union[str, Path], metadata: Dict):
+    path_metadata_csv = Path(path_metadata_csv)
+    row = pandas.DataFrame([metadata])
+    if path_metadata_csv.exists():
+        # Rows written before a column was added simply leave it empty
+        header = pandas.read_csv(path_metadata_csv, nrows=0).columns.tolist()
+        if set(row.columns) - set(header):
+            existing = pandas.read_csv(path_metadata_csv)
+            pandas.concat([existing, row], ignore_index=True).to_csv(
+                path_metadata_csv, index=False
+            )
+            return
+        row = row.reindex(columns=header)
+    row.to_csv(
+        path_metadata_csv,
+        mode="a",
+        header=not path_metadata_csv.exists(),
+        index=False,
+    )
+
+
+def completed_models(target_dir: Union[str, Path]) -> set:
+    # A configuration is complete when its metadata row was written and its
+    # saved model is still on disk
+    path_metadata_csv = Path(target_dir) / "metadata.csv"
+    if not path_metadata_csv.exists():
+        return set()
+    meta = pandas.read_csv(path_metadata_csv)
+
+    def value(row, column, default):
+        return default if pandas.isna(row.get(column, default)) else row[column]
+
+    # Rows written before model_name was recorded have their name rebuilt
+    names = [
+        value(row, "model_name", None) or make_model_name(
+            int(row["n_neighbors"]),
+            value(row, "nr_topics", None),
+            row["columns"],
+            int(value(row, "random_state", 77)),
+            int(value(row, "min_cluster_size", 10)),
+        )
+        for _, row in meta.iterrows()
+    ]
+    model_dir = Path(target_dir) / "models"
+    return {name for name in names if (model_dir / name).exists()}
+
+
+def save_inputs(
+    target_dir: Union[str, Path], col_str: str, df: pandas.DataFrame, embeddings: numpy.ndarray
+) -> Path:
+    # Documents and embeddings of a column set, read by sweep workers and by
+    # the deferred figure stage in figures.py
+    inputs_dir = Path(target_dir) / "inputs"
+    inputs_dir.mkdir(parents=True, exist_ok=True)
+    numpy.save(inputs_dir / f"{col_str}.npy", embeddings)
+    return write_columns(df, inputs_dir / f"{col_str}.arrow")
+
+
+def _attach_shared(name: str, shape: Tuple[int, ...], dtype: str) -> numpy.ndarray:
+    try:
+        shm = shared_memory.SharedMemory(name=name, track=False)
+    except TypeError:
+        # Before Python 3.13 attaching registers the segment with the resource
+        # tracker, which would unlink it when this worker exits
+        from multiprocessing import resource_tracker
+        shm = shared_memory.SharedMemory(name=name)
+        resource_tracker.unregister(shm._name, "shared_memory")
+    _worker_state["shm"] = shm
+    return numpy.ndarray(shape, dtype=dtype, buffer=shm.buf)
+
+
+def _detach_shared():
+    # Drops the previous column set's embeddings and closes its segment, so
+    # a worker maps one column set at a time
+    _worker_state.pop("embeddings", None)
+    shm = _worker_state.pop("shm", None)
+    if shm is None:
+        return
+    try:
+        shm.close()
+    except BufferError:
+        # Something still holds a view of the embeddings; the mapping then
+        # goes when the worker exits
+        logger.warning(f"Shared embeddings {shm.name} are still in use, not closing them")
+
+
+def _init_worker(embedding_model_name: str):
+    # Forked workers inherit the parent's model (see run_sweep); only workers
+    # started from scratch load their own copy
+    if "embedding_model" in _worker_state:
+        return
+    from sentence_transformers import SentenceTransformer
+
+    _worker_state["embedding_model"] = SentenceTransformer(embedding_model_name)
+
+
+def _shareable_by_fork(embedding_model) -> bool:
+    # A CUDA context does not survive fork, so only CPU models are inherited
+    device = getattr(embedding_model, "device", None)
+    return (multiprocessing.get_start_method() == "fork"
+            and getattr(device, "type", "cpu") == "cpu")
+
+
+def _cuda_initialized() -> bool:
+    torch = sys.modules.get("torch")
+    return torch is not None and torch.cuda.is_initialized()
+
+
+def _pool_context(backend: str, embedding_model):
+    # Forked workers of a parent that has touched CUDA fail with "Cannot
+    # re-initialize CUDA in forked subprocess", so only a pure CPU sweep forks
+    if (backend == "cpu" and _shareable_by_fork(embedding_model)
+            and not _cuda_initialized()):
+        return multiprocessing.get_context("fork")
+    return multiprocessing.get_context("spawn")
+
+
+def _run_config(task: Dict) -> List[Dict]:
+    # One task per UMAP reduction: its cluster sizes run here one after the
+    # other, so the first fit computes the reduction and the rest read it
+    # from the cache, instead of several workers computing it at once
+    from topic_modelling import run_bert
+
+    col_str = task["col_str"]
+    if _worker_state.get("col_str") != col_str:
+        _detach_shared()
+        df = read_columns(task["inputs_path"])
+        _worker_state["col_str"] = col_str
+        _worker_state["df"] = df
+        _worker_state["docs"] = df["cleaned_full_text"].tolist()
+        _worker_state["embeddings"] = _attach_shared(*task["embeddings"])
+    results = []
+    for min_cluster_size in task["min_cluster_sizes"]:
+        try:
+            results.append(run_bert(
+                _worker_state["df"],
+                _worker_state["docs"],
+                _worker_state["embedding_model"],
+                _worker_state["embeddings"],
+                task["target_dir"],
+                col_str,
+                n_neighbors=task["n_neighbors"],
+                nr_topics=task["nr_topics"],
+                random_state=task["random_state"],
+                min_cluster_size=min_cluster_size,
+                record_metadata=False,
+                backend=task["backend"],
+                n_threads=task["n_threads"],
+                **task["run_bert_kwargs"],
+            ))
+        except Exception:
+            # Failed configurations have no metadata row, so a resumed
+            # sweep retries them
+            logger.exception(f"Sweep configuration failed: nn{task['n_neighbors']} "
+                             f"{col_str} min_cluster_size={min_cluster_size}")
+    return results
+
+
+def run_sweep(
+    target_dir: Union[str, Path],
+    column_inputs: Iterable[Tuple[str, pandas.DataFrame, numpy.ndarray]],
+    embedding_model,
+    embedding_model_name: str,
+    nn_range: Iterable[int],
+    random_states: Iterable[Optional[int]] = (77,),
+    min_cluster_sizes: Iterable[int] = (10,),
+    nr_topics: Union[None, str, int] = None,
+    max_workers: int = 1,
+    resume: bool = True,
+    backend: str = "auto",
+    n_threads: Optional[int] = None,
+    **run_bert_kwargs,
+):
+    """Run run_bert over every (column set, n_neighbors, random_state,
+    min_cluster_size).
+
+    column_inputs yields (col_str, df, embeddings) and is consumed lazily, so
+    configurations of one column set are already running while the next one
+    is prepared. With max_workers > 1 the configurations run in a process
+    pool: each column set's embeddings are placed in shared memory once and
+    its documents in an Arrow file the workers read. Metadata rows are only
+    written by this process, as results come in, so concurrent runs never
+    interleave writes to metadata.csv. With resume, configurations whose
+    metadata row and saved model already exist are skipped. All cluster
+    sizes of one UMAP reduction run in the same task, so each reduction is
+    computed once and then read from the reduction cache. A configuration
+    that fails is logged and skipped, with or without a pool, and retried by
+    a resumed sweep. Each column set's shared memory is freed once its
+    tasks have finished. Figures are not
+    rendered during the sweep; the inputs they need are saved under inputs/
+    for figures.py. On the CPU backend the cores are split evenly between
+    workers unless n_threads is given. With the CPU backend and a CPU
+    embedding model, workers are forked and share the model already loaded
+    here; otherwise (cuML or CUDA) they are spawned and load their own. Any
+    other keyword arguments, such as the evaluation mode, are passed on to
+    run_bert.
+    """
+    run_bert_kwargs.setdefault("figures", False)
+    target_dir = Path(target_dir)
+    path_metadata_csv = target_dir / "metadata.csv"
+    done = completed_models(target_dir) if resume else set()
+    nn_range = list(nn_range)
+    random_states = list(random_states)
+    min_cluster_sizes = list(min_cluster_sizes)
+    if n_threads is None and max_workers > 1:
+        n_threads = max(1, (os.cpu_count() or 1) // max_workers)
+
+    def pending(col_str):
+        # Grouped by reduction: (n_neighbors, random_state, cluster sizes to run)
+        for random_state in random_states:
+            for n_neighbors in nn_range:
+                sizes = []
+                for min_cluster_size in min_cluster_sizes:
+                    name = make_model_name(n_neighbors, nr_topics, col_str,
+                                           random_state, min_cluster_size)
+                    if name in done:
+                        logger.info(f"Skipping {name}, already in {path_metadata_csv}")
+                        continue
+                    sizes.append(min_cluster_size)
+                if sizes:
+                    yield n_neighbors, random_state, sizes
+
+    if max_workers <= 1:
+        from topic_modelling import run_bert
+
+        for col_str, df, embeddings in column_inputs:
+            save_inputs(target_dir, col_str, df, embeddings)
+            docs = df["cleaned_full_text"].tolist()
+            for n_neighbors, random_state, sizes in pending(col_str):
+                logger.info(f"Running neighbors: {n_neighbors} with columns: {col_str}")
+                for min_cluster_size in sizes:
+                    try:
+                        metadata = run_bert(
+                            df, docs, embedding_model, embeddings, target_dir, col_str,
+                            n_neighbors=n_neighbors, nr_topics=nr_topics,
+                            random_state=random_state, record_metadata=False,
+                            backend=backend, n_threads=n_threads,
+                            min_cluster_size=min_cluster_size, **run_bert_kwargs,
+                        )
+                    except Exception:
+                        # As in the pool: logged, and retried by a resumed sweep
+                        logger.exception(f"Sweep configuration failed: nn{n_neighbors} "
+                                         f"{col_str} min_cluster_size={min_cluster_size}")
+                        continue
+                    append_metadata(path_metadata_csv, metadata)
+            logger.info(f"Finished running BERTopic for {col_str}")
+        return
+
+    # Shared embeddings by segment name, with the number of their column
+    # set's tasks still running
+    segments: Dict[str, shared_memory.SharedMemory] = {}
+    remaining: Dict[str, int] = {}
+    futures = {}
+
+    def release(name: str):
+        shm = segments.pop(name)
+        shm.close()
+        shm.unlink()
+
+    def collect(block_until_one: bool):
+        if not futures:
+            return
+        finished, _ = wait(
+            list(futures), timeout=None if block_until_one else 0, return_when=FIRST_COMPLETED
+        )
+        for future in finished:
+            name = futures.pop(future)
+            try:
+                for metadata in future.result():
+                    append_metadata(path_metadata_csv, metadata)
+            except Exception:
+                logger.exception("Sweep task failed")
+            remaining[name] -= 1
+            if not remaining[name]:
+                # Every task of the column set is done with its embeddings
+                release(name)
+
+    context = _pool_context(select_backend(backend), embedding_model)
+    if context.get_start_method() == "fork":
+        _worker_state["embedding_model"] = embedding_model
+    try:
+        with ProcessPoolExecutor(
+            max_workers=max_workers,
+            mp_context=context,
+            initializer=_init_worker,
+            initargs=(embedding_model_name,),
+        ) as executor:
+            for col_str, df, embeddings in column_inputs:
+                embeddings = numpy.ascontiguousarray(embeddings)
+                shm = shared_memory.SharedMemory(create=True, size=max(embeddings.nbytes, 1))
+                segments[shm.name] = shm
+                remaining[shm.name] = 0
+                numpy.ndarray(embeddings.shape, embeddings.dtype, buffer=shm.buf)[:] = embeddings
+                inputs_path = save_inputs(target_dir, col_str, df, embeddings)
+                for n_neighbors, random_state, sizes in pending(col_str):
+                    remaining[shm.name] += 1
+                    futures[executor.submit(_run_config, {
+                        "target_dir": str(target_dir),
+                        "col_str": col_str,
+                        "inputs_path": str(inputs_path),
+                        "embeddings": (shm.name, embeddings.shape, embeddings.dtype.str),
+                        "n_neighbors": n_neighbors,
+                        "nr_topics": nr_topics,
+                        "random_state": random_state,
+                        "min_cluster_sizes": sizes,
+                        "backend": backend,
+                        "n_threads": n_threads,
+                        "run_bert_kwargs": run_bert_kwargs,
+                    })] = shm.name
+                if not remaining[shm.name]:
+                    release(shm.name)
+                collect(block_until_one=False)
+            while futures:
+                collect(block_until_one=True)
+    finally:
+        _worker_state.pop("embedding_model", None)
+        for name in list(segments):
+            release(name)
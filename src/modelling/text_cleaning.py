@@ -0,0 +1,130 @@
+import os
+import re
+from concurrent.futures import Executor, ProcessPoolExecutor
+from typing import Dict, Hashable, Iterable, List, Optional
+
+import pandas
+from loguru import logger
+
+
+# The five free-text sections of a REF impact case study
+cols = [
+    "1. Summary of the impact",
+    "2. Underpinning research",
+    "3. References to the research",
+    "4. Details of the impact",
+    "5. Sources to corroborate the impact",
+]
+
+# Section headers and REF template boilerplate, in the order they used to be
+# removed one str.replace at a time. Longer variants come first so that the
+# alternation prefers them over their shorter prefixes.
+boilerplate = [
+    "summary of the impact indicative maximum 100 words ",
+    "summary of the impact ",
+    "underpinning research indicative maximum 500 words ",
+    "underpinning research ",
+    "references to the research indicative maximum of six references ",
+    "references to the research ",
+    "details of the impact indicative maximum 750 words ",
+    "details of the impact ",
+    "sources to corroborate the impact indicative maximum of 10 references ",
+    "sources to corroborate the impact ",
+    # New after ngram searches, noting issues with above:
+    "indicative maximum of six references",
+    "indicative maximum words",
+    "indicative maximum of references",
+    "text redacted for publication",
+    "text redacted",
+    "text removed for publication",
+    "supplied by hei on request",
+]
+
+URL_RE = re.compile(r"http\S+")
+NON_ALPHA_RE = re.compile("[^a-zA-Z]+")
+BOILERPLATE_RE = re.compile("|".join(re.escape(b) for b in boilerplate))
+
+# Cleaned sections keyed by (workbook, column), so that every column set
+# reuses them
+_section_cache: Dict[Hashable, pandas.Series] = {}
+
+
+def clean_free_text(s: str):
+    # Imported here so that importing this module stays cheap
+    import markdown
+    from bs4 import BeautifulSoup
+
+    content = markdown.markdown(s)
+    soup = BeautifulSoup(content, "html.parser")
+    s = soup.get_text()
+    s = s.lower()
+    s = URL_RE.sub("", s)
+    s = NON_ALPHA_RE.sub(" ", s)
+    # Note: re.sub to a-zA-Z means that the following regex for X words doesnt hit
+    s = BOILERPLATE_RE.sub("", s)
+    return s.strip()
+
+
+def _clean_chunk(chunk: List[str]):
+    return [clean_free_text(s) for s in chunk]
+
+
+def clean_texts(
+    texts: Iterable[str],
+    n_jobs: Optional[int] = None,
+    chunksize: int = 256,
+    executor: Optional[Executor] = None,
+) -> List[str]:
+    # An existing executor can be passed in so that callers cleaning many
+    # batches do not start a new pool for each one
+    texts = list(texts)
+    # Duplicate texts (e.g. empty or "nan" sections) are only cleaned once
+    unique = list(dict.fromkeys(texts))
+    n_jobs = n_jobs or os.cpu_count() or 1
+    chunks = [unique[i:i + chunksize] for i in range(0, len(unique), chunksize)]
+    if executor is not None and len(chunks) > 1:
+        cleaned = [s for chunk in executor.map(_clean_chunk, chunks) for s in chunk]
+    elif executor is not None or n_jobs == 1 or len(chunks) <= 1:
+        cleaned = _clean_chunk(unique)
+    else:
+        with ProcessPoolExecutor(max_workers=n_jobs) as executor:
+            cleaned = [s for chunk in executor.map(_clean_chunk, chunks) for s in chunk]
+    lookup = dict(zip(unique, cleaned))
+    return [lookup[s] for s in texts]
+
+
+def clean_sections(
+    df: pandas.DataFrame,
+    columns: List[str],
+    cache_key: Optional[Hashable] = None,
+    n_jobs: Optional[int] = None,
+) -> pandas.DataFrame:
+    cached = {}
+    if cache_key is not None:
+        for col in columns:
+            series = _section_cache.get((cache_key, col))
+            if series is not None and series.index.equals(df.index):
+                cached[col] = series
+    missing = [col for col in columns if col not in cached]
+    if missing:
+        logger.info(f"Cleaning {len(missing)} sections for {len(df)} case studies")
+        raw = [df[col].astype(str).tolist() for col in missing]
+        # All sections go through the pool together so the chunks stay busy
+        cleaned = clean_texts([s for texts in raw for s in texts], n_jobs=n_jobs)
+        for i, col in enumerate(missing):
+            cached[col] = pandas.Series(
+                cleaned[i * len(df):(i + 1) * len(df)], index=df.index
+            )
+            if cache_key is not None:
+                _section_cache[(cache_key, col)] = cached[col]
+    return pandas.DataFrame({col: cached[col] for col in columns}, index=df.index)
+
+
+def join_sections(sections: pandas.DataFrame, columns: List[str]) -> pandas.Series:
+    # Equivalent to cleaning the newline-joined raw text, since the newline
+    # between sections is collapsed into a single space by NON_ALPHA_RE
+    return pandas.Series(
+        [" ".join(filter(None, parts)) for parts in zip(*(sections[c] for c in columns))],
+        index=sections.index,
+    )
+
@@ -1,104 +1,78 @@
 import os
 import sys
-import re
 import shutil
 from collections import Counter
 from pathlib import Path
-from typing import List, Union
+from typing import TYPE_CHECKING, Iterable, List, Optional, Union
 
 import numpy
 import pandas
 import warnings
 
-from bs4 import BeautifulSoup
 from loguru import logger
-from sentence_transformers import SentenceTransformer
-from sklearn.metrics import silhouette_score
-
-from bertopic import BERTopic
-from bertopic.representation import KeyBERTInspired
-from bertopic.vectorizers import ClassTfidfTransformer
-
-from sklearn.feature_extraction.text import CountVectorizer
-
-from cuml.cluster import HDBSCAN
-from cuml.manifold import UMAP
-
-import markdown
-
-
-cols = [
-    "1. Summary of the impact",
-    "2. Underpinning research",
-    "3. References to the research",
-    "4. Details of the impact",
-    "5. Sources to corroborate the impact",
-]
-
-
-def clean_free_text(s: str):
-    content = markdown.markdown(s)
-    soup = BeautifulSoup(content, "html.parser")
-    s = soup.get_text()
-    s = s.lower()
-    s = re.sub(r"http\S+", "", s)
-    s = re.sub("[^a-zA-Z]+", " ", s)
-    # Note: re.sub to a-zA-Z means that the following regex for X words doesnt hit
-    s = s.replace("summary of the impact indicative maximum 100 words ", "")
-    s = s.replace("summary of the impact ", "")
-    s = s.replace("underpinning research indicative maximum 500 words ", "")
-    s = s.replace("underpinning research ", "")
-    s = s.replace(
-        "references to the research indicative maximum of six references ", ""
-    )
-    s = s.replace("references to the research ", "")
-    s = s.replace("details of the impact indicative maximum 750 words ", "")
-    s = s.replace("details of the impact ", "")
 
-    s = s.replace(
-        "sources to corroborate the impact indicative maximum of 10 references ", ""
-    )
-    s = s.replace("sources to corroborate the impact ", "")
-
-    # New after ngram searches, noting issues with above:
-    s = s.replace('indicative maximum of six references', '')
-    s = s.replace('indicative maximum words', '')
-    s = s.replace('indicative maximum of references', '')
-    s = s.replace("text redacted for publication", "")
-    s = s.replace('text redacted', '')
-    s = s.replace("text removed for publication", "")
-    s = s.replace("supplied by hei on request", "")
-    return s.strip()
-
-def make_freqs(df_to_clean, ngrams):
-    logger.info(f'Calculating {ngrams}-gram frequencies')
-    word_vectorizer = CountVectorizer(ngram_range=(ngrams, ngrams), analyzer='word')
-    sparse_matrix = word_vectorizer.fit_transform(df_to_clean["cleaned_full_text"])
-    frequencies = sum(sparse_matrix).toarray()[0]
-    df_to_clean = pandas.DataFrame(frequencies,
-                                   index=word_vectorizer.get_feature_names_out(),
-                                   columns=['frequency']).sort_values(by='frequency',
-                                                                      ascending=False)
-    csv_path = os.path.join(os.getcwd(),
-                            'data',
-                            'text_processed',
-                            f'{ngrams}-gram_frequencies.csv')
-    df_to_clean.to_csv(csv_path)
-
-
-def prepare_full_texts(excel_path: Union[str, Path], col_index: List[int]):
-    df = pandas.read_excel(excel_path)
+# Makes src importable, for the code the pipeline's stages share in src/common
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from common.profiling import Profiler
+from columnar_cache import available_columns, ingest_workbook, read_columns, write_columns
+from embedding_cache import EmbeddingCache
+from figures import render_figures
+from ngrams import ngram_frequencies
+from engines import make_hdbscan, select_backend, set_cpu_threads
+from reduction_cache import CachedUMAP
+from sweep import append_metadata, make_model_name, run_sweep
+from text_cleaning import clean_free_text, clean_sections, cols, join_sections
+
+if TYPE_CHECKING:
+    from sentence_transformers import SentenceTransformer
+
+
+column_sets = {
+    'column12345': [0, 1, 2, 3, 4],
+    'columns1': [0],
+    'columns2': [1],
+    'columns3': [2],
+    'columns4': [3],
+    'columns5': [4],
+    'columns23': [1, 2],
+    'columns45': [3, 4],
+    'columns124': [0, 1, 3]
+}
+
+
+def make_freqs(texts, orders=range(1, 6), min_count=1, top_k=None):
+    # Every order is counted from one tokenisation of the corpus
+    logger.info(f'Calculating n-gram frequencies for n in {list(orders)}')
+    frequencies = ngram_frequencies(texts, orders, min_count=min_count, top_k=top_k)
+    for ngrams, freqs in frequencies.items():
+        csv_path = os.path.join(os.getcwd(),
+                                'data',
+                                'text_processed',
+                                f'{ngrams}-gram_frequencies.csv')
+        freqs.to_csv(csv_path)
+
+
+def prepare_full_texts(
+    excel_path: Union[str, Path], col_index: List[int], calculate_frequencies: bool = False
+):
+    arrow_path = ingest_workbook(excel_path)
     columns_to_use = [cols[i] for i in col_index]
-    df["full_text"] = df.apply(
-        lambda row: "\n".join(str(row[col]) for col in columns_to_use), axis=1
-    )
-    df["cleaned_full_text"] = df["full_text"].apply(clean_free_text)
-    df = df[df['REF impact case study identifier'].notnull()]
-    if sys.argv[4] == "Calculate_Frequencies":
+    # Metadata columns plus only the sections this column set needs
+    df = read_columns(arrow_path, [col for col in available_columns(arrow_path)
+                                   if col not in cols or col in columns_to_use])
+    df = df[df['REF impact case study identifier'].notnull()].copy()
+    full_text = df[columns_to_use[0]].astype(str)
+    for col in columns_to_use[1:]:
+        full_text = full_text + "\n" + df[col].astype(str)
+    df["full_text"] = full_text
+    # Every section is cleaned once per workbook and shared by all column sets
+    sections = clean_sections(df, columns_to_use, cache_key=str(arrow_path))
+    df["cleaned_full_text"] = join_sections(sections, columns_to_use)
+    if calculate_frequencies:
         if all(i in col_index for i in range(0, 5)):
             logger.info('Making ngrams/cleaned dataset for inspection on full col_index')
-            for n in range(1, 6):
-                make_freqs(df.copy(), n)
+            make_freqs(df["cleaned_full_text"], range(1, 6))
             output_path = os.path.join(os.getcwd(),
                                        'data',
                                        'text_processed',
@@ -107,17 +81,76 @@ def prepare_full_texts(excel_path: Union[str, Path], col_index: List[int]):
     return df
 
 
+def prepare_section_texts(excel_path: Union[str, Path]):
+    arrow_path = ingest_workbook(excel_path)
+    df = read_columns(arrow_path, ['REF impact case study identifier'] + cols)
+    df = df[df['REF impact case study identifier'].notnull()]
+    return clean_sections(df, cols, cache_key=str(arrow_path))
+
+
+def embed_sections(
+    sections: pandas.DataFrame,
+    embedding_model: "SentenceTransformer",
+    embedding_cache: EmbeddingCache,
+):
+    # One encode per section, shape (n_docs, n_sections, dim), alongside the
+    # word count of every section for length weighting when pooling
+    section_embeddings = numpy.stack(
+        [
+            embedding_cache.encode(
+                embedding_model, sections[col].tolist(), show_progress_bar=True
+            )
+            for col in cols
+        ],
+        axis=1,
+    )
+    section_lengths = numpy.stack(
+        [sections[col].str.split().str.len().to_numpy() for col in cols], axis=1
+    ).astype(numpy.float32)
+    return section_embeddings, section_lengths
+
+
+def pool_section_embeddings(
+    section_embeddings: numpy.ndarray,
+    section_lengths: numpy.ndarray,
+    col_index: List[int],
+):
+    weights = section_lengths[:, col_index]
+    totals = weights.sum(axis=1, keepdims=True)
+    # Case studies whose selected sections are all empty fall back to an
+    # unweighted mean rather than dividing by zero
+    weights = numpy.where(totals > 0, weights, 1.0)
+    weights = weights / weights.sum(axis=1, keepdims=True)
+    pooled = numpy.einsum("ns,nsd->nd", weights, section_embeddings[:, col_index])
+    norms = numpy.linalg.norm(pooled, axis=1, keepdims=True)
+    return pooled / numpy.where(norms > 0, norms, 1.0)
+
+
 def run_bert(
     df: pandas.DataFrame,
     docs: List[str],
-    embedding_model: SentenceTransformer,
+    embedding_model: "SentenceTransformer",
     embeddings: numpy.ndarray,
     target_dir: Union[str, Path],
     col_str: str,
     n_neighbors: int = 15,
     nr_topics: Union[None, str, int] = "auto",
-    random_state: int = 77,
+    random_state: Optional[int] = 77,
+    record_metadata: bool = True,
+    backend: str = "auto",
+    n_threads: Optional[int] = None,
+    min_cluster_size: int = 10,
+    evaluation: str = "chunked",
+    dbcv: bool = False,
+    figures: bool = True,
 ):
+    # BERTopic and its dependencies are only imported once a model is fitted
+    from bertopic import BERTopic
+    from bertopic.representation import KeyBERTInspired
+    from bertopic.vectorizers import ClassTfidfTransformer
+
+    from evaluation import evaluate_clustering
+
     model_dir = Path(target_dir) / "models"
     output_dir = Path(target_dir) / "output"
     fig_dir = Path(target_dir) / "figures"
@@ -130,21 +163,31 @@ def run_bert(
     if os.path.exists(fig_dir) is False:
         fig_dir.mkdir(parents=True, exist_ok=True)
         logger.info(f"Created figure directory at: {fig_dir.absolute()}")
-    model_name = f'nn{n_neighbors}{f"_nr{nr_topics}" if nr_topics is not None else ""}_{col_str}'
+    model_name = make_model_name(
+        n_neighbors, nr_topics, col_str, random_state, min_cluster_size
+    )
     path_metadata_csv = Path(target_dir) / "metadata.csv"
     representation_model = KeyBERTInspired()
-    umap_model = UMAP(
+    backend = select_backend(backend)
+    if backend == "cpu":
+        n_threads = set_cpu_threads(n_threads)
+    # Reductions are cached on disk, so clustering-only changes and the
+    # silhouette score below reuse them instead of running UMAP again
+    umap_model = CachedUMAP(
+        backend,
         n_neighbors=n_neighbors,
         n_components=5,
-        init="random",
         min_dist=0.0,
         metric="cosine",
         random_state=random_state,
+        n_threads=n_threads,
     )
-    hsdb_model = HDBSCAN(
-        min_cluster_size=10,
+    hsdb_model = make_hdbscan(
+        backend,
+        min_cluster_size=min_cluster_size,
         metric="euclidean",
         prediction_data=True,
+        n_threads=n_threads,
     )
     ctfidf_model = ClassTfidfTransformer(reduce_frequent_words=True)
     topic_model = BERTopic(
@@ -159,7 +202,17 @@ def run_bert(
         ctfidf_model=ctfidf_model,
         nr_topics=nr_topics,
     )
-    topics, probs = topic_model.fit_transform(docs, embeddings)
+    # BERTopic's internal steps are timed by wrapping them on this instance
+    profiler = Profiler(model_name)
+    profiler.wrap(topic_model, "_reduce_dimensionality", "umap")
+    profiler.wrap(topic_model, "_cluster_embeddings", "hdbscan")
+    profiler.wrap(topic_model, "_c_tf_idf", "ctfidf")
+    profiler.wrap(representation_model, "extract_topics", "representation")
+    try:
+        with profiler.stage("fit", items=len(docs)):
+            topics, probs = topic_model.fit_transform(docs, embeddings)
+    finally:
+        profiler.restore()
     topic_model.save(model_dir / model_name)
     topics_counter = Counter(topics)
     outliers_count = topics_counter.get(-1, 0)
@@ -174,74 +227,129 @@ def run_bert(
     df["BERT_topic"] = topic_model.topics_
     df["BERT_prob"] = [max(i) for i in topic_model.probabilities_]
     df.to_excel(Path(target_dir) / "output" / f"{model_name}.xlsx")
-    fig_topic = topic_model.visualize_documents(
-        docs, hide_document_hover=True, hide_annotations=True
-    )
-    fig_topic.write_html(fig_dir.joinpath(f"{model_name}.html"))
-    fig_topic_hierarchy = topic_model.visualize_hierarchy()
-    fig_topic_hierarchy.write_html(fig_dir.joinpath(f"{model_name}_hierarchy.html"))
-    silhouette = calculate_silhouette_score(
-        topic_model, embeddings, topic_model.topics_
-    )
+    write_columns(df, Path(target_dir) / "output" / f"{model_name}.arrow")
+    if figures:
+        with profiler.stage("figures"):
+            render_figures(topic_model, docs, embeddings, fig_dir, model_name, backend)
+    # The reduction is served from the cache rather than recomputed
+    with profiler.stage("evaluation", items=len(docs)):
+        cluster_metrics = evaluate_clustering(
+            topic_model.umap_model.transform(embeddings),
+            topic_model.topics_,
+            mode=evaluation,
+            dbcv=dbcv,
+            random_state=random_state,
+        )
     metadata = {
+        "model_name": model_name,
         "random_state": random_state,
         "n_neighbors": n_neighbors,
+        "min_cluster_size": min_cluster_size,
         "nr_topics": nr_topics,
         "topics_count": topics_count,
         "outliers_count": outliers_count,
         "columns": col_str,
-        "silhouette_score": silhouette
+        **cluster_metrics,
+        "backend": backend,
+        **profiler.summary(),
     }
+    profiler.write_trace(Path(target_dir) / "profiles" / f"{model_name}.json",
+                         metadata=metadata)
     logger.info(metadata)
-    pandas.DataFrame([metadata]).to_csv(
-        path_metadata_csv,
-        mode="a",
-        header=not path_metadata_csv.exists(),
-        index=False,
-    )
+    if record_metadata:
+        append_metadata(path_metadata_csv, metadata)
+    return metadata
 
 
 def calculate_silhouette_score(topic_model, embeddings, topics):
+    from evaluation import evaluate_clustering
+
     umap_embeddings = topic_model.umap_model.transform(embeddings)
-    indices = [index for index, topic in enumerate(topics) if topic != -1]
-    X = umap_embeddings[numpy.array(indices)]
-    labels = [topic for topic in topics if topic != -1]
-    return silhouette_score(X, labels)
+    return evaluate_clustering(umap_embeddings, topics, mode="exact")["silhouette_score"]
 
 
-if __name__ == "__main__":
-    if sys.argv[3] == 'Clean_Run':
+def sweep_workbook(
+    excel_path: Union[str, Path],
+    target_dir: Union[str, Path],
+    clean_run: bool = False,
+    calculate_frequencies: bool = False,
+    embedding_mode: str = 'Full_Text',
+    max_workers: int = 1,
+    backend: str = 'auto',
+    nn_range: Iterable[int] = range(2, 27),
+    embedding_model_name: str = "all-MiniLM-L6-v2",
+    random_states: Iterable[Optional[int]] = (77,),
+    evaluation: str = 'chunked',
+    dbcv: bool = False,
+):
+    from sentence_transformers import SentenceTransformer
+
+    if clean_run:
         try:
-            shutil.rmtree(sys.argv[2])
-            print(f"Directory '{sys.argv[2]}' and its contents deleted successfully.")
+            shutil.rmtree(target_dir)
+            print(f"Directory '{target_dir}' and its contents deleted successfully.")
         except OSError as e:
-            print(f"Error deleting directory '{sys.argv[2]}': {e}")
-    embedding_model = SentenceTransformer("all-MiniLM-L6-v2")
-    nn_range = range(2, 27)
-    for col_str, col_index in ({
-        'column12345': [0, 1, 2, 3, 4],
-        'columns1': [0],
-        'columns2': [1],
-        'columns3': [2],
-        'columns4': [3],
-        'columns5': [4],
-        'columns23': [1, 2],
-        'columns45': [3, 4],
-        'columns124': [0, 1, 3]
-    }).items():
-        df = prepare_full_texts(sys.argv[1], col_index)
-        docs = df["cleaned_full_text"].tolist()
-        embeddings = embedding_model.encode(docs, show_progress_bar=True)
-        for i in nn_range:
-            logger.info(f"Running neighbors: {i} with columns: {col_str}")
-            run_bert(
-                df,
-                docs,
-                embedding_model,
-                embeddings,
-                sys.argv[2],
-                col_str,
-                n_neighbors=i,
-                nr_topics=None,
+            print(f"Error deleting directory '{target_dir}': {e}")
+    # Loaded once here and shared by the embedding step and the sweep
+    embedding_model = SentenceTransformer(embedding_model_name)
+    # Lives outside the target directory so that Clean_Run keeps it
+    embedding_cache = EmbeddingCache(embedding_model_name)
+    # Full_Text encodes every column combination from its joined text;
+    # Section_Pooled encodes the five sections once and pools them per set
+    # Cleaning and embedding happen once per column set, outside run_bert, so
+    # they get their own trace next to the per-model ones
+    profiler = Profiler("inputs")
+    if embedding_mode == 'Section_Pooled':
+        with profiler.stage("cleaning"):
+            sections = prepare_section_texts(excel_path)
+        with profiler.stage("embedding", items=len(sections) * len(cols)):
+            section_embeddings, section_lengths = embed_sections(
+                sections, embedding_model, embedding_cache
             )
-        logger.info(f"Finished running BERTopic for {col_str}")
+    backend = select_backend(backend)
+
+    def column_inputs():
+        for col_str, col_index in column_sets.items():
+            with profiler.stage("cleaning"):
+                df = prepare_full_texts(excel_path, col_index, calculate_frequencies)
+            with profiler.stage("embedding", items=len(df)):
+                if embedding_mode == 'Section_Pooled':
+                    embeddings = pool_section_embeddings(
+                        section_embeddings, section_lengths, col_index
+                    )
+                else:
+                    embeddings = embedding_cache.encode(
+                        embedding_model, df["cleaned_full_text"].tolist(),
+                        show_progress_bar=True
+                    )
+            yield col_str, df, embeddings
+
+    run_sweep(
+        target_dir,
+        column_inputs(),
+        embedding_model,
+        embedding_model_name,
+        nn_range,
+        random_states=random_states,
+        nr_topics=None,
+        max_workers=max_workers,
+        backend=backend,
+        evaluation=evaluation,
+        dbcv=dbcv,
+    )
+    profiler.write_trace(Path(target_dir) / "profiles" / "inputs.json",
+                         embedding_mode=embedding_mode)
+
+
+if __name__ == "__main__":
+    sweep_workbook(
+        sys.argv[1],
+        sys.argv[2],
+        clean_run=sys.argv[3] == 'Clean_Run',
+        calculate_frequencies=sys.argv[4] == "Calculate_Frequencies",
+        embedding_mode=sys.argv[5] if len(sys.argv) > 5 else 'Full_Text',
+        max_workers=int(sys.argv[6]) if len(sys.argv) > 6 else 1,
+        backend=sys.argv[7] if len(sys.argv) > 7 else 'auto',
+        evaluation=sys.argv[8] if len(sys.argv) > 8 else 'chunked',
+        dbcv='DBCV' in sys.argv[9:],
+    )
@@ -1,29 +1,116 @@
 import sys
 import os
+import copy
 from pathlib import Path
 
+import numpy
 import pandas
-from bertopic import BERTopic
-from bertopic.representation import KeyBERTInspired
 from loguru import logger
 
+from columnar_cache import read_columns, write_columns
 
-def get_topic_terms_with_probs(topic_id):
+
+def get_topic_terms_with_probs(topic_model, topic_id):
     return topic_model.get_topic(topic_id)
 
 
-def get_topic_terms_oneline(topic_id):
+def get_topic_terms_oneline(topic_model, topic_id):
     return ",".join([term[0] for term in topic_model.get_topic(topic_id)])
 
 
-if __name__ == "__main__":
-    target_folder = Path(sys.argv[1])
-    model_name = sys.argv[2]
+def reduce_outliers_by_thresholds(topics, probabilities, thresholds):
+    # Vectorised form of reduce_outliers(strategy="probabilities") for every
+    # threshold at once: an outlier moves to its most likely topic when that
+    # probability reaches the threshold. Returns (n_thresholds, n_docs).
+    topics = numpy.asarray(topics)
+    probabilities = numpy.asarray(probabilities)
+    best_topic = probabilities.argmax(axis=1)
+    best_prob = probabilities.max(axis=1)
+    reassign = (topics == -1)[None, :] & (
+        best_prob[None, :] >= numpy.asarray(thresholds)[:, None]
+    )
+    return numpy.where(reassign, best_topic[None, :], topics[None, :])
+
+
+def fresh_copy(topic_model):
+    # update_topics is not idempotent (it trims the outlier topic embedding),
+    # so each assignment gets its own copy. The fitted sub-models and the
+    # probabilities are left untouched by it and are shared, not copied.
+    shared = [topic_model.embedding_model, topic_model.umap_model,
+              topic_model.hdbscan_model, topic_model.probabilities_]
+    return copy.deepcopy(topic_model, memo={id(obj): obj for obj in shared})
+
+
+def wide_table(docs, topics_long, terms_long):
+    # The historical layout: two columns per threshold next to the documents
+    topics_terms = topics_long.merge(terms_long, on=["threshold", "topic"], how="left")
+    wide = [docs.reset_index(drop=True)]
+    for threshold, group in topics_terms.groupby("threshold", sort=True):
+        group = group.reset_index(drop=True)
+        wide.append(pandas.DataFrame({
+            f"BERT_topic_reduced{threshold}": group["topic"],
+            f"BERT_topic_terms_reduced{threshold}": group["terms"],
+        }))
+    return pandas.concat(wide, axis=1)
+
+
+def parse_save_thresholds(arg, thresholds):
+    # "All", "None", or a comma-separated list of thresholds to persist
+    if arg is None or arg == "None":
+        return set()
+    if arg == "All":
+        return set(thresholds)
+    requested = [float(t) for t in arg.split(",")]
+    return {t for t in thresholds if any(numpy.isclose(t, r) for r in requested)}
+
+
+def threshold_sweep(topic_model, docs, thresholds, representation_model,
+                    save_thresholds=(), save_prefix=None):
+    """Outlier assignments for every threshold, shape (n_thresholds, n_docs),
+    and (threshold, topic, terms) rows of the topic representations.
+
+    Models for save_thresholds are saved as <save_prefix>_threshold<t>.
+    """
+    assignments = reduce_outliers_by_thresholds(
+        topic_model.topics_, topic_model.probabilities_, thresholds
+    )
+    # Thresholds are increasing, so identical assignments are contiguous and
+    # representations only need updating where the assignment changes
+    changed = numpy.r_[True, (assignments[1:] != assignments[:-1]).any(axis=1)]
+    logger.info(f"{changed.sum()} distinct assignments over {len(thresholds)} thresholds")
+    terms_rows = []
+    for i, threshold in enumerate(thresholds):
+        logger.info(f"Reducing outliers with threshold {threshold}")
+        if changed[i]:
+            reduced_model = fresh_copy(topic_model)
+            reduced_model.update_topics(
+                docs, topics=assignments[i].tolist(),
+                representation_model=representation_model
+            )
+            terms = {
+                topic: get_topic_terms_oneline(reduced_model, topic)
+                for topic in numpy.unique(assignments[i])
+            }
+        if threshold in save_thresholds:
+            reduced_model.save(f"{save_prefix}_threshold{threshold}")
+        terms_rows.extend((threshold, int(topic), topic_terms)
+                          for topic, topic_terms in terms.items())
+    return assignments, terms_rows
+
+
+def reduce_topics(target_folder, model_name, docs_path, save="All", export_excel=False):
+    # BERTopic is only imported once there is a model to reduce
+    from bertopic import BERTopic
+    from bertopic.representation import KeyBERTInspired
+
+    target_folder = Path(target_folder)
     model_path = target_folder / "models" / model_name
     reduced_model_dir = target_folder / "reduced_model"
     reduced_model_dir.mkdir(parents=True, exist_ok=True)
     step = 0.001
-    df = pandas.read_excel(sys.argv[3])
+    # Accepts the .xlsx or the .arrow output of run_bert; workbooks are
+    # converted to the columnar cache on first use
+    df = read_columns(docs_path)
     oldmodel_topic = pandas.read_csv(os.path.join(os.getcwd(),
                                                   'data',
                                                   'old_model',
@@ -54,22 +141,36 @@ if __name__ == "__main__":
 
     docs = df["cleaned_full_text"].tolist()
     representation_model = KeyBERTInspired()
-    for i in range(0, 51):
-        logger.info(f"Reducing outliers with threshold {step*i}")
-        topic_model = BERTopic.load(model_path)
-        new_topics = topic_model.reduce_outliers(
-            docs,
-            topic_model.topics_,
-            probabilities=topic_model.probabilities_,
-            threshold=step * i,
-            strategy="probabilities",
-        )
-        topic_model.update_topics(
-            docs, topics=new_topics, representation_model=representation_model
+    thresholds = [step * i for i in range(0, 51)]
+    save_thresholds = parse_save_thresholds(save, thresholds)
+    topic_model = BERTopic.load(model_path)
+    assignments, terms_rows = threshold_sweep(
+        topic_model, docs, thresholds, representation_model,
+        save_thresholds=save_thresholds,
+        save_prefix=reduced_model_dir / model_name,
+    )
+
+    doc_ids = df["REF impact case study identifier"].to_numpy()
+    topics_long = pandas.DataFrame({
+        "doc_id": numpy.tile(doc_ids, len(thresholds)),
+        "threshold": numpy.repeat(thresholds, len(doc_ids)),
+        "topic": assignments.ravel(),
+    })
+    terms_long = pandas.DataFrame(terms_rows, columns=["threshold", "topic", "terms"])
+    topics_long.to_parquet(target_folder / f"{model_name}_reduced_topics.parquet", index=False)
+    terms_long.to_parquet(target_folder / f"{model_name}_reduced_terms.parquet", index=False)
+    write_columns(df, target_folder / f"{model_name}_reduced_docs.arrow")
+    if export_excel:
+        wide_table(df, topics_long, terms_long).to_excel(
+            target_folder / f"{model_name}_reduced.xlsx"
         )
-        topic_model.save(reduced_model_dir / f"{model_name}_threshold{step*i}")
-        df[f"BERT_topic_reduced{step*i}"] = pandas.DataFrame(topic_model.topics_)
-        df[f"BERT_topic_terms_reduced{step*i}"] = df[
-            f"BERT_topic_reduced{step*i}"
-        ].apply(get_topic_terms_oneline)
-    df.to_excel(target_folder / f"{model_name}_reduced.xlsx")
+
+
+if __name__ == "__main__":
+    reduce_topics(
+        sys.argv[1],
+        sys.argv[2],
+        sys.argv[3],
+        save=sys.argv[4] if len(sys.argv) > 4 else "All",
+        export_excel="Export_Excel" in sys.argv[5:],
+    )
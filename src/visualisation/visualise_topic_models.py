@@ -1,4 +1,5 @@
 import os
+import sys
 import pandas as pd
 import seaborn as sns
 import matplotlib.pyplot as plt
@@ -8,7 +9,31 @@ from matplotlib.offsetbox import AnchoredText
 from mpl_toolkits.axes_grid1 import make_axes_locatable
 
 
-def main():
+# Metrics written to metadata.csv by run_bert, with their axis labels
+metric_labels = {'silhouette_score': 'Silhouette Score',
+                 'davies_bouldin': 'Davies-Bouldin Index',
+                 'calinski_harabasz': 'Calinski-Harabasz Index',
+                 'dbcv': 'DBCV'}
+# Metrics where a lower value means better separated topics
+lower_is_better = {'davies_bouldin'}
+
+
+def marker_sizes(values, metric):
+    if metric == 'silhouette_score':
+        return values * 2500 - 1000
+    # Other metrics live on different scales, so min-max scale them instead
+    scaled = (values - values.min()) / ((values.max() - values.min()) or 1)
+    if metric in lower_is_better:
+        scaled = 1 - scaled
+    return 20 + scaled * 280
+
+
+def best_index(meta, col, metric):
+    values = meta[meta['columns'] == col][metric]
+    return values.idxmin() if metric in lower_is_better else values.idxmax()
+
+
+def main(metric='silhouette_score'):
     fig, axs = plt.subplots(nrows=1, ncols=2, figsize=(10, 5),
                             sharex=True)
 
@@ -19,13 +44,21 @@ def main():
                                     'topic_modelled',
                                     'metadata.csv'))
 
+    cmap = cm.viridis  # You can change the colormap as needed
+    # Reversed where lower is better, so better models are always brighter
+    if metric in lower_is_better:
+        cmap = cmap.reversed()
+    norm = Normalize(vmin=meta[metric].min(),
+                     vmax=meta[metric].max())
     for ax, col in zip(axs, ['columns124', 'column12345']):
-        # Scatter plot
+        # Scatter plot, coloured by the metric itself on the colorbar's scale
         scatter = ax.scatter(
             x=meta[meta['columns'] == col]['topics_count'],
             y=meta[meta['columns'] == col]['outliers_count'],
-            s=meta[meta['columns'] == col]['silhouette_score'] * 2500 - 1000,
-            c=meta[meta['columns'] == col]['silhouette_score'] * 2500 - 1000,
+            s=marker_sizes(meta[meta['columns'] == col][metric], metric),
+            c=meta[meta['columns'] == col][metric],
+            cmap=cmap,
+            norm=norm,
             edgecolor='k'
         )
         ax.set_ylim(1800, 3200)
@@ -34,14 +67,11 @@ def main():
     # Add colorbar
     divider = make_axes_locatable(axs[1])
     cax = divider.append_axes("right", size="5%", pad=0.1)
-    cmap = cm.viridis  # You can change the colormap as needed
-    norm = Normalize(vmin=meta['silhouette_score'].min(),
-                     vmax=meta['silhouette_score'].max())
     sm = plt.cm.ScalarMappable(cmap=cmap, norm=norm)
     sm.set_array([])
 
     # Add colorbar to the last subplot
-    plt.colorbar(sm, cax=cax, label='Silhouette Score')
+    plt.colorbar(sm, cax=cax, label=metric_labels.get(metric, metric))
 
     # Set titles and labels
     axs[0].set_title('a.', loc='left', fontsize=16)
@@ -68,7 +98,7 @@ def main():
     axs[0].add_artist(at)
 
     # First subplot
-    max_silhouette_idx = meta[meta['columns']=='columns124']['silhouette_score'].idxmax()
+    max_silhouette_idx = best_index(meta, 'columns124', metric)
     max_silhouette_values = meta.loc[max_silhouette_idx,
                                      ['topics_count',
                                       'outliers_count',
@@ -91,7 +121,7 @@ def main():
                    )
 
     # Second subplot
-    max_silhouette_idx = meta[meta['columns']=='column12345']['silhouette_score'].idxmax()
+    max_silhouette_idx = best_index(meta, 'column12345', metric)
     max_silhouette_values = meta.loc[max_silhouette_idx, ['topics_count',
                                                           'outliers_count',
                                                           'n_neighbors']]
@@ -119,8 +149,9 @@ def main():
                              '..',
                              'outputs',
                              'figures',
-                             'model124_v_12345.pdf'),
+                             'model124_v_12345.pdf' if metric == 'silhouette_score'
+                             else f'model124_v_12345_{metric}.pdf'),
                              bbox_inches='tight')
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main(sys.argv[1] if len(sys.argv) > 1 else 'silhouette_score')
\ No newline at end of file
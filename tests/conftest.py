@@ -0,0 +1,9 @@
+import sys
+from pathlib import Path
+
+# The pipeline's scripts import their siblings directly, as when run with
+# python src/<dir>/<script>.py
+src = Path(__file__).resolve().parents[1] / 'src'
+for src_dir in ('modelling', 'data_collection'):
+    sys.path.insert(0, str(src / src_dir))
+sys.path.insert(0, str(src))
@@ -0,0 +1,68 @@
+import pytest
+
+pandas = pytest.importorskip('pandas')
+pytest.importorskip('pyarrow')
+pytest.importorskip('openpyxl')
+pytest.importorskip('markdown')
+pytest.importorskip('bs4')
+pytest.importorskip('loguru')
+
+import columnar_cache
+from columnar_cache import iter_batches, read_columns, write_excel_columns
+from text_cleaning import clean_sections, cols
+
+id_column = 'REF impact case study identifier'
+
+
+@pytest.fixture
+def workbook(tmp_path, monkeypatch):
+    monkeypatch.setattr(columnar_cache, 'default_cache_dir', str(tmp_path / 'cache'))
+    path = tmp_path / 'ics.xlsx'
+    pandas.DataFrame({
+        id_column: ['10001-1', '10002-2', '10003-3'],
+        'Unit of assessment number': [1, 2, 3],
+        cols[0]: ['**Summary** of the impact http://example.org', None, 'Text'],
+        cols[1]: [None, 'Underpinning research 2019', 'More text'],
+        cols[2]: ['References', 'Paper', None],
+        cols[3]: ['Details', None, 'Details'],
+        # A section missing from every case study
+        cols[4]: [None, None, None],
+    }).to_excel(path, index=False)
+    return path
+
+
+def test_missing_sections_read_as_read_excel(workbook):
+    baseline = pandas.read_excel(workbook)
+    cached = read_columns(workbook)
+    for col in cols:
+        assert cached[col].astype(str).tolist() == baseline[col].astype(str).tolist()
+    batched = pandas.concat(list(iter_batches(workbook, cols, batch_size=2)))
+    for col in cols:
+        assert batched[col].astype(str).tolist() == baseline[col].astype(str).tolist()
+
+
+def test_missing_sections_clean_as_read_excel(workbook):
+    baseline = clean_sections(pandas.read_excel(workbook), cols, n_jobs=1)
+    cached = clean_sections(read_columns(workbook), cols, n_jobs=1)
+    assert cached.to_dict('list') == baseline.to_dict('list')
+    # A missing section is the string "nan" before cleaning, as it always was
+    assert cached[cols[1]].iloc[0] == 'nan'
+
+
+@pytest.mark.parametrize('chunk_rows', [1, 2, 10000])
+def test_chunked_ingest_matches_read_excel(tmp_path, chunk_rows):
+    path = tmp_path / 'mixed.xlsx'
+    pandas.DataFrame({
+        id_column: ['10001-1', '10002-2', '10003-3', '10004-4', '10005-5'],
+        # Integers with a blank only in a later chunk widen to float
+        'Unit of assessment number': [1, 2, 3, 4, None],
+        # Text in the first chunk, numbers in a later one
+        'Grant reference': ['AB/1', 'CD/2', 3, 4, 5],
+        cols[0]: ['Summary', None, 'Summary', None, None],
+    }).to_excel(path, index=False)
+    baseline = pandas.read_excel(path)
+    cached = read_columns(write_excel_columns(path, tmp_path / 'mixed.arrow', chunk_rows))
+    assert list(cached.columns) == list(baseline.columns)
+    for col in baseline.columns:
+        assert cached[col].astype(str).tolist() == baseline[col].astype(str).tolist()
+    assert cached['Unit of assessment number'].dtype == baseline['Unit of assessment number'].dtype
@@ -0,0 +1,43 @@
+import sqlite3
+
+from crawl_journal import CrawlJournal
+
+
+def test_failures_are_kept_per_stage(tmp_path):
+    pdf = tmp_path / '10001.pdf'
+    pdf.write_bytes(b'%PDF-1.4')
+    with CrawlJournal(tmp_path / 'journal.sqlite') as journal:
+        journal.record_page('10001', {'aux': 1}, {'grant': 1}, tmp_path / '10001.html')
+        journal.record_failure('10001', 'pdf', ValueError('no PDF link'))
+        journal.record_failure('10002', 'page', ConnectionError('refused'))
+        assert journal.pending(['10001', '10002'], 'page') == ['10002']
+        assert journal.pending(['10001', '10002'], 'pdf') == ['10001', '10002']
+
+        # A later stage succeeding leaves the earlier stage's error alone
+        journal.record_parsed('10001', {'names': []}, parser_version='2')
+        row = journal.conn.execute(
+            'SELECT page_error, pdf_error, parse_error FROM crawl WHERE key = ?',
+            ('10001',)).fetchone()
+        assert row == (None, "ValueError('no PDF link')", None)
+
+        # Retrying the failed stage clears its error
+        journal.record_pdf('10001', pdf)
+        assert journal.conn.execute(
+            'SELECT pdf_status, pdf_error FROM crawl WHERE key = ?',
+            ('10001',)).fetchone() == ('done', None)
+
+
+def test_journals_with_one_error_column_are_migrated(tmp_path):
+    path = tmp_path / 'journal.sqlite'
+    conn = sqlite3.connect(str(path))
+    conn.execute('CREATE TABLE crawl (key TEXT PRIMARY KEY, page_status TEXT, page_path TEXT, '
+                 'aux TEXT, grant_info TEXT, pdf_status TEXT, pdf_path TEXT, pdf_sha256 TEXT, '
+                 'parse_status TEXT, parsed TEXT, error TEXT, updated_at REAL)')
+    conn.execute("INSERT INTO crawl (key, page_status, error) VALUES ('10001', 'failed', 'x')")
+    conn.commit()
+    conn.close()
+    with CrawlJournal(path) as journal:
+        journal.record_failure('10001', 'pdf', TimeoutError())
+        assert journal.pending(['10001'], 'page') == ['10001']
+        assert journal.conn.execute(
+            'SELECT pdf_error FROM crawl').fetchone() == ('TimeoutError()',)
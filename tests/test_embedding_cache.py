@@ -0,0 +1,40 @@
+import pytest
+
+numpy = pytest.importorskip('numpy')
+pytest.importorskip('loguru')
+
+from embedding_cache import EmbeddingCache
+
+
+class Embedder:
+    # Counts the documents it is asked to encode
+    def __init__(self):
+        self.encoded = 0
+
+    def encode(self, docs):
+        self.encoded += len(docs)
+        return numpy.array([[len(doc), doc.count('a')] for doc in docs], dtype=numpy.float32)
+
+
+def test_truncated_index_line_is_skipped(tmp_path):
+    embedder = Embedder()
+    cache = EmbeddingCache('model', tmp_path)
+    expected = cache.encode(embedder, ['alpha', 'beta'])
+    # A crash mid-append leaves half a line at the end of the index
+    with open(cache.index_path, 'a') as f:
+        f.write('{"shard": "shard_')
+
+    reloaded = EmbeddingCache('model', tmp_path)
+    assert len(reloaded) == 2
+    assert numpy.array_equal(reloaded.encode(embedder, ['alpha', 'beta']), expected)
+    assert embedder.encoded == 2
+
+
+def test_append_after_truncated_line_is_kept(tmp_path):
+    embedder = Embedder()
+    EmbeddingCache('model', tmp_path).encode(embedder, ['alpha'])
+    with open(tmp_path / 'model' / 'index.jsonl', 'a') as f:
+        f.write('{"shard": "shard_')
+
+    EmbeddingCache('model', tmp_path).encode(embedder, ['gamma'])
+    assert len(EmbeddingCache('model', tmp_path)) == 2
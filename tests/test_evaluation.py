@@ -0,0 +1,33 @@
+import math
+
+import pytest
+
+numpy = pytest.importorskip('numpy')
+pytest.importorskip('sklearn')
+pytest.importorskip('loguru')
+
+from sklearn.metrics import silhouette_score
+
+from evaluation import sampled_silhouette
+
+
+def blobs(n, seed=0):
+    rng = numpy.random.default_rng(seed)
+    labels = rng.integers(0, 4, size=n)
+    X = rng.normal(size=(n, 5)) + labels[:, None] * 3.0
+    return X, labels
+
+
+def test_small_sets_get_the_exact_score():
+    X, labels = blobs(300)
+    score, low, high = sampled_silhouette(X, labels, sample_size=300, random_state=0)
+    assert score == pytest.approx(silhouette_score(X, labels))
+    assert math.isnan(low) and math.isnan(high)
+
+
+def test_sampled_interval_brackets_the_score():
+    X, labels = blobs(3000)
+    score, low, high = sampled_silhouette(X, labels, sample_size=500, random_state=0)
+    assert low < score < high
+    assert score == pytest.approx(silhouette_score(X, labels), abs=0.05)
+    assert sampled_silhouette(X, labels, sample_size=500, random_state=0) == (score, low, high)
@@ -0,0 +1,143 @@
+import asyncio
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+
+import pytest
+
+httpx = pytest.importorskip('httpx')
+pytest.importorskip('lxml')
+
+from fetcher import AsyncFetcher, PdfFetchError, fetch_case_studies
+
+pages = Path(__file__).parent / 'fixtures' / 'pages'
+pdf_bytes = b'%PDF-1.4 fixture'
+
+
+class StandIn(BaseHTTPRequestHandler):
+    """Serves the fixture pages as /impact/<key> and their PDFs as
+    /impact/<key>/pdf. /flaky/<n> fails with 503 n times before succeeding,
+    /busy/<seconds> answers 503 with that Retry-After once."""
+
+    def do_GET(self):
+        server = self.server
+        with server.lock:
+            server.requests.append((self.path, time.monotonic()))
+            seen = sum(path == self.path for path, _ in server.requests)
+        parts = self.path.strip('/').split('/')
+        if parts[0] == 'impact' and len(parts) == 3 and parts[2] == 'pdf':
+            return self.reply(200, pdf_bytes, 'application/pdf')
+        if parts[0] == 'impact' and (pages / f'{parts[1]}.html').exists():
+            return self.reply(200, (pages / f'{parts[1]}.html').read_bytes(),
+                              'text/html; charset=utf-8')
+        if parts[0] == 'flaky' and seen <= int(parts[1]):
+            return self.reply(503, b'unavailable')
+        if parts[0] == 'busy' and seen == 1:
+            return self.reply(503, b'busy', headers={'Retry-After': parts[1]})
+        if parts[0] in ('flaky', 'busy', 'ok'):
+            return self.reply(200, b'ok')
+        self.reply(404, b'not found')
+
+    def reply(self, status, body, content_type='text/plain', headers=None):
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def server():
+    httpd = ThreadingHTTPServer(('127.0.0.1', 0), StandIn)
+    httpd.lock = threading.Lock()
+    httpd.requests = []
+    httpd.url = f'http://127.0.0.1:{httpd.server_address[1]}'
+    thread = threading.Thread(target=httpd.serve_forever, daemon=True)
+    thread.start()
+    yield httpd
+    httpd.shutdown()
+    httpd.server_close()
+
+
+async def get(url, **fetcher_kwargs):
+    async with AsyncFetcher(**fetcher_kwargs) as fetcher:
+        return await fetcher.get(url)
+
+
+def test_retries_server_errors(server):
+    response = asyncio.run(get(server.url + '/flaky/2', retries=3, backoff=0.01))
+    assert response.text == 'ok'
+    assert [path for path, _ in server.requests] == ['/flaky/2'] * 3
+
+
+def test_gives_up_after_retries(server):
+    with pytest.raises(httpx.HTTPStatusError):
+        asyncio.run(get(server.url + '/flaky/5', retries=1, backoff=0.01))
+    assert len(server.requests) == 2
+
+
+def test_honours_retry_after(server):
+    # The backoff alone would wait at least 30s, Retry-After asks for 1s
+    start = time.monotonic()
+    response = asyncio.run(get(server.url + '/busy/1', retries=1, backoff=30))
+    elapsed = time.monotonic() - start
+    assert response.text == 'ok'
+    assert 1 <= elapsed < 10
+
+
+def test_rate_limits_per_host(server):
+    async def get_all(urls):
+        async with AsyncFetcher(concurrency=8, rate_per_host=10) as fetcher:
+            return await asyncio.gather(*(fetcher.get(url) for url in urls))
+
+    asyncio.run(get_all([f'{server.url}/ok/{i}' for i in range(6)]))
+    starts = sorted(t for _, t in server.requests)
+    # 10 requests a second: 0.1s apart, less some slack for connection setup
+    assert starts[-1] - starts[0] >= 0.45
+    assert all(b - a >= 0.05 for a, b in zip(starts, starts[1:]))
+
+
+def test_fetches_fixture_pages_and_pdfs(server, tmp_path):
+    done = {}
+    results, failed = asyncio.run(fetch_case_studies(
+        ['10001', '10002'], server.url + '/impact/', tmp_path / 'pages', tmp_path / 'pdfs',
+        on_done=done.__setitem__, rate_per_host=0, backoff=0.01))
+    assert set(results) == {'10001'}
+    assert results['10001']['page'].read_text(encoding='utf-8') == \
+        (pages / '10001.html').read_text(encoding='utf-8')
+    assert results['10001']['pdf'] == tmp_path / 'pdfs' / '10001.pdf'
+    assert results['10001']['pdf'].read_bytes() == pdf_bytes
+    # The page without a PDF link is saved and only its PDF fails, for the
+    # Selenium fallback
+    assert isinstance(failed['10002'], PdfFetchError)
+    assert isinstance(failed['10002'].cause, ValueError)
+    assert failed['10002'].page == tmp_path / 'pages' / '10002.html'
+    assert failed['10002'].page.exists()
+    assert done == {'10001': results['10001'], '10002': failed['10002']}
+
+
+def test_page_only_keys_skip_the_pdf(server, tmp_path):
+    results, failed = asyncio.run(fetch_case_studies(
+        ['10001', '10002'], server.url + '/impact/', tmp_path / 'pages', tmp_path / 'pdfs',
+        pdf_keys=[], rate_per_host=0))
+    assert not failed
+    assert all(result['pdf'] is None for result in results.values())
+    assert not any(path.endswith('/pdf') for path, _ in server.requests)
+
+
+def test_on_done_errors_fail_only_their_key(server, tmp_path):
+    def on_done(key, result):
+        if key == '10001':
+            raise RuntimeError('journal locked')
+
+    results, failed = asyncio.run(fetch_case_studies(
+        ['10001', '10002'], server.url + '/impact/', tmp_path / 'pages', tmp_path / 'pdfs',
+        on_done=on_done, pdf_keys=[], rate_per_host=0))
+    assert set(results) == {'10002'}
+    assert isinstance(failed['10001'], RuntimeError)
@@ -0,0 +1,37 @@
+import pytest
+
+pytest.importorskip('numpy')
+pytest.importorskip('pandas')
+pytest.importorskip('loguru')
+pytest.importorskip('sklearn')
+
+from sklearn.feature_extraction.text import CountVectorizer
+
+from ngrams import ngram_frequencies
+
+
+corpus = [
+    "The impact of research on policy and the impact on practice",
+    "Policy makers used the research",
+    # Shorter than most orders, so it adds no n-grams across its boundary
+    "impact",
+    "a b",
+    "Research on research impact: the policy, the practice and the research",
+    "practice and policy and practice and policy",
+]
+
+
+def count_vectorizer_counts(n):
+    vectorizer = CountVectorizer(ngram_range=(n, n), analyzer='word')
+    counts = vectorizer.fit_transform(corpus).sum(axis=0).A1
+    return dict(zip(vectorizer.get_feature_names_out(), counts.tolist()))
+
+
+@pytest.mark.parametrize('run', [dict(n_jobs=1), dict(n_jobs=2, chunksize=1)],
+                         ids=['serial', 'chunked'])
+def test_matches_count_vectorizer(run):
+    frequencies = ngram_frequencies(corpus, range(1, 6), **run)
+    for n in range(1, 6):
+        df = frequencies[n]
+        assert df['frequency'].to_dict() == count_vectorizer_counts(n)
+        assert df['frequency'].is_monotonic_decreasing
@@ -0,0 +1,40 @@
+from pathlib import Path
+
+import pytest
+
+pytest.importorskip('lxml')
+
+from lxml import html as lxml_html
+
+from page_parsing import grant_table_rows, parse_amount, parse_impact_page, typed_grant_rows
+
+pages = Path(__file__).parent / 'fixtures' / 'pages'
+
+
+@pytest.mark.parametrize('text, expected', [
+    ('£1,250,000', (1250000.0, 'GBP')),
+    ('GBP 1.2m', (1200000.0, 'GBP')),
+    ('2.5 million USD', (2500000.0, 'USD')),
+    ('EUR 300k', (300000.0, 'EUR')),
+    # Funder acronyms are not currencies
+    ('NIH 500,000', (500000.0, None)),
+    ('MRC award of 75,000', (75000.0, None)),
+    ('To be confirmed', (None, None)),
+])
+def test_parse_amount(text, expected):
+    assert parse_amount(text) == expected
+
+
+def test_tables_without_a_header_row_keep_their_values():
+    table = lxml_html.fromstring(
+        '<table><tr><td>ESRC</td><td>ES/N01/1</td><td>£250,000</td></tr></table>')
+    assert typed_grant_rows(grant_table_rows(table)) == [
+        {'funder': 'ESRC', 'grant_number': 'ES/N01/1', 'amount': 250000.0, 'currency': 'GBP'}]
+
+
+def test_fixture_page():
+    parsed = parse_impact_page((pages / '10001.html').read_text(encoding='utf-8'))
+    assert parsed['aux']['Unit of assessment'] == 'Sociology'
+    assert parsed['grant'] == 'Funder Grant number Value of grant\nESRC ES/N01/1 £250,000'
+    assert parsed['grant_rows'] == [
+        {'funder': 'ESRC', 'grant_number': 'ES/N01/1', 'amount': 250000.0, 'currency': 'GBP'}]
@@ -0,0 +1,47 @@
+import re
+
+import pytest
+
+pytest.importorskip('fitz')
+
+from pdf_parsing import clean_line
+
+
+def original_clean(line):
+    # The re.sub chain read_pdf_and_perform_regex ran before clean_line
+    line = re.sub(r'\d{1}B', '', line)
+    line = re.sub(r'^Name.*', 'Name:', line)
+    line = re.sub(r'^Role.*', 'Role:', line)
+    line = re.sub(r'^Period.*undertaken', 'Start:', line)
+    line = re.sub(r'^Period when the claimed.*', 'End:', line)
+    line = re.sub(r'^Period.*', 'Period:', line)
+    return re.sub(r'\\s+', '', line)
+
+
+lines = [
+    "Period when the underpinning research was undertaken: 2000 - 2020",
+    "Period when the underpinning research was undertaken",
+    "Period when the claimed impact occurred: 2014 - 2020",
+    "Period(s) employed by",
+    "Period",
+    "Name(s):",
+    "Names of staff",
+    "Role(s) (e.g. job title):",
+    "1B. Details of staff",
+    "Professor 1B",
+    "11B2B",
+    "1BName(s):",
+    "2BPeriod when the claimed impact occurred",
+    r"A. Author\s",
+    r"\s\s\s",
+    r"Period\s when undertaken",
+    "submitting HEI:",
+    "1. Summary of the impact (indicative maximum 100 words)",
+    "Unit of Assessment: Physics",
+    "",
+]
+
+
+@pytest.mark.parametrize('line', lines)
+def test_clean_line_matches_the_re_sub_chain(line):
+    assert clean_line(line) == original_clean(line)
@@ -0,0 +1,40 @@
+import time
+
+import pytest
+
+from common.profiling import Profiler, current_rss_mb
+
+
+pytestmark = pytest.mark.skipif(current_rss_mb() is None, reason="RSS cannot be read here")
+
+
+def test_stage_memory_is_its_own():
+    profiler = Profiler("test", sample_interval=0.005)
+    with profiler.stage("allocate"):
+        block = bytearray(64 * 2 ** 20)
+        block[::4096] = b"x" * len(block[::4096])
+        time.sleep(0.05)
+    del block
+    with profiler.stage("idle"):
+        time.sleep(0.05)
+    allocate, idle = profiler.totals["allocate"], profiler.totals["idle"]
+    assert allocate["rss_increase_mb"] >= 60
+    # The earlier stage's high-water mark does not carry over
+    assert idle["rss_increase_mb"] < 10
+    assert idle["peak_rss_mb"] < allocate["peak_rss_mb"]
+    summary = profiler.summary()
+    assert summary["peak_rss_mb"] == allocate["peak_rss_mb"]
+    assert summary["allocate_peak_rss_mb"] == allocate["peak_rss_mb"]
+    assert summary["rss_increase_mb"] == allocate["rss_increase_mb"]
+
+
+def test_nested_stages_share_the_sampler():
+    profiler = Profiler("test", sample_interval=0.005)
+    with profiler.stage("outer"):
+        with profiler.stage("inner"):
+            block = bytearray(32 * 2 ** 20)
+            block[::4096] = b"x" * len(block[::4096])
+            time.sleep(0.03)
+        del block
+    assert profiler.totals["outer"]["peak_rss_mb"] >= profiler.totals["inner"]["peak_rss_mb"]
+    assert profiler._sampler.thread is None
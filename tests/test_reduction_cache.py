@@ -0,0 +1,23 @@
+import pickle
+
+import pytest
+
+pytest.importorskip('numpy')
+pytest.importorskip('loguru')
+
+from reduction_cache import CachedUMAP
+
+
+class Reducer:
+    # Picklable stand-in for a fitted UMAP
+    def __init__(self, n_neighbors):
+        self.n_neighbors = n_neighbors
+
+
+def test_fitted_cache_pickles_as_its_reducer(tmp_path):
+    umap_model = CachedUMAP('cpu', n_neighbors=7, cache_dir=tmp_path)
+    umap_model.fitted_hash_ = 'abc'
+    umap_model.model_ = Reducer(7)
+    loaded = pickle.loads(pickle.dumps({'umap_model': umap_model}))['umap_model']
+    assert type(loaded) is Reducer
+    assert loaded.n_neighbors == 7
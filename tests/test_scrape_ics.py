@@ -0,0 +1,24 @@
+import json
+
+import pytest
+
+pytest.importorskip('pandas')
+pytest.importorskip('httpx')
+pytest.importorskip('lxml')
+
+from scrape_ics import make_or_load_cw
+
+
+def test_named_pdfs_replace_old_cw_entries(tmp_path):
+    # An old crawl matched abc.pdf to 10001 by mtime; 10001 now also has
+    # 10001.pdf, and 10002 only has its old file
+    for name in ('abc.pdf', 'def.pdf', '10001.pdf'):
+        (tmp_path / name).write_bytes(b'%PDF-1.4')
+    with open(tmp_path / 'cw_pdf_key.jsonl', 'w') as f:
+        json.dump({'abc.pdf': '10001', 'def.pdf': '10002'}, f)
+
+    cw = make_or_load_cw(tmp_path, ['10001', '10002'])
+    assert cw == {'10001.pdf': '10001', 'def.pdf': '10002'}
+    assert sorted(cw.values()) == ['10001', '10002']
+    with open(tmp_path / 'cw_pdf_key.jsonl') as f:
+        assert json.load(f) == cw
@@ -0,0 +1,29 @@
+import sys
+import types
+
+import pytest
+
+numpy = pytest.importorskip('numpy')
+pandas = pytest.importorskip('pandas')
+pytest.importorskip('pyarrow')
+pytest.importorskip('loguru')
+
+import sweep
+
+
+def test_serial_sweep_skips_failing_configurations(tmp_path, monkeypatch):
+    def run_bert(df, docs, embedding_model, embeddings, target_dir, col_str,
+                 n_neighbors, min_cluster_size, **kwargs):
+        if min_cluster_size == 5:
+            raise ValueError('too few documents')
+        return {'model_name': f'nn{n_neighbors}_mcs{min_cluster_size}',
+                'n_neighbors': n_neighbors, 'columns': col_str,
+                'min_cluster_size': min_cluster_size}
+
+    monkeypatch.setitem(sys.modules, 'topic_modelling',
+                        types.SimpleNamespace(run_bert=run_bert))
+    df = pandas.DataFrame({'cleaned_full_text': ['a b', 'c d']})
+    sweep.run_sweep(tmp_path, [('columns1', df, numpy.zeros((2, 3), numpy.float32))],
+                    None, 'unused', nn_range=[2, 3], min_cluster_sizes=[5, 10])
+    meta = pandas.read_csv(tmp_path / 'metadata.csv')
+    assert sorted(meta['model_name']) == ['nn2_mcs10', 'nn3_mcs10']
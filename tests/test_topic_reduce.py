@@ -0,0 +1,66 @@
+import pytest
+
+numpy = pytest.importorskip('numpy')
+pytest.importorskip('pandas')
+pytest.importorskip('pyarrow')
+pytest.importorskip('loguru')
+
+from topic_reduce import reduce_outliers_by_thresholds, threshold_sweep
+
+
+topics = [-1, 0, -1, 1, -1, -1]
+probabilities = numpy.array([
+    [0.30, 0.30, 0.10],  # tie: the first topic wins, as with numpy.argmax
+    [0.90, 0.05, 0.05],
+    [0.05, 0.15, 0.05],
+    [0.10, 0.80, 0.10],
+    [0.00, 0.00, 0.00],
+    [0.10, 0.20, 0.55],
+])
+thresholds = [0.0, 0.1, 0.15, 0.2, 0.3, 0.5, 0.55, 0.6]
+
+
+def reduce_outliers_probabilities(topics, probabilities, threshold):
+    # BERTopic's reduce_outliers(strategy="probabilities"), one threshold
+    return [int(numpy.argmax(prob)) if numpy.max(prob) >= threshold and topic == -1
+            else topic for topic, prob in zip(topics, probabilities)]
+
+
+def test_matches_reduce_outliers_per_threshold():
+    assignments = reduce_outliers_by_thresholds(topics, probabilities, thresholds)
+    assert assignments.shape == (len(thresholds), len(topics))
+    for threshold, row in zip(thresholds, assignments):
+        assert row.tolist() == reduce_outliers_probabilities(topics, probabilities, threshold)
+
+
+class FakeTopicModel:
+    updates = []
+
+    def __init__(self):
+        self.topics_ = list(topics)
+        self.probabilities_ = probabilities
+        self.embedding_model = self.umap_model = self.hdbscan_model = None
+
+    def update_topics(self, docs, topics, representation_model=None):
+        FakeTopicModel.updates.append(list(topics))
+        self.topics_ = list(topics)
+
+    def get_topic(self, topic_id):
+        return [(f"term{topic_id}", 1.0)]
+
+    def save(self, path):
+        pass
+
+
+def test_sweep_only_updates_where_the_assignment_changes():
+    FakeTopicModel.updates = []
+    docs = [f"doc {i}" for i in range(len(topics))]
+    assignments, terms_rows = threshold_sweep(FakeTopicModel(), docs, thresholds, None)
+    distinct = [row.tolist() for i, row in enumerate(assignments)
+                if i == 0 or (row != assignments[i - 1]).any()]
+    assert FakeTopicModel.updates == distinct
+    assert len(distinct) < len(thresholds)
+    # Every threshold still gets terms for each of its topics
+    for threshold, row in zip(thresholds, assignments):
+        assert sorted(topic for t, topic, _ in terms_rows if t == threshold) == \
+            sorted(set(row.tolist()))